@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Async wrappers around the Descope helpers in auth_setup, so identity calls never block the MCP event loop
+"""
+
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import auth_setup
+from metrics import AUTH_CALLS, AUTH_SECONDS
+
+class AsyncAuth:
+    """Runs the blocking auth_setup calls on a small thread pool.
+
+    At most `max_concurrency` identity calls are in flight at once; the rest
+    wait their turn without holding up searches. Each call, including the time
+    spent waiting for a slot, gives up after `timeout_seconds` with
+    asyncio.TimeoutError; the slot stays taken until its thread has finished. Anything already verified or cached in memory is
+    answered straight away without touching the pool.
+    """
+
+    def __init__(self, max_concurrency=8, timeout_seconds=5.0):
+        self.max_concurrency = max_concurrency
+        self.timeout_seconds = timeout_seconds
+        self.timeouts = 0
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="descope")
+        self._slots = None
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            max_concurrency=int(os.getenv("AUTH_MAX_CONCURRENCY", "8")),
+            timeout_seconds=float(os.getenv("AUTH_TIMEOUT_SECONDS", "5"))
+        )
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+    async def verify_session_token(self, session_token):
+        user_info = auth_setup.cached_session_user(session_token)
+        if user_info is not None:
+            AUTH_CALLS.inc("verify_session", "cached")
+            return user_info
+        return await self._call("verify_session", auth_setup.verify_session_token, session_token)
+
+    async def get_user_interests(self, user_id):
+        interests = auth_setup.cached_user_interests(user_id)
+        if interests is not None:
+            AUTH_CALLS.inc("get_interests", "cached")
+            return interests
+        return await self._call("get_interests", auth_setup.get_user_interests, user_id)
+
+    async def save_user_interests(self, user_id, interests, location=None):
+        # Only queues the write, but the first call may still have to set up the Descope client
+        return await self._call("save_interests", auth_setup.save_user_interests, user_id, interests, location)
+
+    async def _call(self, operation, function, *args):
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        deadline = started + self.timeout_seconds
+        outcome = "error"
+        if self._slots is None:
+            # Created lazily so it belongs to the loop the server actually runs on
+            self._slots = asyncio.Semaphore(self.max_concurrency)
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.timeout_seconds)
+            try:
+                future = loop.run_in_executor(self._executor, function, *args)
+            except BaseException:
+                self._slots.release()
+                raise
+            # The slot is held until the thread is done, not just until we stop waiting,
+            # so calls that time out still count against max_concurrency
+            future.add_done_callback(lambda _: self._slots.release())
+            result = await asyncio.wait_for(asyncio.shield(future), max(deadline - loop.time(), 0.001))
+            outcome = "ok"
+            return result
+        except asyncio.TimeoutError:
+            # The worker thread finishes on its own; we just stop waiting for it
+            self.timeouts += 1
+            outcome = "timeout"
+            raise
+        finally:
+            AUTH_CALLS.inc(operation, outcome)
+            AUTH_SECONDS.observe(loop.time() - started, operation)
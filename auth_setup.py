@@ -1,13 +1,46 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
+import atexit
 import os
+import sys
+import jwt
 from descope import DescopeClient, AuthException
 from flask import session, redirect, url_for, request, jsonify
 from functools import wraps
 
+from interest_store import DescopeUserBackend, UserInterestStore
+from metrics import REGISTRY, descope_request
+from token_verifier import TokenVerifier
+
 # Initialize Descope client
 descope_client = None
 
+# Checks session tokens locally against Descope's signing keys
+token_verifier = None
+
+# Caches users' interests and batches the writes back to Descope
+interest_store = None
+
+# Roles (project or tenant) allowed to add, change and retire opportunities
+EDITOR_ROLES = frozenset(role.strip() for role in os.getenv("CATALOG_EDITOR_ROLES", "admin,editor").split(",") if role.strip())
+
+# Roles allowed to read the metrics and turn profiling on
+ADMIN_ROLES = frozenset(role.strip() for role in os.getenv("ADMIN_ROLES", "admin").split(",") if role.strip())
+
+# OPERATOR_TOOLS=1 opens get_metrics and set_profiling to any caller, for servers only the operator can reach
+# (the web UI's own pool, for one); everywhere else they need an admin's session token
+OPERATOR_TOOLS_OPEN = os.getenv("OPERATOR_TOOLS") == "1"
+
+# Input schema for the token the operator tools take
+ADMIN_TOKEN_SCHEMA = {
+    "type": "string",
+    "description": "Descope session token of a user with an admin role (not needed when the server runs with OPERATOR_TOOLS=1)"
+}
+
+# Read when the metrics are rendered, so they follow whichever verifier and store are current
+REGISTRY.watch_cache("auth", "verified_tokens", lambda: token_verifier and token_verifier.verified.stats())
+REGISTRY.watch_cache("auth", "user_interests", lambda: interest_store and interest_store.cache.stats())
+
 def setup_descope():
     """Initialize Descope client with project credentials"""
     global descope_client
@@ -19,70 +52,134 @@ def setup_descope():
     
     try:
         descope_client = DescopeClient(project_id=project_id, management_key=management_key)
-        print("Descope client initialized successfully")
+        print("Descope client initialized successfully", file=sys.stderr)
         return True
     except Exception as e:
-        print("Failed to initialize Descope client: " + str(e))
+        print("Failed to initialize Descope client: " + str(e), file=sys.stderr)
         return False
 
+def get_token_verifier():
+    """Create the local session-token verifier on first use"""
+    global token_verifier
+    if token_verifier is None:
+        project_id = os.getenv("DESCOPE_PROJECT_ID")
+        if not project_id:
+            raise ValueError("DESCOPE_PROJECT_ID environment variable is required")
+        token_verifier = TokenVerifier(project_id)
+    return token_verifier
+
 def verify_session_token(session_token):
     """Verify a Descope session token and return user info"""
+    try:
+        # Checked locally against cached signing keys, so there's no round trip to Descope
+        jwt_response = get_token_verifier().verify(session_token)
+    except jwt.InvalidTokenError as e:
+        print("Session verification failed: " + str(e), file=sys.stderr)
+        return None
+    except Exception as e:
+        # We couldn't get the signing keys; let Descope check the token instead
+        print("Local token verification unavailable: " + str(e), file=sys.stderr)
+        jwt_response = validate_session_remotely(session_token)
+    
+    return user_info_from_claims(jwt_response)
+
+def user_info_from_claims(jwt_response):
+    """The bits of a verified session token we hand to the tools"""
+    if jwt_response and jwt_response.get("sub"):
+        roles = set(jwt_response.get("roles") or [])
+        for tenant in (jwt_response.get("tenants") or {}).values():
+            roles.update(tenant.get("roles") or [])
+        return {
+            "user_id": jwt_response["sub"],
+            "email": jwt_response.get("email", ""),
+            "name": jwt_response.get("name", ""),
+            "roles": sorted(roles)
+        }
+    return None
+
+def has_role(user_info, roles):
+    """Whether a verified user holds any of roles"""
+    return bool(user_info) and not set(roles).isdisjoint(user_info.get("roles", []))
+
+def cached_session_user(session_token):
+    """User info for a session token we've already verified, without any I/O (None if we haven't)"""
+    if token_verifier is None:
+        return None
+    return user_info_from_claims(token_verifier.cached(session_token))
+
+def cached_user_interests(user_id):
+    """A user's interests if they're already in memory, without calling Descope (None if not)"""
+    if interest_store is None:
+        return None
+    attributes = interest_store.peek(user_id)
+    return None if attributes is None else attributes.get("interests", [])
+
+def validate_session_remotely(session_token):
+    """Ask Descope to validate a session token"""
     if not descope_client:
         if not setup_descope():
             return None
     
     try:
-        # Verify the session token
-        jwt_response = descope_client.validate_session(session_token=session_token)
-        if jwt_response and jwt_response.get("sub"):
-            return {
-                "user_id": jwt_response["sub"],
-                "email": jwt_response.get("email", ""),
-                "name": jwt_response.get("name", "")
-            }
+        with descope_request("validate_session"):
+            return descope_client.validate_session(session_token=session_token)
     except AuthException as e:
-        print("Session verification failed: " + str(e))
+        print("Session verification failed: " + str(e), file=sys.stderr)
     
     return None
 
+def get_interest_store():
+    """Create the cached, write-behind interest store on first use"""
+    global interest_store
+    if interest_store is None:
+        if not descope_client:
+            if not setup_descope():
+                return None
+        interest_store = UserInterestStore(
+            DescopeUserBackend(descope_client),
+            ttl_seconds=float(os.getenv("INTEREST_CACHE_TTL_SECONDS", "300")),
+            flush_interval=float(os.getenv("INTEREST_FLUSH_SECONDS", "2"))
+        )
+        # Queued writes must reach Descope even when the process is shutting down
+        atexit.register(interest_store.close)
+    return interest_store
+
 def get_user_interests(user_id):
     """Get user interests from Descope user data"""
-    if not descope_client:
-        if not setup_descope():
-            return []
+    store = get_interest_store()
+    if store is None:
+        return []
     
     try:
-        # Get user details from Descope
-        user = descope_client.management.user.load(user_id)
-        if user and user.get("customAttributes"):
-            custom_attrs = user.get("customAttributes", {})
-            return custom_attrs.get("interests", [])
+        return store.get(user_id).get("interests", [])
     except Exception as e:
-        print("Failed to get user interests: " + str(e))
+        print("Failed to get user interests: " + str(e), file=sys.stderr)
     
     return []
 
 def save_user_interests(user_id, interests, location=None):
-    """Save user interests to Descope user data"""
-    if not descope_client:
-        if not setup_descope():
-            return False
+    """Save user interests to Descope user data (written in the background, latest save wins)"""
+    store = get_interest_store()
+    if store is None:
+        return False
+    
+    # Prepare custom attributes
+    custom_attributes = {"interests": interests}
+    if location:
+        custom_attributes["location"] = location
     
     try:
-        # Prepare custom attributes
-        custom_attributes = {"interests": interests}
-        if location:
-            custom_attributes["location"] = location
-        
-        # Update user in Descope
-        descope_client.management.user.update(
-            user_id=user_id,
-            custom_attributes=custom_attributes
-        )
-        return True
-    except Exception as e:
-        print("Failed to save user interests: " + str(e))
+        store.save(user_id, custom_attributes)
+    except RuntimeError as e:
+        # Shutting down: the store has been closed and won't write anything more
+        print("Failed to save user interests: " + str(e), file=sys.stderr)
         return False
+    return True
+
+def flush_user_interests():
+    """Write any queued interest updates to Descope right now"""
+    if interest_store is not None:
+        interest_store.close()
 
 def login_required(f):
     """Decorator to require authentication for routes"""
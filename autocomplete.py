@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Typeahead suggestions for the location and organization boxes, looked up by prefix
+"""
+
+import os
+import threading
+from collections import defaultdict
+from bisect import bisect_left
+from functools import lru_cache
+from typing import NamedTuple
+
+import numpy as np
+
+from gazetteer import normalize
+
+KINDS = ("location", "organization")
+
+# Sorts after every character normalize() leaves in, so [prefix, prefix + END) is everything starting with prefix
+END = "\x7f"
+
+MAX_SUGGESTIONS = 20
+
+# Prefixes matching more keys than this ("s") keep their ranking and update it as counts change.
+# The broadest are ranked when the table is built.
+CACHED_RANGE = 2048
+
+# Ranges up to this many keys are ranked in plain Python
+SMALL_RANGE = 64
+
+class Suggestion(NamedTuple):
+    text: str
+    kind: str  # location or organization
+    count: int  # opportunities a search for it would find
+
+class _Ranking:
+    """A broad prefix's best MAX_SUGGESTIONS name numbers, and a ceiling on every other name's count"""
+
+    def __init__(self, numbers, ceiling):
+        self.numbers = numbers
+        self.ceiling = ceiling
+
+    def moved(self, number, counts):
+        """Take one name's new count into account; False if only a fresh ranking can tell where it goes now"""
+        count = int(counts[number])
+        if number in self.numbers:
+            self.numbers.remove(number)
+            # A name still above everyone outside keeps its place; with nobody outside, one at 0 just drops out
+            if count <= self.ceiling and not (count == 0 and self.ceiling == 0):
+                return False
+            if count == 0:
+                return True
+        elif count == 0:
+            return True
+        self.numbers.append(number)
+        self.numbers.sort(key=lambda n: (-counts[n], n))
+        if len(self.numbers) > MAX_SUGGESTIONS:
+            self.ceiling = max(self.ceiling, int(counts[self.numbers.pop()]))
+        return True
+
+class _PrefixTable:
+    """The names of one kind, filed under the start of each of their words in one sorted list"""
+
+    def __init__(self):
+        self.numbers = {}  # name -> name number (names loaded together are numbered alphabetically)
+        self.names = []  # name number -> name as shown
+        self.counts = np.zeros(0, dtype=np.int64)  # name number -> opportunities
+        self.keys = []  # sorted normalized keys
+        self.owners = np.zeros(0, dtype=np.int64)  # key -> name number, in key order
+        self.cached = {}  # prefix -> _Ranking, for prefixes too broad to rank per keystroke
+
+    def fill(self, counts, spellings):
+        """Build the table in one go from {name: count} and {name: [text to file it under, ...]}"""
+        self.names = sorted(counts)
+        self.numbers = {name: number for number, name in enumerate(self.names)}
+        self.counts = np.fromiter((counts[name] for name in self.names), dtype=np.int64, count=len(counts))
+        filed = sorted(
+            (key, number) for number, name in enumerate(self.names) for key in _keys(spellings[name])
+        )
+        self.keys = [key for key, _ in filed]
+        self.owners = np.fromiter((number for _, number in filed), dtype=np.int64, count=len(filed))
+        self.cached = {}
+        for prefix in self._broad_prefixes():
+            self.top(prefix, MAX_SUGGESTIONS)
+
+    def _broad_prefixes(self):
+        """Every prefix matching more than 2 * CACHED_RANGE keys (narrower ones are quick to rank when asked)"""
+        broad = {""}
+        # Keys CACHED_RANGE apart share the prefixes of every range they both sit in
+        for i in range(0, len(self.keys) - CACHED_RANGE, CACHED_RANGE):
+            common = os.path.commonprefix([self.keys[i], self.keys[i + CACHED_RANGE]])
+            broad.update(common[:end] for end in range(len(common) + 1))
+        return broad
+
+    def add(self, name, delta, spellings):
+        """Change a name's count, filing it under spellings if it's new"""
+        number = self.numbers.get(name)
+        if number is None and delta <= 0:
+            return
+        keys = _keys(spellings)
+        if number is None:
+            number = self.numbers[name] = len(self.names)
+            self.names.append(name)
+            self.counts = np.append(self.counts, 0)
+            for key in keys:
+                at = bisect_left(self.keys, key)
+                self.keys.insert(at, key)
+                self.owners = np.insert(self.owners, at, number)
+        count = max(0, int(self.counts[number]) + delta)
+        if count == self.counts[number]:
+            return
+        self.counts[number] = count
+        # Only the prefixes of this name's keys rank it
+        for prefix in {key[:end] for key in keys for end in range(len(key) + 1)}:
+            ranking = self.cached.get(prefix)
+            if ranking is not None and not ranking.moved(number, self.counts):
+                del self.cached[prefix]
+
+    def top(self, prefix, limit):
+        """[(name, count), ...] for the limit (at most MAX_SUGGESTIONS) best names with a key starting with prefix"""
+        low = bisect_left(self.keys, prefix)
+        high = bisect_left(self.keys, prefix + END, low)
+        if high - low <= CACHED_RANGE:
+            numbers, _ = self._rank(low, high, limit)
+        else:
+            ranking = self.cached.get(prefix)
+            if ranking is None:
+                ranking = self.cached[prefix] = _Ranking(*self._rank(low, high, MAX_SUGGESTIONS))
+            numbers = ranking.numbers[:limit]
+        return [(self.names[number], int(self.counts[number])) for number in numbers]
+
+    def _rank(self, low, high, limit):
+        """(best limit name numbers, count of the next best) for the names filed in keys[low:high].
+
+        Most opportunities first, then the name we've known longest. Names
+        nobody has any more (count 0) are left out.
+        """
+        owners = self.owners[low:high]
+        counts = self.counts[owners]
+        if len(owners) <= SMALL_RANGE:
+            # Quicker without numpy's per-call overhead
+            ranked = sorted({(-count, number) for number, count in zip(owners.tolist(), counts.tolist()) if count})
+            ceiling = -ranked[limit][0] if len(ranked) > limit else 0
+            return [number for _, number in ranked[:limit]], ceiling
+        owners, counts = owners[counts > 0], counts[counts > 0]
+        if not len(owners) or not limit:
+            return [], 0
+        # A name can be in the range more than once ("shelter shelter society" under both words),
+        # so a cut-off that lets enough entries through may not let enough names through: widen until it does
+        want = limit + 1
+        while True:
+            want = min(want, len(owners))
+            threshold = counts[np.argpartition(-counts, want - 1)[want - 1]]
+            above = np.unique(owners[counts > threshold])
+            tied = _smallest_distinct(owners[counts == threshold], limit + 1 - len(above))
+            chosen = np.concatenate([above, tied])
+            if len(chosen) > limit or want == len(owners):
+                break
+            want *= 4
+        chosen = chosen[np.lexsort((chosen, -self.counts[chosen]))]
+        ceiling = int(self.counts[chosen[limit]]) if len(chosen) > limit else 0
+        return chosen[:limit].tolist(), ceiling
+
+def _keys(spellings):
+    # "Santa Monica Beach" is found from "santa", "monica" and "beach"
+    keys = set()
+    for spelling in spellings:
+        words = normalize(spelling).split()
+        keys.update(" ".join(words[start:]) for start in range(len(words)))
+    return keys
+
+def _smallest_distinct(values, k):
+    """The k smallest distinct values, without sorting them all"""
+    if k <= 0:
+        return values[:0]
+    take = min(len(values), k)
+    while True:
+        picked = np.unique(np.partition(values, take - 1)[:take] if take < len(values) else values)
+        if len(picked) >= k or take == len(values):
+            return picked[:k]
+        take = min(len(values), take * 4)
+
+class Autocomplete:
+    """Suggests places and organizations from the catalog as someone types, most opportunities first.
+
+    Each kind keeps its names in a sorted list of keys, one per word a name
+    can be found from ("santa monica beach", "monica beach", "beach"), so a
+    prefix is two bisects away. The names in that range are ranked by their
+    counts with numpy, without visiting each one in Python, and the broadest
+    prefixes ("s") keep their ranking and just move the names whose count
+    changed. Places count every
+    opportunity in them or anywhere inside them, just as a location search
+    does, and can be found by any alias the gazetteer knows ("nyc"). Locations
+    the gazetteer doesn't know are suggested as they're written. The tables
+    are built once, when the catalog loads, and follow its changes after that.
+    """
+
+    def __init__(self, catalog):
+        self.catalog = catalog
+        self.gazetteer = catalog.gazetteer
+        # The same few location texts come up over and over
+        self._resolve = lru_cache(maxsize=4096)(self.gazetteer.resolve)
+        self._tables = {kind: _PrefixTable() for kind in KINDS}
+        self._lock = threading.Lock()
+        with self._lock:
+            catalog.subscribe(self.on_catalog_change)
+            self._load(catalog.snapshot())
+
+    def suggest(self, prefix, kinds=KINDS, limit=8):
+        """[Suggestion, ...] for names starting (at any word) with prefix, best first"""
+        prefix = normalize(prefix or "")
+        limit = max(0, min(int(limit), MAX_SUGGESTIONS))
+        found = []
+        with self._lock:
+            for kind in kinds:
+                if kind not in self._tables:
+                    raise ValueError(f"Can't suggest '{kind}', only {', '.join(KINDS)}")
+                found.extend(Suggestion(name, kind, count) for name, count in self._tables[kind].top(prefix, limit))
+        found.sort(key=lambda suggestion: -suggestion.count)
+        return found[:limit]
+
+    def on_catalog_change(self, previous, current):
+        """Catalog listener: move the changed opportunity's counts from its old names to its new ones"""
+        deltas = defaultdict(int)
+        for opportunity, delta in ((previous, -1), (current, 1)):
+            if opportunity is not None:
+                for kind_and_name in self._names(opportunity.organization, opportunity.location):
+                    deltas[kind_and_name] += delta
+        with self._lock:
+            # Most updates keep their organization and place, and those cancel out here
+            for (kind, name), delta in deltas.items():
+                if delta:
+                    self._tables[kind].add(name, delta, self._spellings(kind, name))
+
+    def _load(self, snapshot):
+        # Counted per distinct value, so a big catalog doesn't have to hand over every row
+        counts = {kind: defaultdict(int) for kind in KINDS}
+        for organization, count in snapshot.value_counts("organization").items():
+            for kind, name in self._names(organization, None):
+                counts[kind][name] += count
+        for location, count in snapshot.value_counts("location").items():
+            for kind, name in self._names(None, location):
+                counts[kind][name] += count
+        for kind, table in self._tables.items():
+            table.fill(counts[kind], {name: self._spellings(kind, name) for name in counts[kind]})
+
+    def _names(self, organization, location):
+        """(kind, name) for every suggestion an opportunity with this organization and location counts towards"""
+        organization = (organization or "").strip()
+        if organization:
+            yield "organization", organization
+        location = (location or "").strip()
+        if not location:
+            return
+        place_id = self._resolve(location)
+        if place_id is None:
+            yield "location", location
+            return
+        # An opportunity in Santa Monica is in Los Angeles and California too
+        for place in self.gazetteer.lineage(place_id):
+            yield "location", self.gazetteer.name(place)
+
+    def _spellings(self, kind, name):
+        """What a name can be typed as: a place's aliases as well as its name"""
+        if kind == "location":
+            place_id = self.gazetteer.aliases.get(normalize(name))
+            if place_id is not None and self.gazetteer.name(place_id) == name:
+                return (name,) + tuple(self.gazetteer.places[place_id].aliases)
+        return (name,)
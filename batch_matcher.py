@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Vectorized matching of many user profiles against the whole catalog in one pass
+"""
+
+from datetime import date
+
+import numpy as np
+
+from catalog_index import CATEGORY_BITS, Match
+from data_models import UserInterests
+from geo_index import EARTH_RADIUS_KM
+from ranking import parse_date_ordinal
+from schedule import availability_windows
+
+CATEGORIES = list(CATEGORY_BITS)
+
+# Cap on users x opportunities scores held in memory at once (float64, so ~128 MB)
+MAX_CHUNK_CELLS = 16_000_000
+
+class BatchMatcher:
+    """Finds the top opportunities for thousands of profiles with matrix maths instead of one search each.
+
+    The catalog is turned into arrays once per catalog snapshot: an
+    opportunities x causes 0/1 matrix, event day numbers and coordinates.
+    A batch of profiles becomes a users x causes matrix, and one matrix
+    product gives every user's shared-cause count for every opportunity.
+    Location, proximity and date terms are added as masks and vectors, and
+    np.argpartition picks each user's top k. Scores and tie-breaking match
+    OpportunityCatalog.find for the same interests and location.
+    """
+
+    def __init__(self, catalog):
+        self.catalog = catalog
+        self.snapshot = None  # the catalog snapshot the arrays were built from
+
+    def match(self, profiles, max_results=5, date_from=None, date_to=None, today=None):
+        """Return {user_id: [Match, ...]} for each profile, best first.
+
+        profiles are UserInterests (or dicts of the same shape). A profile's
+        availability ("Saturday mornings", "2023-10-20") limits that user to
+        events happening while they're free; date_from/date_to limit everyone.
+        """
+        profiles = [
+            profile if isinstance(profile, UserInterests) else UserInterests.model_validate(profile)
+            for profile in profiles
+        ]
+        self._build()
+        results = {}
+        if not profiles:
+            return results
+        if not len(self.positions):
+            return {profile.user_id: [] for profile in profiles}
+
+        base = self._recency(today) + self._date_window(date_from, date_to)
+        chunk_size = max(1, MAX_CHUNK_CELLS // len(self.positions))
+        free = {}  # availability -> which columns fit it, shared by users who gave the same answer
+        for start in range(0, len(profiles), chunk_size):
+            chunk = profiles[start:start + chunk_size]
+            scores = self._score_chunk(chunk, base, today, free)
+            for profile, row in zip(chunk, scores):
+                results[profile.user_id] = self._top(row, max_results)
+        return results
+
+    def _build(self):
+        """(Re)build the catalog arrays if the catalog changed since last time"""
+        catalog = self.catalog.snapshot()
+        if catalog is self.snapshot:
+            return
+        # Any snapshot can hand over its rows as arrays (a mapped one already stores them that way)
+        columns = catalog.columns()
+        self.positions = columns["positions"]
+        bits = np.array(list(CATEGORY_BITS.values()), dtype=np.int64)
+        self.categories = ((columns["masks"].astype(np.int64)[:, None] & bits) != 0).astype(np.float64)
+        self.dates = columns["days"]
+        self.latitudes = columns["latitudes"]
+        self.longitudes = columns["longitudes"]
+        self._place_masks = {}
+        self.snapshot = catalog
+
+    def _recency(self, today):
+        """The 'happening soon' bonus for every opportunity (the same for every user)"""
+        weights = self.snapshot.weights
+        today = (today or date.today()).toordinal()
+        days_ahead = self.dates - today
+        upcoming = (self.dates >= 0) & (days_ahead >= 0)
+        bonus = np.zeros(len(self.dates))
+        bonus[upcoming] = weights.recency / (1 + days_ahead[upcoming] / weights.recency_scale_days)
+        return bonus
+
+    def _date_window(self, date_from, date_to):
+        """0 for opportunities inside the window, -inf for the rest (undated ones only pass with no window)"""
+        penalty = np.zeros(len(self.dates))
+        if date_from or date_to:
+            low = parse_date_ordinal(date_from) if date_from else None
+            high = parse_date_ordinal(date_to) if date_to else None
+            outside = self.dates < 0
+            if low is not None:
+                outside |= self.dates < low
+            if high is not None:
+                outside |= self.dates > high
+            penalty[outside] = -np.inf
+        return penalty
+
+    def _score_chunk(self, profiles, base, today, free):
+        weights = self.snapshot.weights
+        wanted = np.zeros((len(profiles), len(CATEGORIES)), dtype=np.float64)
+        columns = {category: column for column, category in enumerate(CATEGORIES)}
+        for row, profile in enumerate(profiles):
+            for interest in profile.interests:
+                wanted[row, columns[interest.value]] = 1.0
+
+        shared = wanted @ self.categories.T
+        scores = weights.interests * shared + base
+        # Only opportunities sharing at least one cause are matches at all
+        scores[shared == 0] = -np.inf
+
+        # Users asking about the same place share one location mask and proximity vector
+        by_location = {}
+        for row, profile in enumerate(profiles):
+            if profile.location:
+                by_location.setdefault(profile.location.lower(), []).append(row)
+        for needle, rows in by_location.items():
+            inside, proximity = self._place_terms(needle)
+            rows = np.array(rows)
+            scores[rows] += proximity
+            scores[np.ix_(rows, ~inside)] = -np.inf
+
+        for row, profile in enumerate(profiles):
+            fits = self._available(profile.availability, today, free)
+            if fits is not None:
+                scores[row, ~fits] = -np.inf
+        return scores
+
+    def _place_terms(self, needle):
+        """Which opportunities are inside a location, and their closeness bonus to its centre"""
+        terms = self._place_masks.get(needle)
+        if terms is not None:
+            return terms
+        catalog = self.snapshot
+        place_id = catalog.gazetteer.resolve(needle)
+        inside = catalog.location_mask(needle, self.positions)
+
+        proximity = np.zeros(len(self.positions))
+        origin = catalog.gazetteer.center(place_id) if place_id else None
+        if origin is not None:
+            distance = haversine_km_array(origin[0], origin[1], self.latitudes, self.longitudes)
+            known = ~np.isnan(distance)
+            weights = catalog.weights
+            proximity[known] = weights.proximity / (1 + distance[known] / weights.proximity_scale_km)
+
+        terms = self._place_masks[needle] = (inside, proximity)
+        return terms
+
+    def _available(self, availability, today, free):
+        """Which opportunities happen while the user is free, or None if that doesn't narrow anything"""
+        if not availability:
+            return None
+        key = tuple(availability)
+        if key not in free:
+            windows = availability_windows(availability, today)
+            if windows is None:
+                free[key] = None
+            else:
+                free[key] = self.snapshot.happening_during(windows, self.positions)
+        return free[key]
+
+    def _top(self, row, k):
+        """The k best columns of one user's scores, ties going to the earlier catalog position"""
+        eligible = int(np.count_nonzero(row > -np.inf))
+        k = min(k or eligible, eligible)
+        if not k:
+            return []
+        if k < len(row):
+            threshold = row[np.argpartition(-row, k - 1)[k - 1]]
+            # Everything strictly better, then the earliest of the ties at the cut-off
+            above = np.flatnonzero(row > threshold)
+            tied = np.flatnonzero(row == threshold)[:k - len(above)]
+            picked = np.concatenate([above, tied])
+        else:
+            picked = np.flatnonzero(row > -np.inf)
+        picked = picked[np.lexsort((picked, -row[picked]))]
+
+        rows = self.snapshot.rows
+        return [Match(rows[int(self.positions[i])], float(row[i])) for i in picked]
+
+def haversine_km_array(lat, lon, latitudes, longitudes):
+    """Great-circle distances from one point to arrays of points (nan where a point is unknown)"""
+    lat1, lon1 = np.radians(lat), np.radians(lon)
+    lat2, lon2 = np.radians(latitudes), np.radians(longitudes)
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
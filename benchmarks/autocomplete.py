@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Per-keystroke latency of the location and organization typeahead
+
+Usage: python benchmarks/autocomplete.py [--rows 100000] [--words 500] [--seed 1]
+
+Types the first letters of real organizations and locations from the
+catalog one keystroke at a time, like someone filling in the search form,
+then does the same again after an edit to see what a change costs.
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from autocomplete import Autocomplete
+from catalog_index import OpportunityCatalog
+from generators import make_catalog
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+def keystrokes(autocomplete, prefixes):
+    latencies = []
+    for prefix in prefixes:
+        started = time.perf_counter()
+        autocomplete.suggest(prefix)
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--words", type=int, default=500, help="names to type out")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    catalog = OpportunityCatalog(make_catalog(args.rows, args.seed))
+    started = time.perf_counter()
+    autocomplete = Autocomplete(catalog)
+    print(f"rows: {args.rows}, build {time.perf_counter() - started:.2f} s")
+
+    rng = random.Random(args.seed)
+    opportunities = list(catalog)
+    prefixes = []
+    for opportunity in rng.sample(opportunities, min(args.words, len(opportunities))):
+        name = rng.choice([opportunity.organization, opportunity.location])
+        prefixes.extend(name[:end] for end in range(1, min(len(name), 10) + 1))
+
+    def report(label, latencies):
+        print(f"  {label:<12} {len(latencies):6} keystrokes   p50 {statistics.median(latencies) * 1e6:7.1f} us   "
+              f"p99 {percentile(latencies, 0.99) * 1e6:7.1f} us   max {max(latencies) * 1e6:7.1f} us")
+
+    report("steady", keystrokes(autocomplete, prefixes))
+
+    # A change makes the prefixes of the names it touches rank again the next time they're typed
+    edited = rng.choice(opportunities)
+    started = time.perf_counter()
+    catalog.upsert(edited.model_copy(update={"organization": "Brand New Friends Society"}))
+    print(f"  edit         {(time.perf_counter() - started) * 1000:.1f} ms (catalog and typeahead)")
+    report("after edit", keystrokes(autocomplete, prefixes))
+
+if __name__ == "__main__":
+    main()
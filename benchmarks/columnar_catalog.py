@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Memory per row and search speed of the columnar catalog against plain dicts and the model-per-row catalog
+
+Usage: python benchmarks/columnar_catalog.py [--rows 100000] [--queries 200] [--seed 1]
+
+"dicts" is the catalog as a list of dicts, searched with a loop over every
+row (how the servers started out). "objects" is OpportunityCatalog, with one
+VolunteerOpportunity per row plus its indexes. "columnar" is
+ColumnarCatalog. Memory is what tracemalloc sees allocated once each is built.
+"""
+
+import argparse
+import heapq
+import os
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from catalog_index import OpportunityCatalog
+from columnar_catalog import ColumnarCatalog
+from generators import CATEGORIES, KNOWN_PLACES, make_catalog
+
+def scan_dicts(rows, interests, location, k):
+    """Score every row: shared causes, narrowed to rows mentioning location"""
+    wanted = set(interests)
+    needle = location.lower() if location else None
+    scored = []
+    for position, row in enumerate(rows):
+        shared = len(wanted.intersection(row["categories"]))
+        if shared and (needle is None or needle in row["location"].lower()):
+            scored.append((shared, -position, row))
+    return [row for _, _, row in heapq.nlargest(k, scored, key=lambda entry: entry[:2])]
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    queries = [
+        (rng.sample(CATEGORIES, rng.randint(1, 3)), rng.choice(KNOWN_PLACES).name if rng.random() < 0.7 else None)
+        for _ in range(args.queries)
+    ]
+    today = date(2026, 3, 1)
+    layouts = {
+        "dicts": (lambda: make_catalog(args.rows, args.seed),
+                  lambda rows, interests, location: scan_dicts(rows, interests, location, 5)),
+        "objects": (lambda: OpportunityCatalog(make_catalog(args.rows, args.seed)),
+                    lambda catalog, interests, location: catalog.find(interests, location, 5, today=today)),
+        "columnar": (lambda: ColumnarCatalog(make_catalog(args.rows, args.seed)),
+                     lambda catalog, interests, location: catalog.find(interests, location, 5, today=today)),
+    }
+
+    print(f"rows: {args.rows}, queries: {args.queries}")
+    for name, (build, search) in layouts.items():
+        tracemalloc.start()
+        catalog = build()
+        memory_bytes, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        latencies = []
+        for interests, location in queries:
+            started = time.perf_counter()
+            search(catalog, interests, location)
+            latencies.append(time.perf_counter() - started)
+        p50 = statistics.median(latencies)
+        print(f"  {name:<9} memory {memory_bytes / 2**20:8.1f} MiB ({memory_bytes / args.rows:7.0f} B/row)   "
+              f"find p50 {p50 * 1000:8.2f} ms   p99 {percentile(latencies, 0.99) * 1000:8.2f} ms   "
+              f"scan {args.rows / p50 / 1e6:6.2f} M rows/s")
+        del catalog
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+A stand-in for Descope so the auth-backed tools can be benchmarked offline
+
+Session tokens are real RS256 JWTs signed with a key pair made on the spot,
+and the token verifier is handed the matching public key instead of
+downloading Descope's. User attributes live in interest_store.FakeUserBackend.
+Nothing here talks to the network.
+"""
+
+import os
+import sys
+import time
+
+import jwt
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import auth_setup
+from interest_store import FakeUserBackend, UserInterestStore
+from token_verifier import TokenVerifier
+
+PROJECT_ID = "P2BenchmarkProject"
+KEY_ID = "benchmark-key"
+
+class FakeDescope:
+    """Signs session tokens and answers user lookups the way Descope would.
+
+    install() points auth_setup at it; backend_latency_seconds makes each
+    user load or batch write sleep as long as a real round trip might take.
+    """
+
+    def __init__(self, backend_latency_seconds=0.0, users=None):
+        self.private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        jwk = jwt.algorithms.RSAAlgorithm.to_jwk(self.private_key.public_key(), as_dict=True)
+        self.jwks = {"keys": [dict(jwk, kid=KEY_ID, alg="RS256", use="sig")]}
+        self.backend = FakeUserBackend(users, latency_seconds=backend_latency_seconds)
+
+    def session_token(self, user_id, ttl_seconds=3600):
+        now = int(time.time())
+        claims = {"sub": user_id, "iss": PROJECT_ID, "iat": now, "exp": now + ttl_seconds, "email": user_id + "@example.com"}
+        return jwt.encode(claims, self.private_key, algorithm="RS256", headers={"kid": KEY_ID})
+
+    def install(self):
+        """Make auth_setup verify tokens and keep interests against this fake (returns self)"""
+        os.environ["DESCOPE_PROJECT_ID"] = PROJECT_ID
+        auth_setup.token_verifier = TokenVerifier(PROJECT_ID, fetch_jwks=lambda: self.jwks)
+        auth_setup.interest_store = UserInterestStore(self.backend, flush_interval=0.5)
+        return self
+
+    def uninstall(self):
+        if auth_setup.interest_store is not None:
+            auth_setup.interest_store.close()
+        auth_setup.token_verifier = None
+        auth_setup.interest_store = None
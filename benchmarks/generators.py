@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Seeded synthetic catalogs and user populations for the benchmarks
+
+The same seed always gives the same rows, so numbers from two runs (or two
+branches) are comparable. Opportunities come out as plain dicts shaped like
+sample_opportunities.json, ready for OpportunityStore.seed().
+"""
+
+import os
+import random
+import sys
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from data_models import InterestCategory, UserInterests
+from gazetteer import PLACES
+from opportunity_store import OpportunityStore
+
+WORDS = """
+animal shelter dog cat walk feed clean beach park trail tree plant garden river ocean tutor teach read
+math science computer coding library school student youth mentor senior elder visit meal food bank
+pantry sort pack deliver shelter homeless clothing drive health clinic hospital blood donation art
+museum music theater paint mural festival community event neighborhood cleanup recycle build repair
+house habitat volunteer weekend morning evening family kids group training support organize help
+""".split()
+
+# Real text follows Zipf's law: a few words are everywhere, most are rare
+TAIL_WORDS = 20_000
+
+CATEGORIES = [category.value for category in InterestCategory]
+
+# Places the gazetteer knows, plus a few it doesn't (those fall back to substring matching)
+KNOWN_PLACES = [place for place in PLACES if place.kind != "region"]
+PARENTS = {place.id: place.parent for place in PLACES}
+UNKNOWN_PLACES = ["Springfield, IL", "Austin, TX", "Portland, OR", "Community Hall, Main Street"]
+
+TIMES = ["9:00 AM - 12:00 PM", "10:00 AM - 2:00 PM", "1:00 PM - 4:00 PM", "3:00 PM - 5:00 PM", "6-9pm", "10am", None]
+AVAILABILITY = [
+    None, ["Saturday mornings"], ["weekends"], ["weekday evenings"], ["Sunday afternoons", "Wednesday 6-9pm"], ["anytime"],
+]
+
+def vocabulary():
+    """(words, cumulative weights) for rng.choices, most common word first"""
+    words = WORDS + ["word%d" % i for i in range(TAIL_WORDS)]
+    total = 0.0
+    cumulative = []
+    for rank in range(1, len(words) + 1):
+        total += 1 / rank
+        cumulative.append(total)
+    return words, cumulative
+
+def make_opportunity(rng, i, vocabulary, first_day=None):
+    """One synthetic opportunity as a dict; about half have exact coordinates and most have a date"""
+    def words(count):
+        return " ".join(rng.choices(vocabulary[0], cum_weights=vocabulary[1], k=count))
+
+    opportunity = {
+        "id": "bench-%d" % i,
+        "title": words(3).title(),
+        "organization": words(2).title() + " Society",
+        "description": words(rng.randint(12, 30)) + ".",
+        "categories": rng.sample(CATEGORIES, rng.randint(1, 3)),
+        "registration_link": "https://example.com/volunteer/%d" % i,
+    }
+    if rng.random() < 0.9:
+        place = rng.choice(KNOWN_PLACES)
+        opportunity["location"] = place.name + ", " + _region(place.id).upper()
+        if place.center and rng.random() < 0.5:
+            opportunity["latitude"] = round(place.center[0] + rng.uniform(-0.05, 0.05), 6)
+            opportunity["longitude"] = round(place.center[1] + rng.uniform(-0.05, 0.05), 6)
+    else:
+        opportunity["location"] = rng.choice(UNKNOWN_PLACES)
+    if rng.random() < 0.85:
+        day = (first_day or date.today()) + timedelta(days=rng.randint(-30, 180))
+        opportunity["date"] = day.isoformat()
+        opportunity["time"] = rng.choice(TIMES)
+    return opportunity
+
+def _region(place_id):
+    while PARENTS[place_id]:
+        place_id = PARENTS[place_id]
+    return place_id
+
+def make_catalog(rows, seed=1):
+    """rows synthetic opportunities (dicts), the same ones for the same seed"""
+    rng = random.Random(seed)
+    words = vocabulary()
+    first_day = date(2026, 1, 1)  # fixed, so a seed means the same catalog whenever it runs
+    return [make_opportunity(rng, i, words, first_day) for i in range(rows)]
+
+def make_users(count, seed=1):
+    """count UserInterests profiles with a realistic spread of causes, places and availability"""
+    rng = random.Random(seed + 1_000_003)
+    users = []
+    for i in range(count):
+        location = rng.choice(KNOWN_PLACES).name if rng.random() < 0.7 else None
+        users.append(UserInterests(
+            user_id="user-%d" % i,
+            interests=rng.sample(CATEGORIES, rng.randint(1, 3)),
+            location=location,
+            availability=rng.choice(AVAILABILITY),
+        ))
+    return users
+
+def make_store(rows, seed=1, path=":memory:"):
+    """An OpportunityStore holding a synthetic catalog"""
+    store = OpportunityStore(path)
+    store.seed(make_catalog(rows, seed))
+    return store
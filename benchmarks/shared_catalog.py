@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Memory per worker process with the shared, memory-mapped catalog vs each worker loading its own
+
+Usage: python benchmarks/shared_catalog.py [--rows 100000] [--workers 4] [--queries 200] [--seed 1]
+
+Every worker runs the same searches, then reports its memory from
+/proc/self/smaps_rollup (Linux): private is what only that process uses, and
+PSS splits shared pages evenly between the processes mapping them.
+"""
+
+import argparse
+import multiprocessing
+import os
+import random
+import resource
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from generators import CATEGORIES, KNOWN_PLACES, make_store
+from opportunity_store import OpportunityStore
+from shared_catalog import SharedCatalog, publish
+
+def memory_kib():
+    """{"rss", "pss", "private"} in KiB for this process (only rss, the peak, off Linux)"""
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            fields = {line.split(":")[0]: int(line.split()[1]) for line in f if line.split()[-1:] == ["kB"]}
+    except OSError:
+        return {"rss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, "pss": None, "private": None}
+    return {
+        "rss": fields["Rss"],
+        "pss": fields["Pss"],
+        "private": fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0),
+    }
+
+def worker(job):
+    mode, database, directory, queries, seed = job
+    before = memory_kib()
+    started = time.perf_counter()
+    store = OpportunityStore(database)
+    if mode == "shared":
+        catalog = SharedCatalog(directory, store=store, gazetteer=store.gazetteer)
+    else:
+        from catalog_index import OpportunityCatalog
+        catalog = OpportunityCatalog.from_store(store)
+    load_seconds = time.perf_counter() - started
+
+    rng = random.Random(seed)
+    latencies = []
+    for _ in range(queries):
+        interests = rng.sample(CATEGORIES, rng.randint(1, 3))
+        location = rng.choice(KNOWN_PLACES).name if rng.random() < 0.7 else None
+        started = time.perf_counter()
+        catalog.find(interests, location, 5, today=date(2026, 3, 1))
+        latencies.append(time.perf_counter() - started)
+    after = memory_kib()
+    return {"load": load_seconds, "p50": statistics.median(latencies), "before": before, "after": after}
+
+def run(mode, args, database, directory):
+    jobs = [(mode, database, directory, args.queries, args.seed + i) for i in range(args.workers)]
+    # Fresh interpreters, like uvicorn's workers, so nothing is inherited from this process
+    with multiprocessing.get_context("spawn").Pool(args.workers) as pool:
+        results = pool.map(worker, jobs)
+    print(f"{mode}:")
+    for i, result in enumerate(results):
+        grown = {key: (result["after"][key] - result["before"][key]) if result["after"][key] is not None else None
+                 for key in result["after"]}
+        print(f"  worker {i}  load {result['load']:6.2f} s   find p50 {result['p50'] * 1000:7.2f} ms   "
+              f"rss {result['after']['rss'] / 1024:7.1f} MiB   "
+              + (f"pss {result['after']['pss'] / 1024:7.1f} MiB   private +{grown['private'] / 1024:7.1f} MiB"
+                 if grown["private"] is not None else "(pss/private need Linux)"))
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    scratch = tempfile.mkdtemp(prefix="shared-catalog-bench-")
+    try:
+        database = os.path.join(scratch, "opportunities.db")
+        directory = os.path.join(scratch, "catalog")
+        store = make_store(args.rows, args.seed, database)
+        started = time.perf_counter()
+        path = publish(store, directory)
+        print(f"rows:           {args.rows}")
+        print(f"publish:        {time.perf_counter() - started:.2f} s")
+        print(f"catalog file:   {os.path.getsize(path) / 2**20:.1f} MiB")
+        store.close()
+        run("in-memory", args, database, directory)
+        run("shared", args, database, directory)
+    finally:
+        shutil.rmtree(scratch)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Build time, memory and query latency of the full-text index on a synthetic catalog
+
+Usage: python benchmarks/text_search.py [--rows 100000] [--queries 500] [--seed 1]
+"""
+
+import argparse
+import heapq
+import os
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from data_models import VolunteerOpportunity
+from generators import make_catalog, vocabulary
+from text_index import TextIndex
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    words = vocabulary()
+    opportunities = [VolunteerOpportunity.model_validate(row) for row in make_catalog(args.rows, args.seed)]
+
+    def build():
+        index = TextIndex()
+        for position, opportunity in enumerate(opportunities):
+            index.add(position, opportunity)
+        return index
+
+    started = time.perf_counter()
+    index = build()
+    build_seconds = time.perf_counter() - started
+
+    # Memory is measured on a second build, since tracing slows everything down
+    tracemalloc.start()
+    traced = build()
+    memory_bytes, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del traced
+
+    queries = [" ".join(rng.choices(words[0], cum_weights=words[1], k=rng.randint(1, 3))) for _ in range(args.queries)]
+    latencies = []
+    for query in queries:
+        started = time.perf_counter()
+        scores = index.scores(query)
+        heapq.nlargest(10, scores.items(), key=lambda item: item[1])
+        latencies.append(time.perf_counter() - started)
+
+    print(f"rows:           {args.rows}")
+    print(f"terms:          {len(index.postings)}")
+    print(f"build:          {build_seconds:.2f} s ({args.rows / build_seconds:,.0f} rows/s)")
+    print(f"index memory:   {memory_bytes / 2**20:.1f} MiB")
+    print(f"query p50:      {statistics.median(latencies) * 1000:.2f} ms")
+    print(f"query p99:      {percentile(latencies, 0.99) * 1000:.2f} ms")
+
+if __name__ == "__main__":
+    main()
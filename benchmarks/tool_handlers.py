@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Latency, throughput and memory of the find/set/get tool handlers in both servers
+
+For each catalog size we seed an in-memory store from the synthetic
+generator, start main.py's and server.py's servers on it (with Descope
+replaced by benchmarks/fake_descope.py), and call each handler directly,
+cycling through a synthetic user population. Results can be saved as JSON
+and compared against an earlier run; any metric worse than the tolerance
+is reported and makes the script exit with status 1.
+
+Usage:
+    python benchmarks/tool_handlers.py [--sizes 1000,10000,100000] [--users 1000] [--requests 500]
+                                       [--seed 1] [--save results.json] [--compare benchmarks/baseline.json]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from catalog_index import OpportunityCatalog
+from fake_descope import FakeDescope
+from generators import make_store, make_users
+
+# How many calls of each handler we trace for memory (tracing makes everything slower)
+MEMORY_SAMPLE = 200
+
+# Cached searches cycle through this many distinct queries, so after warming up every one is a repeat
+HOT_QUERIES = 50
+
+# Untimed calls before each measurement (fills per-process caches like the stemmer's and the token verifier's)
+WARMUP_CALLS = 50
+
+# Metrics where bigger is worse; everything else (throughput) is better when bigger
+LOWER_IS_BETTER = ("p50_ms", "p99_ms", "peak_kib", "build_s", "peak_mib")
+
+# Changes smaller than this are timer or allocator noise, however big they are in percent
+NOISE_FLOOR = {"p50_ms": 0.05, "p99_ms": 0.25, "peak_kib": 64, "build_s": 0.05, "peak_mib": 1}
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+def handler_calls(name, main_server, matchmaker, users, tokens):
+    """An async function of a request number that calls the handler called name"""
+    def find_arguments(i):
+        user = users[i % len(users)]
+        arguments = {"interests": [interest.value for interest in user.interests], "max_results": 5}
+        if user.location:
+            arguments["location"] = user.location
+        return arguments
+
+    def uncached(server, handler):
+        async def call(i):
+            server.responses.clear()
+            return await handler(find_arguments(i))
+        return call
+
+    def cached(handler):
+        return lambda i: handler(find_arguments(i % HOT_QUERIES))
+
+    def session_arguments(i, **extra):
+        return dict(extra, session_token=tokens[i % len(tokens)])
+
+    user_interests = lambda i: [interest.value for interest in users[i % len(users)].interests]
+    calls = {
+        "main.find": uncached(main_server, main_server.find_volunteer_opportunities),
+        "main.find_cached": cached(main_server.find_volunteer_opportunities),
+        "main.set_interests": lambda i: main_server.set_user_interests(
+            session_arguments(i, interests=user_interests(i), location=users[i % len(users)].location)
+        ),
+        "main.get_interests": lambda i: main_server.get_user_interests(session_arguments(i)),
+        "server.find": uncached(matchmaker, matchmaker.find_opportunities),
+        "server.find_cached": cached(matchmaker.find_opportunities),
+        "server.set_interests": lambda i: matchmaker.save_interests(
+            {"interests": user_interests(i), "location": users[i % len(users)].location}
+        ),
+        "server.get_interests": lambda i: matchmaker.show_interests({}),
+    }
+    return calls[name]
+
+async def measure(call, requests):
+    for i in range(min(requests, WARMUP_CALLS)):
+        await call(i)
+    latencies = []
+    started = time.perf_counter()
+    for i in range(requests):
+        before = time.perf_counter()
+        await call(i)
+        latencies.append(time.perf_counter() - before)
+    elapsed = time.perf_counter() - started
+    return {
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 4),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 4),
+        "ops_per_s": round(requests / elapsed, 1),
+    }
+
+async def measure_memory(call, requests):
+    tracemalloc.start()
+    baseline, _ = tracemalloc.get_traced_memory()
+    for i in range(requests):
+        await call(i)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return round((peak - baseline) / 1024, 1)
+
+def run_size(rows, args, descope, users, tokens):
+    import main
+    import server
+
+    store = make_store(rows, args.seed)
+    results = {}
+
+    started = time.perf_counter()
+    OpportunityCatalog.from_store(store)
+    build_seconds = time.perf_counter() - started
+    tracemalloc.start()
+    catalog = OpportunityCatalog.from_store(store)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del catalog
+    results["catalog.build"] = {"build_s": round(build_seconds, 3), "peak_mib": round(peak / 2 ** 20, 1)}
+
+    main_server = main.VolunteerMatcherServer(store=store)
+    matchmaker = server.VolunteerMatchmaker(store=store)
+    try:
+        for name in ("main.find", "main.find_cached", "main.set_interests", "main.get_interests",
+                     "server.find", "server.find_cached", "server.set_interests", "server.get_interests"):
+            call = handler_calls(name, main_server, matchmaker, users, tokens)
+            metrics = asyncio.run(measure(call, args.requests))
+            metrics["peak_kib"] = asyncio.run(measure_memory(call, min(args.requests, MEMORY_SAMPLE)))
+            results[name] = metrics
+            print(f"  {name:24} p50 {metrics['p50_ms']:9.3f} ms   p99 {metrics['p99_ms']:9.3f} ms   "
+                  f"{metrics['ops_per_s']:10.1f} ops/s   peak {metrics['peak_kib']:9.1f} KiB", flush=True)
+    finally:
+        main_server.auth.close()
+    return results
+
+def compare(results, baseline, tolerance):
+    """Print how results moved against baseline; returns the regressions"""
+    regressions = []
+    for size, operations in results.items():
+        for operation, metrics in operations.items():
+            before = baseline.get(size, {}).get(operation, {})
+            for metric, value in metrics.items():
+                old = before.get(metric)
+                if not old:
+                    continue
+                change = (value - old) / old
+                worse = change > tolerance if metric in LOWER_IS_BETTER else change < -tolerance
+                worse = worse and abs(value - old) >= NOISE_FLOOR.get(metric, 0)
+                flag = "  REGRESSION" if worse else ""
+                print(f"{size:>8} {operation:24} {metric:10} {old:12.3f} -> {value:12.3f} ({change:+.1%}){flag}")
+                if worse:
+                    regressions.append((size, operation, metric, old, value))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sizes", default="1000,10000,100000", help="comma-separated catalog sizes (up to 1000000)")
+    parser.add_argument("--users", type=int, default=1000, help="how many synthetic users to cycle through")
+    parser.add_argument("--requests", type=int, default=500, help="calls per handler per size")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--backend-latency-ms", type=float, default=0.0, help="simulated Descope round trip")
+    parser.add_argument("--save", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="compare against results saved earlier with --save")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="how much worse a metric may get (0.25 = 25%%)")
+    args = parser.parse_args()
+
+    descope = FakeDescope(backend_latency_seconds=args.backend_latency_ms / 1000).install()
+    users = make_users(args.users, args.seed)
+    tokens = [descope.session_token(user.user_id) for user in users]
+
+    results = {}
+    try:
+        for rows in (int(size) for size in args.sizes.split(",")):
+            print(f"{rows} opportunities, {len(users)} users, {args.requests} calls per handler", flush=True)
+            results[str(rows)] = run_size(rows, args, descope, users, tokens)
+    finally:
+        descope.uninstall()
+
+    report = {
+        "meta": {
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "seed": args.seed,
+            "users": args.users,
+            "requests": args.requests,
+        },
+        "results": results,
+    }
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print("Saved results to " + args.save)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline["results"], args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} metrics got more than {args.tolerance:.0%} worse")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
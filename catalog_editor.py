@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Adding, updating and retiring opportunities while the servers are running
+"""
+
+import threading
+
+from data_models import InterestCategory, VolunteerOpportunity
+
+# Input schema for an opportunity in the add/update tools (update accepts any subset of it)
+OPPORTUNITY_FIELDS_SCHEMA = {
+    "id": {"type": "string", "description": "Unique ID for this opportunity"},
+    "title": {"type": "string", "description": "Name of the volunteer opportunity"},
+    "organization": {"type": "string", "description": "Who's organizing it"},
+    "description": {"type": "string", "description": "What volunteers will be doing"},
+    "categories": {
+        "type": "array",
+        "items": {"type": "string", "enum": [category.value for category in InterestCategory]},
+        "description": "What causes it supports"
+    },
+    "location": {"type": "string", "description": "Where it happens"},
+    "date": {"type": "string", "description": "When it takes place, YYYY-MM-DD"},
+    "time": {"type": "string", "description": "What time it happens"},
+    "registration_link": {"type": "string", "description": "Link to sign up"},
+    "image_url": {"type": "string", "description": "Picture of the activity"},
+    "latitude": {"type": "number", "description": "Latitude of the venue"},
+    "longitude": {"type": "number", "description": "Longitude of the venue"}
+}
+# The editing tools also take the session token of someone allowed to edit
+SESSION_TOKEN_SCHEMA = {
+    "type": "string",
+    "description": "Descope session token of a user with an editor role (can be left out once this session has sent one)"
+}
+REQUIRED_OPPORTUNITY_FIELDS = ["id", "title", "organization", "description", "categories", "location", "registration_link"]
+
+class CatalogEditor:
+    """Applies catalog changes to the shared store and the live in-memory catalog together.
+
+    Every change is validated before anything is written. It goes to the store
+    in one transaction, then into the catalog as one new snapshot, so searches
+    running at the same time see either all of a batch or none of it.
+    """
+
+    def __init__(self, store, catalog):
+        self.store = store
+        self.catalog = catalog
+        # Keeps the store and the catalog applying changes in the same order. A catalog that follows
+        # the store shares its lock, so it can't reload a change between the two
+        self._lock = getattr(catalog, "sync_lock", None) or threading.Lock()
+
+    def add_opportunity(self, opportunity):
+        """Add a new opportunity; returns it as stored"""
+        return self.apply(add=[opportunity])["added"][0]
+
+    def update_opportunity(self, opportunity_id, changes):
+        """Change some fields of an existing opportunity; returns it as stored"""
+        return self.apply(update=[dict(changes, id=opportunity_id)])["updated"][0]
+
+    def retire_opportunity(self, opportunity_id):
+        """Take an opportunity out of the catalog; returns False if there was no such opportunity"""
+        return bool(self.apply(retire=[opportunity_id])["retired"])
+
+    def apply(self, add=(), update=(), retire=()):
+        """Apply a batch of changes at once.
+
+        add holds whole opportunities, update holds an id plus the fields to
+        change, and retire holds ids. Returns {"added": [...], "updated": [...],
+        "retired": [ids]}. A bad row raises ValueError and nothing is written.
+        """
+        with self._lock:
+            snapshot = self.catalog.snapshot()
+            added = [self._validate_new(opportunity, snapshot) for opportunity in add]
+            seen = set()
+            for opportunity in added:
+                if opportunity.id in seen:
+                    raise ValueError(f"Opportunity '{opportunity.id}' is in the batch twice")
+                seen.add(opportunity.id)
+            updated = [self._validate_update(changes, snapshot) for changes in update]
+
+            records = added + updated
+            versions, retired = self.store.apply(
+                upserts=[record.model_dump(mode="json", exclude={"score", "version"}) for record in records],
+                removals=list(retire),
+            )
+            # The store decides record versions, so both sides agree on them
+            records = [record.model_copy(update={"version": version}) for record, version in zip(records, versions)]
+            changes = self.catalog.apply(upserts=records, removals=retired)
+            stored = [current for _, current in changes[:len(records)]]
+            return {"added": stored[:len(added)], "updated": stored[len(added):], "retired": retired}
+
+    @staticmethod
+    def _validate_new(opportunity, snapshot):
+        if not isinstance(opportunity, VolunteerOpportunity):
+            opportunity = VolunteerOpportunity.model_validate(opportunity)
+        if snapshot.get(opportunity.id) is not None:
+            raise ValueError(f"Opportunity '{opportunity.id}' already exists")
+        return opportunity
+
+    @staticmethod
+    def _validate_update(changes, snapshot):
+        changes = dict(changes)
+        opportunity_id = changes.pop("id", None)
+        current = snapshot.get(opportunity_id)
+        if current is None:
+            raise ValueError(f"There is no opportunity '{opportunity_id}' to update")
+        changes.pop("version", None)
+        changes.pop("score", None)
+        # Validate the merged record, not just the changed fields
+        return VolunteerOpportunity.model_validate({**current.model_dump(), **changes})
@@ -0,0 +1,594 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Search indexes for the volunteer opportunity catalog
+"""
+
+import heapq
+import threading
+import time
+from bisect import bisect_left, insort
+from collections import defaultdict
+from datetime import datetime
+from typing import NamedTuple, Optional
+
+import numpy as np
+
+from data_models import InterestCategory, ScoringWeights, VolunteerOpportunity
+from gazetteer import Gazetteer
+from geo_index import GeoGridIndex
+from paged_dict import PagedDict
+from ranking import Scorer, top_k
+from schedule import (
+    MINUTES_PER_DAY, IntervalIndex, availability_windows, event_interval, from_moment, overlaps_any, timestamp,
+)
+from text_index import TextIndex
+
+# Every cause gets its own bit, so all of an opportunity's causes fit in one small int
+CATEGORY_BITS = {category.value: 1 << bit for bit, category in enumerate(InterestCategory)}
+
+def category_mask(categories):
+    """Turn a list of causes into a bitmask (unknown causes are ignored)"""
+    mask = 0
+    for category in categories:
+        mask |= CATEGORY_BITS.get(category, 0)
+    return mask
+
+class CategoryIndex:
+    """A bitmask per opportunity plus a posting list of opportunities per cause"""
+
+    def __init__(self):
+        self.masks = PagedDict()  # catalog position -> category bitmask
+        self.postings = {category: [] for category in CATEGORY_BITS}  # cause -> sorted positions
+        self._owned = None  # posting lists this copy may change in place (None: all of them)
+
+    def copy(self):
+        """A copy that shares posting lists with this index until it changes them"""
+        clone = CategoryIndex.__new__(CategoryIndex)
+        clone.masks = self.masks.copy()
+        clone.postings = dict(self.postings)
+        clone._owned = set()
+        return clone
+
+    def _writable(self, category):
+        if self._owned is not None and category not in self._owned:
+            self.postings[category] = list(self.postings[category])
+            self._owned.add(category)
+        return self.postings[category]
+
+    def add(self, position, categories):
+        mask = category_mask(categories)
+        self.masks[position] = mask
+        for category, bit in CATEGORY_BITS.items():
+            if mask & bit:
+                insort(self._writable(category), position)
+
+    def remove(self, position):
+        mask = self.masks.pop(position, 0)
+        for category, bit in CATEGORY_BITS.items():
+            if mask & bit:
+                posting = self._writable(category)
+                del posting[bisect_left(posting, position)]
+
+    def matching(self, interests):
+        """Yield positions sharing at least one cause with interests, in catalog order"""
+        postings = [self.postings[category] for category in set(interests) if category in self.postings]
+        previous = None
+        for position in heapq.merge(*postings):
+            if position != previous:
+                yield position
+                previous = position
+
+class LocationIndex:
+    """Which opportunities sit inside each place, from the venue all the way up to the region"""
+
+    def __init__(self, gazetteer):
+        self.gazetteer = gazetteer
+        self.places = PagedDict()  # catalog position -> place id (None if the gazetteer doesn't know it)
+        self.within = defaultdict(set)  # place id -> positions in that place or anywhere inside it
+        self.unresolved = set()
+        self._owned = None  # places whose sets this copy may change in place (None: all of them)
+
+    def copy(self):
+        """A copy that shares per-place sets with this index until it changes them"""
+        clone = LocationIndex.__new__(LocationIndex)
+        clone.gazetteer = self.gazetteer
+        clone.places = self.places.copy()
+        clone.within = defaultdict(set, self.within)
+        clone.unresolved = set(self.unresolved)
+        clone._owned = set()
+        return clone
+
+    def _writable(self, place):
+        if self._owned is not None and place not in self._owned:
+            self.within[place] = set(self.within.get(place, ()))
+            self._owned.add(place)
+        return self.within[place]
+
+    def add(self, position, location):
+        place_id = self.gazetteer.resolve(location)
+        self.places[position] = place_id
+        if place_id is None:
+            self.unresolved.add(position)
+            return
+        for place in self.gazetteer.lineage(place_id):
+            self._writable(place).add(position)
+
+    def remove(self, position):
+        place_id = self.places.pop(position, None)
+        self.unresolved.discard(position)
+        if place_id is not None:
+            for place in self.gazetteer.lineage(place_id):
+                self._writable(place).discard(position)
+
+# One search result: the opportunity, how well it matched and how far away it is
+class Match(NamedTuple):
+    opportunity: VolunteerOpportunity
+    score: float
+    distance_km: Optional[float] = None
+
+class CatalogSnapshot:
+    """One version of the catalog and its indexes, laid out so a search only visits rows that can match.
+
+    A snapshot never changes once OpportunityCatalog has published it; changes
+    are made to a copy() that shares everything it doesn't touch.
+    """
+
+    def __init__(self, opportunities=(), gazetteer=None, weights=None):
+        self.rows = PagedDict()  # catalog position -> validated, read-only VolunteerOpportunity
+        self.positions = PagedDict()  # opportunity id -> catalog position
+        self.dates = PagedDict()  # catalog position -> day number of the event, if it has a date
+        self.features = PagedDict()  # catalog position -> (category mask, point, day number), all scoring needs
+        self.weights = weights or ScoringWeights()
+        self.version = 0  # goes up on every change, so caches know when to let go
+        self.gazetteer = gazetteer or Gazetteer()
+        self.categories = CategoryIndex()
+        self.locations = LocationIndex(self.gazetteer)
+        self.geo = GeoGridIndex()
+        self.text = TextIndex()
+        self.schedule = IntervalIndex()  # when each dated opportunity starts and ends, parsed once here
+        self._next_position = 0
+        for opportunity in opportunities:
+            self.upsert(opportunity)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __iter__(self):
+        # In the order opportunities were first added
+        return (self.rows[position] for position in sorted(self.rows))
+
+    def copy(self):
+        """An unpublished copy to apply changes to; it shares unchanged index entries with this one"""
+        clone = CatalogSnapshot.__new__(CatalogSnapshot)
+        clone.rows = self.rows.copy()
+        clone.positions = self.positions.copy()
+        clone.dates = self.dates.copy()
+        clone.features = self.features.copy()
+        clone.weights = self.weights
+        clone.version = self.version
+        clone.gazetteer = self.gazetteer
+        clone.categories = self.categories.copy()
+        clone.locations = self.locations.copy()
+        clone.geo = self.geo.copy()
+        clone.text = self.text.copy()
+        clone.schedule = self.schedule.copy()
+        clone._next_position = self._next_position
+        return clone
+
+    def get(self, opportunity_id):
+        position = self.positions.get(opportunity_id)
+        return None if position is None else self.rows[position]
+
+    def upsert(self, opportunity):
+        """Add an opportunity, or replace the one with the same id (keeping its place in the catalog).
+
+        Rows are validated here, once, so searches never have to build models again.
+        Returns (previous, stored); previous is None for a new opportunity.
+        """
+        if not isinstance(opportunity, VolunteerOpportunity):
+            opportunity = VolunteerOpportunity.model_validate(opportunity)
+        position = self.positions.get(opportunity.id)
+        previous = None
+        if position is None:
+            position = self._next_position
+            self._next_position += 1
+            self.positions[opportunity.id] = position
+        else:
+            # A replacement always gets a newer record version than the one it replaces
+            previous = self.rows[position]
+            if opportunity.version <= previous.version:
+                opportunity = opportunity.model_copy(update={"version": previous.version + 1})
+            self.categories.remove(position)
+            self.locations.remove(position)
+            self.geo.remove(position)
+            self.text.remove(position, previous)
+            self.schedule.remove(position)
+        self.rows[position] = opportunity
+        interval = event_interval(opportunity.date, opportunity.time)
+        if interval is not None:
+            self.schedule.add(position, interval)
+        self.dates[position] = interval[0] // MINUTES_PER_DAY if interval is not None else None
+        self.categories.add(position, opportunity.categories)
+        self.locations.add(position, opportunity.location)
+        self.text.add(position, opportunity)
+        point = self._coordinates(position)
+        if point is not None:
+            self.geo.add(position, *point)
+        self.features[position] = (self.categories.masks[position], point, self.dates[position])
+        self.version += 1
+        return previous, opportunity
+
+    def _coordinates(self, position):
+        # Exact coordinates when the organizer gave them, otherwise the middle of the place we resolved
+        opportunity = self.rows[position]
+        if opportunity.latitude is not None and opportunity.longitude is not None:
+            return opportunity.latitude, opportunity.longitude
+        place_id = self.locations.places.get(position)
+        return self.gazetteer.center(place_id) if place_id else None
+
+    def remove(self, opportunity_id):
+        """Drop an opportunity; returns the removed record, or None if we never had it"""
+        position = self.positions.pop(opportunity_id, None)
+        if position is None:
+            return None
+        previous = self.rows.pop(position)
+        del self.dates[position]
+        del self.features[position]
+        self.categories.remove(position)
+        self.locations.remove(position)
+        self.geo.remove(position)
+        self.text.remove(position, previous)
+        self.schedule.remove(position)
+        self.version += 1
+        return previous
+
+    def find(self, interests, location=None, max_results=None, near=None, radius_km=None, weights=None, today=None,
+             availability=None, upcoming=False, now=None):
+        """Best-matching opportunities sharing a cause with interests, as Match tuples.
+
+        location narrows to a place; near=(latitude, longitude) with radius_km narrows
+        to a circle. With near alone we return the max_results closest, nearest first.
+        Otherwise results are ranked by shared causes, closeness and how soon they happen.
+        availability (entries like "Saturday mornings" or "2023-10-20") keeps only
+        dated opportunities happening while the user is free, and upcoming drops
+        ones that are already over at now.
+        """
+        needle, inside, wanted, scorer = self._prepare(interests, location, near, weights, today)
+        timed, cutoff = self._when(availability, upcoming, now, today)
+
+        if near is not None and radius_km is None:
+            closest = self.geo.nearest(
+                near[0], near[1], max_results or 5,
+                accept=lambda position: bool(self.categories.masks[position] & wanted)
+                and (not needle or self._in_location(position, needle, inside))
+                and (timed is None or position in timed)
+                and (cutoff is None or self.schedule.ends_after(position, cutoff)),
+                available=self._most_matching(interests, inside, timed),
+            )
+            best = [self._score(scorer, position) for _, position in closest]
+            return [Match(self.rows[position], score, distance) for score, position, distance in best]
+
+        candidates = self._candidates(interests, needle, inside, near, radius_km, timed, cutoff)
+        best = top_k((self._score(scorer, position) for position in candidates), max_results)
+        return [Match(self.rows[position], score, distance) for score, position, distance in best]
+
+    def search(self, query, interests=None, location=None, max_results=10):
+        """Opportunities whose title, organization or description match the query, best BM25 score first.
+
+        interests and location narrow the results the same way they do for find().
+        """
+        scores = self.text.scores(query)
+        wanted = category_mask(interests) if interests else None
+        needle = location.lower() if location else None
+        place_id = self.gazetteer.resolve(location) if location else None
+        inside = self.locations.within.get(place_id, set()) if place_id else None
+        candidates = (
+            (score, position) for position, score in scores.items()
+            if (wanted is None or self.categories.masks[position] & wanted)
+            and (not needle or self._in_location(position, needle, inside))
+        )
+        return [Match(self.rows[position], score) for score, position in top_k(candidates, max_results)]
+
+    def scored(self, interests, location=None, near=None, radius_km=None, weights=None, today=None,
+               availability=None, upcoming=False, now=None):
+        """Yield (sort key, Match) for everything find() could return, in catalog order.
+
+        Sorting by the key gives find()'s order: best score first, or closest
+        first for near without radius_km. Pagination heapifies these instead
+        of keeping only the top few.
+        """
+        needle, inside, wanted, scorer = self._prepare(interests, location, near, weights, today)
+        timed, cutoff = self._when(availability, upcoming, now, today)
+        by_distance = near is not None and radius_km is None
+        for position in self._candidates(interests, needle, inside, near, None if by_distance else radius_km, timed, cutoff):
+            if by_distance and position not in self.geo.points:
+                continue  # nearest-first searches only see opportunities we can place on the map
+            score, _, distance = self._score(scorer, position)
+            key = (distance, position) if by_distance else (-score, position)
+            yield key, Match(self.rows[position], score, distance)
+
+    @staticmethod
+    def materialize(entry):
+        """The Match for an entry scored() yielded (here they already are Matches)"""
+        return entry
+
+    def columns(self):
+        """Per-row arrays for vectorized scoring, rows in catalog order.
+
+        positions are the catalog positions, masks the cause bitmasks, days
+        the event day numbers (-1 without a date) and latitudes/longitudes
+        the points we know (nan otherwise).
+        """
+        positions = np.array(sorted(self.rows), dtype=np.int64)
+        count = len(positions)
+        masks = np.zeros(count, dtype=np.uint16)
+        days = np.full(count, -1, dtype=np.int64)
+        latitudes = np.full(count, np.nan)
+        longitudes = np.full(count, np.nan)
+        for i, position in enumerate(positions.tolist()):
+            mask, point, day = self.features[position]
+            masks[i] = mask
+            if day is not None:
+                days[i] = day
+            if point is not None:
+                latitudes[i], longitudes[i] = point
+        return {"positions": positions, "masks": masks, "days": days, "latitudes": latitudes, "longitudes": longitudes}
+
+    def value_counts(self, field):
+        """{value: how many opportunities have it} for one text field, e.g. "organization" (missing values aren't counted)"""
+        counts = defaultdict(int)
+        for row in self.rows.values():
+            value = getattr(row, field)
+            if value is not None:
+                counts[value] += 1
+        return dict(counts)
+
+    def location_mask(self, location, positions):
+        """For each of positions (from columns()), whether find() counts it as inside location"""
+        needle = location.lower()
+        place_id = self.gazetteer.resolve(location)
+        inside = self.locations.within.get(place_id, set()) if place_id else None
+        return np.fromiter((self._in_location(position, needle, inside) for position in positions.tolist()),
+                           dtype=bool, count=len(positions))
+
+    def happening_during(self, windows, positions):
+        """For each of positions (from columns()), whether it overlaps one of the availability windows"""
+        return np.isin(positions, np.fromiter(self.schedule.during(windows), dtype=np.int64))
+
+    def _prepare(self, interests, location, near, weights, today):
+        needle = location.lower() if location else None
+        place_id = self.gazetteer.resolve(location) if location else None
+        inside = self.locations.within.get(place_id, set()) if place_id else None
+        wanted = category_mask(interests)
+        origin = near if near is not None else (self.gazetteer.center(place_id) if place_id else None)
+        return needle, inside, wanted, Scorer(weights or self.weights, wanted, origin, today)
+
+    def _when(self, availability, upcoming, now, today):
+        """(positions happening while the user is free, or None for any time; the moment results must still be on at, or None)"""
+        if not availability and not upcoming:
+            return None, None
+        now = timestamp(now or datetime.now())
+        windows = availability_windows(availability, today) if availability else None
+        if windows is None:
+            return None, now if upcoming else None
+        if upcoming:
+            windows = from_moment(windows, now)
+        return self.schedule.during(windows), None
+
+    def _candidates(self, interests, needle, inside, near, radius_km, timed=None, cutoff=None):
+        nearby = self.geo.within(near[0], near[1], radius_km) if near is not None and radius_km is not None else None
+        # The interval index has already narrowed things down when there's availability to match
+        if timed is not None:
+            wanted = category_mask(interests)
+            positions = (position for position in sorted(timed) if self.categories.masks[position] & wanted)
+        else:
+            positions = self.categories.matching(interests)
+        return (
+            position for position in positions
+            if (nearby is None or position in nearby)
+            and (not needle or self._in_location(position, needle, inside))
+            and (cutoff is None or self.schedule.ends_after(position, cutoff))
+        )
+
+    def score_one(self, opportunity_id, interests, location=None, weights=None, today=None,
+                  availability=None, upcoming=False, now=None):
+        """The Match find() would give this opportunity for these interests and location, or None if it wouldn't list it"""
+        position = self.positions.get(opportunity_id)
+        wanted = category_mask(interests)
+        if position is None or not self.categories.masks[position] & wanted:
+            return None
+        if availability or upcoming:
+            interval = self.schedule.intervals.get(position)
+            moment = timestamp(now or datetime.now())
+            if upcoming and interval is not None and interval[1] <= moment:
+                return None
+            windows = availability_windows(availability, today) if availability else None
+            if windows is not None:
+                if upcoming:
+                    windows = from_moment(windows, moment)
+                if interval is None or not overlaps_any(interval, windows):
+                    return None
+        place_id = self.gazetteer.resolve(location) if location else None
+        if location:
+            inside = self.locations.within.get(place_id, set()) if place_id else None
+            if not self._in_location(position, location.lower(), inside):
+                return None
+        origin = self.gazetteer.center(place_id) if place_id else None
+        score, _, distance = self._score(Scorer(weights or self.weights, wanted, origin, today), position)
+        return Match(self.rows[position], score, distance)
+
+    def _most_matching(self, interests, inside, timed):
+        """An upper bound on how many opportunities pass find()'s filters, from index sizes alone"""
+        bound = sum(len(self.categories.postings[category]) for category in set(interests) if category in self.categories.postings)
+        if inside is not None:
+            bound = min(bound, len(inside) + len(self.locations.unresolved))
+        if timed is not None:
+            bound = min(bound, len(timed))
+        return bound
+
+    def _score(self, scorer, position):
+        score, distance = scorer(*self.features[position])
+        return score, position, distance
+
+    def _in_location(self, position, needle, inside):
+        # Places the gazetteer knows are a set lookup; anything it doesn't
+        # know about falls back to the old substring match
+        if inside is not None:
+            if position in inside:
+                return True
+            if position not in self.locations.unresolved:
+                return False
+        return needle in self.rows[position].location.lower()
+
+class OpportunityCatalog:
+    """The live catalog: readers always see one whole snapshot, writers publish a new one.
+
+    Searches grab the current snapshot once and never take a lock, so they
+    can't see a half-applied change. Writers are serialized. Each batch of
+    changes goes into a copy of the current snapshot, and the copy replaces it
+    in one assignment. The copy shares every index entry the batch doesn't
+    touch, so a batch costs about a dict copy plus the rows it changes.
+
+    Built from a store, it checks the store's version at most every
+    check_seconds and reloads the rows that changed, so edits other
+    processes make (another worker, or another server the web UI runs)
+    reach this one too. Working out what changed reads the whole store, but
+    only when its version moved past what this catalog has.
+    """
+
+    def __init__(self, opportunities=(), gazetteer=None, weights=None):
+        self._snapshot = CatalogSnapshot(opportunities, gazetteer, weights)
+        self._write_lock = threading.Lock()
+        self._listeners = []
+        self._follow(None)
+
+    def _follow(self, store, version=None, check_seconds=1.0):
+        self.store = store
+        self.check_seconds = check_seconds
+        # Held while the store and this catalog are brought in line (CatalogEditor takes it for its edits)
+        self.sync_lock = threading.RLock()
+        self._store_version = version
+        self._checked_at = time.monotonic()
+
+    @classmethod
+    def from_store(cls, store, **options):
+        """Build the in-memory indexes from everything in an OpportunityStore, and follow its changes"""
+        check_seconds = options.pop("check_seconds", 1.0)
+        # Read before the rows, so a change made in between is picked up by the first check
+        version = store.version()
+        catalog = cls(store.all(), gazetteer=options.pop("gazetteer", store.gazetteer), **options)
+        catalog._follow(store, version, check_seconds)
+        return catalog
+
+    def snapshot(self):
+        """The current version of the catalog; it stays the same however the catalog changes afterwards"""
+        if self.store is not None and time.monotonic() - self._checked_at >= self.check_seconds:
+            self.refresh()
+        return self._snapshot
+
+    def refresh(self):
+        """Apply whatever other processes changed in the store since this catalog last saw it; returns the changes"""
+        with self.sync_lock:
+            self._checked_at = time.monotonic()
+            version = self.store.version()
+            if version == self._store_version:
+                return []
+            current = self._snapshot
+            stored = self.store.all()
+            upserts = [row for row in stored
+                       if current.get(row["id"]) is None or current.get(row["id"]).version != row["version"]]
+            kept = {row["id"] for row in stored}
+            removals = [opportunity.id for opportunity in current if opportunity.id not in kept]
+            changes = self.apply(upserts, removals) if upserts or removals else []
+            self._store_version = version
+            return changes
+
+    @property
+    def version(self):
+        return self.snapshot().version
+
+    @property
+    def store_version(self):
+        """The store version this catalog holds everything up to (None if it isn't built from a store).
+
+        Read it before searching: a search may see a newer catalog, never an older one.
+        """
+        self.snapshot()
+        return self._store_version
+
+    @property
+    def weights(self):
+        return self.snapshot().weights
+
+    @property
+    def gazetteer(self):
+        return self.snapshot().gazetteer
+
+    @property
+    def rows(self):
+        return self.snapshot().rows
+
+    @property
+    def positions(self):
+        return self.snapshot().positions
+
+    def __len__(self):
+        return len(self.snapshot())
+
+    def __iter__(self):
+        return iter(self.snapshot())
+
+    def get(self, opportunity_id):
+        return self.snapshot().get(opportunity_id)
+
+    def find(self, *args, **kwargs):
+        return self.snapshot().find(*args, **kwargs)
+
+    def score_one(self, *args, **kwargs):
+        return self.snapshot().score_one(*args, **kwargs)
+
+    def scored(self, *args, **kwargs):
+        return self.snapshot().scored(*args, **kwargs)
+
+    def search(self, *args, **kwargs):
+        return self.snapshot().search(*args, **kwargs)
+
+    def subscribe(self, listener):
+        """Call listener(previous, current) after every change; either side is None for an add or a removal"""
+        self._listeners.append(listener)
+
+    def apply(self, upserts=(), removals=()):
+        """Apply a batch of upserts and removals as one new snapshot; returns the (previous, current) changes.
+
+        If any row fails validation nothing is published.
+        """
+        with self._write_lock:
+            draft = self._snapshot.copy()
+            changes = [draft.upsert(opportunity) for opportunity in upserts]
+            for opportunity_id in removals:
+                previous = draft.remove(opportunity_id)
+                if previous is not None:
+                    changes.append((previous, None))
+            self._snapshot = draft
+            self._caught_up()
+            for previous, current in changes:
+                for listener in self._listeners:
+                    listener(previous, current)
+            return changes
+
+    def _caught_up(self):
+        # A batch CatalogEditor just wrote to the store moves its version on by one; anything more
+        # came from another process, and is left for refresh() to load
+        if self.store is not None:
+            version = self.store.version()
+            if version == self._store_version + 1:
+                self._store_version = version
+
+    def upsert(self, opportunity):
+        """Add or replace one opportunity; returns the record as stored"""
+        return self.apply(upserts=[opportunity])[0][1]
+
+    def remove(self, opportunity_id):
+        """Drop an opportunity from the catalog; returns False if we never had it"""
+        return bool(self.apply(removals=[opportunity_id]))
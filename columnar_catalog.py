@@ -0,0 +1,919 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+The catalog as columns: numpy arrays and string arenas instead of one model object per opportunity
+
+A VolunteerOpportunity, with its strings, tuple and floats, takes a few
+kilobytes of Python objects. Here an opportunity is one slot in a few dozen
+arrays. Its causes are a bitmask. Its organization, location, date, time and
+picture are ids into dictionaries that hold each distinct value once. Its
+event times and coordinates are numbers, and its own text (id, title,
+description, sign-up link) is a byte range in one arena. Searches scan the
+arrays with numpy. Only the rows that end up in results are turned back
+into VolunteerOpportunity models.
+
+shared_catalog.py writes these same arrays to a file that worker processes map.
+"""
+
+import math
+import threading
+from bisect import bisect_left
+from datetime import date, datetime
+from hashlib import blake2b
+
+import numpy as np
+
+from batch_matcher import haversine_km_array
+from catalog_index import CATEGORY_BITS, Match, OpportunityCatalog, category_mask
+from data_models import InterestCategory, ScoringWeights, VolunteerOpportunity
+from gazetteer import Gazetteer
+from geo_index import EARTH_RADIUS_KM
+from result_cache import LRUCache
+from schedule import MINUTES_PER_DAY, availability_windows, event_interval, from_moment, overlaps_any, timestamp
+from text_index import TextIndex, tokenize
+
+MISSING = -1  # dictionary code of an optional field that isn't set, and the day/time of an undated row
+
+# Each row's own strings, back to back in the text arena
+TEXT_FIELDS = ("id", "title", "description", "registration_link")
+
+# Fields with few distinct values, stored once in a dictionary and referred to by code
+DICTIONARY_FIELDS = ("organization", "location", "date", "time", "image_url")
+
+# One value per catalog position
+COLUMNS = {
+    "live": np.bool_,  # False once the opportunity is removed (positions are never reused)
+    "id_hashes": np.uint64,
+    "versions": np.int64,
+    "masks": np.uint16,  # causes as CATEGORY_BITS
+    "category_codes": np.int32,  # the causes in their original order, from category_sets
+    "organization_codes": np.int32,
+    "location_codes": np.int32,
+    "date_codes": np.int32,
+    "time_codes": np.int32,
+    "image_url_codes": np.int32,
+    "given_latitudes": np.float64,  # the coordinates the organizer gave (nan if none)
+    "given_longitudes": np.float64,
+    "latitudes": np.float64,  # where we put it on the map: given, or the middle of its place (nan if neither)
+    "longitudes": np.float64,
+    "stored_scores": np.float64,
+    "starts": np.int64,  # event start and end timestamps (MISSING if undated)
+    "ends": np.int64,
+    "days": np.int32,  # day number of the start (MISSING if undated)
+    "place_codes": np.int32,  # resolved place, from places (MISSING if the gazetteer doesn't know it)
+    "lengths": np.float32,  # weighted word count, for BM25
+}
+
+# Rows materialized per snapshot and kept around (results, recommendations, fragments)
+ROW_CACHE_SIZE = 4096
+
+# Rows written since the postings arrays were built are searched from a small side table; the arrays
+# are rebuilt once that holds more than this share of the catalog (and at least RECENT_POSTINGS_MIN rows)
+RECENT_POSTINGS_SHARE = 1 / 64
+RECENT_POSTINGS_MIN = 256
+POSTING_ARRAYS = ("term_offsets", "term_data", "posting_offsets", "posting_positions", "posting_frequencies")
+
+# The text arena is compacted once bytes no live row points to are over half of it (and at least this many)
+COMPACT_MIN_BYTES = 1 << 20
+
+# Shared causes for every possible combination of cause bits
+SHARED_CAUSES = np.array([bin(mask).count("1") for mask in range(1 << len(CATEGORY_BITS))], dtype=np.float64)
+
+# First guess at how far away the closest results are; the search band widens fourfold until it holds them
+NEAREST_START_KM = 25.0
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+def id_hash(opportunity_id):
+    return int.from_bytes(blake2b(opportunity_id.encode("utf-8"), digest_size=8).digest(), "little")
+
+class StringArena:
+    """Strings stored back to back in one byte array: string i is data[offsets[i]:offsets[i + 1]]"""
+
+    def __init__(self, offsets=None, data=None):
+        self.offsets = offsets if offsets is not None else np.zeros(1, dtype=np.int64)
+        self.data = data if data is not None else np.zeros(0, dtype=np.uint8)
+
+    @classmethod
+    def of(cls, strings):
+        return cls().extended(strings)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def raw(self, index):
+        return self.data[self.offsets[index]:self.offsets[index + 1]].tobytes()
+
+    def __getitem__(self, index):
+        return self.raw(index).decode("utf-8")
+
+    def __iter__(self):
+        return (self[index] for index in range(len(self)))
+
+    def extended(self, strings):
+        """A new arena with strings added at the end"""
+        encoded = [text.encode("utf-8") for text in strings]
+        if not encoded:
+            return self
+        lengths = np.fromiter((len(text) for text in encoded), dtype=np.int64, count=len(encoded))
+        offsets = np.concatenate([self.offsets, self.offsets[-1] + np.cumsum(lengths)])
+        data = np.concatenate([self.data, np.frombuffer(b"".join(encoded), dtype=np.uint8)])
+        return StringArena(offsets, data)
+
+    def inserted(self, indexes, strings):
+        """A new arena with strings[i] placed before the string now at indexes[i] (indexes ascending)"""
+        encoded = [text.encode("utf-8") for text in strings]
+        lengths = np.fromiter((len(text) for text in encoded), dtype=np.int64, count=len(encoded))
+        data = np.insert(self.data, np.repeat(self.offsets[indexes], lengths),
+                         np.frombuffer(b"".join(encoded), dtype=np.uint8))
+        sizes = np.insert(np.diff(self.offsets), indexes, lengths)
+        return StringArena(np.concatenate([[0], np.cumsum(sizes)]).astype(np.int64), data)
+
+    def find(self, text):
+        """Index of text in an arena sorted by bytes, or None"""
+        key = text.encode("utf-8")
+        low, high = 0, len(self)
+        while low < high:
+            middle = (low + high) // 2
+            if self.raw(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low if low < len(self) and self.raw(low) == key else None
+
+class Dictionary:
+    """The distinct values of a field, each stored once and referred to by its index"""
+
+    def __init__(self, arena=None):
+        self.arena = arena or StringArena()
+        self._codes = None  # value -> code, built the first time a value is added
+
+    def __len__(self):
+        return len(self.arena)
+
+    def __getitem__(self, code):
+        return None if code == MISSING else self.arena[code]
+
+    def codes(self):
+        if self._codes is None:
+            self._codes = {value: code for code, value in enumerate(self.arena)}
+        return self._codes
+
+    def intern(self, values):
+        """(a dictionary that also holds values, their codes); self if every value was already here"""
+        codes = self.codes()
+        added = {}
+        result = []
+        for value in values:
+            if value is None:
+                result.append(MISSING)
+                continue
+            code = codes.get(value)
+            if code is None:
+                code = added.setdefault(value, len(codes) + len(added))
+            result.append(code)
+        if not added:
+            return self, result
+        grown = Dictionary(self.arena.extended(list(added)))
+        grown._codes = {**codes, **added}
+        return grown, result
+
+class _Tail:
+    """Storage with room to grow, shared by snapshots that each see base[:their length].
+
+    Writing past a snapshot's end can't change what that snapshot sees, so
+    the snapshot that has filled the storage furthest (used == its length)
+    appends in place; any other has to copy.
+    """
+
+    def __init__(self, base, used):
+        self.base = base
+        self.used = used
+
+def _room(array, tail, count):
+    """(tail, array with room for count rows), appending in place when tail allows and copying otherwise.
+
+    Pass tail=None when rows array already has are going to change. New rows come zeroed.
+    """
+    if tail is not None and tail.used == len(array) and count <= len(tail.base):
+        tail.base[len(array):count] = 0
+        tail.used = count
+        return tail, tail.base[:count]
+    capacity = len(tail.base) if tail is not None else len(array)
+    if count > capacity:
+        capacity = max(count, 2 * capacity, 64)  # doubling keeps appends O(1) amortized
+    base = np.zeros((capacity,) + array.shape[1:], dtype=array.dtype)
+    base[:len(array)] = array
+    return _Tail(base, count), base[:count]
+
+class _Rows:
+    """catalog position -> VolunteerOpportunity, put together from the columns when first asked for"""
+
+    def __init__(self, snapshot, cached=()):
+        self._snapshot = snapshot
+        self._cache = LRUCache(max_size=ROW_CACHE_SIZE)
+        for position, row in cached:
+            self._cache.put(position, row)
+
+    def __len__(self):
+        return len(self._snapshot)
+
+    def __iter__(self):
+        return iter(np.flatnonzero(self._snapshot.arrays["live"]).tolist())
+
+    def __contains__(self, position):
+        live = self._snapshot.arrays["live"]
+        return isinstance(position, (int, np.integer)) and 0 <= position < len(live) and bool(live[position])
+
+    def __getitem__(self, position):
+        position = int(position)
+        if position not in self:
+            raise KeyError(position)
+        row = self._cache.get(position)
+        if row is None:
+            row = self._snapshot.row(position)
+            self._cache.put(position, row)
+        return row
+
+    def get(self, position, default=None):
+        return self[position] if position in self else default
+
+class _Positions:
+    """opportunity id -> catalog position, by binary search over the sorted id hashes"""
+
+    def __init__(self, snapshot):
+        self._snapshot = snapshot
+
+    def __len__(self):
+        return len(self._snapshot)
+
+    def __iter__(self):
+        return (self._snapshot.text_field(position, "id") for position in self._snapshot.rows)
+
+    def get(self, opportunity_id, default=None):
+        if not isinstance(opportunity_id, str):
+            return default
+        arrays = self._snapshot.arrays
+        hashes, order = arrays["id_sorted_hashes"], arrays["id_order"]
+        wanted = np.uint64(id_hash(opportunity_id))
+        index = int(np.searchsorted(hashes, wanted))
+        # A removed opportunity that came back has two slots with the same hash, and
+        # two ids sharing a hash is astronomically unlikely, so check the row itself
+        while index < len(hashes) and hashes[index] == wanted:
+            position = int(order[index])
+            if arrays["live"][position] and self._snapshot.text_field(position, "id") == opportunity_id:
+                return position
+            index += 1
+        return default
+
+    def __getitem__(self, opportunity_id):
+        position = self.get(opportunity_id)
+        if position is None:
+            raise KeyError(opportunity_id)
+        return position
+
+    def __contains__(self, opportunity_id):
+        return self.get(opportunity_id) is not None
+
+class ColumnarSnapshot:
+    """One version of the catalog as columns, with the same search methods as CatalogSnapshot.
+
+    Like a CatalogSnapshot it never changes once published: edited() returns
+    a new snapshot. New rows and their text are appended into spare capacity
+    shared with this snapshot, which only ever reads up to its own end, so a
+    batch that only adds is amortized O(batch). A batch that rewrites
+    existing rows copies the fixed-width columns (one that only removes
+    copies just "live"). Replaced text stays in the arena as garbage until
+    it makes up over half of it, when the arena is compacted. Postings of
+    written rows sit in a side table that search merges in, and are folded
+    into the postings arrays only once it passes RECENT_POSTINGS_SHARE of
+    the catalog.
+    """
+
+    def __init__(self, meta, arrays, dictionaries=None, gazetteer=None, weights=None, version=0):
+        """meta and arrays as export() lays them out; dictionaries are read from arrays unless given"""
+        self.arrays = arrays
+        self.dictionaries = dictionaries or {  # field -> Dictionary
+            field: Dictionary(StringArena(arrays[field + "_offsets"], arrays[field + "_data"]))
+            for field in DICTIONARY_FIELDS
+        }
+        self.terms = StringArena(arrays["term_offsets"], arrays["term_data"])  # sorted by their bytes
+        self.category_sets = [tuple(InterestCategory(value) for value in causes) for causes in meta["category_sets"]]
+        self.places = list(meta["places"])
+        self.size = meta["size"]  # rows that are live
+        self.total_length = meta["total_length"]
+        self.text_garbage = meta.get("text_garbage", 0)  # arena bytes no live row points to any more
+        self.version = version
+        self.gazetteer = gazetteer or Gazetteer()
+        self.weights = weights or ScoringWeights()
+        for name in ("masks", "days", "starts", "ends", "latitudes", "longitudes", "place_codes", "location_codes"):
+            setattr(self, name, arrays[name])
+        self.rows = _Rows(self)
+        self.positions = _Positions(self)
+        self._location_matches = LRUCache(max_size=256)  # lowercased location text -> location codes containing it
+        self._place_codes = None
+        self._vocabulary = None
+        self._tails = {}  # array name -> _Tail its storage can grow into
+        self._recent = {}  # position -> {term: weight} for rows written since the postings arrays were built
+        self._stale = np.zeros(0, dtype=np.int64)  # sorted positions whose entries in the postings arrays are out of date
+
+    @classmethod
+    def build(cls, opportunities=(), gazetteer=None, weights=None):
+        """A snapshot holding opportunities (dicts or VolunteerOpportunity), in that order"""
+        meta = {"size": 0, "total_length": 0.0, "text_garbage": 0, "category_sets": [], "places": []}
+        arrays = {name: np.zeros(0, dtype=dtype) for name, dtype in COLUMNS.items()}
+        arrays.update(
+            text_offsets=np.zeros((0, len(TEXT_FIELDS) + 1), dtype=np.int64), text_data=np.zeros(0, dtype=np.uint8),
+            term_offsets=np.zeros(1, dtype=np.int64), term_data=np.zeros(0, dtype=np.uint8),
+            posting_offsets=np.zeros(1, dtype=np.int64), posting_positions=np.zeros(0, dtype=np.int32),
+            posting_frequencies=np.zeros(0, dtype=np.float32),
+            id_sorted_hashes=np.zeros(0, dtype=np.uint64), id_order=np.zeros(0, dtype=np.int64),
+            geo_order=np.zeros(0, dtype=np.int64), geo_latitudes=np.zeros(0, dtype=np.float64),
+        )
+        empty = cls(meta, arrays, {field: Dictionary() for field in DICTIONARY_FIELDS}, gazetteer, weights)
+        return empty.edited(upserts=opportunities)[0]
+
+    def export(self):
+        """(meta, arrays) holding everything needed to put this snapshot back together"""
+        meta = self._meta()
+        arrays = dict(self.arrays)
+        if self._recent or len(self._stale):
+            arrays.update(self._edited_postings(np.union1d(self._stale, list(self._recent)), self._recent)[0])
+        for field, dictionary in self.dictionaries.items():
+            arrays[field + "_offsets"] = dictionary.arena.offsets
+            arrays[field + "_data"] = dictionary.arena.data
+        return meta, arrays
+
+    def _meta(self):
+        return {
+            "size": self.size,
+            "total_length": self.total_length,
+            "text_garbage": self.text_garbage,
+            "category_sets": [[category.value for category in causes] for causes in self.category_sets],
+            "places": self.places,
+        }
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        # In the order opportunities were first added
+        return (self.rows[position] for position in self.rows)
+
+    def get(self, opportunity_id):
+        position = self.positions.get(opportunity_id)
+        return None if position is None else self.rows[position]
+
+    def text_field(self, position, field):
+        index = TEXT_FIELDS.index(field)
+        start, end = self.arrays["text_offsets"][position, index:index + 2]
+        return self.arrays["text_data"][start:end].tobytes().decode("utf-8")
+
+    def row(self, position):
+        """Put the opportunity at position back together as a VolunteerOpportunity"""
+        arrays = self.arrays
+        bounds = arrays["text_offsets"][position].tolist()
+        raw = self.arrays["text_data"][bounds[0]:bounds[-1]].tobytes()
+        text = {field: raw[bounds[i] - bounds[0]:bounds[i + 1] - bounds[0]].decode("utf-8")
+                for i, field in enumerate(TEXT_FIELDS)}
+        latitude, longitude, score = (arrays[name][position] for name in ("given_latitudes", "given_longitudes", "stored_scores"))
+        # Everything was validated on the way in, so skip validating it again
+        return VolunteerOpportunity.model_construct(
+            categories=self.category_sets[arrays["category_codes"][position]],
+            latitude=None if np.isnan(latitude) else float(latitude),
+            longitude=None if np.isnan(longitude) else float(longitude),
+            score=None if np.isnan(score) else float(score),
+            version=int(arrays["versions"][position]),
+            **text,
+            **{field: self.dictionaries[field][int(arrays[field + "_codes"][position])] for field in DICTIONARY_FIELDS},
+        )
+
+    def edited(self, upserts=(), removals=()):
+        """A new snapshot with a batch of upserts and removals applied, and the (previous, current) changes.
+
+        This snapshot stays as it was. An updated opportunity keeps its
+        position and new ones go on the end; a removed one leaves a dead slot
+        behind, since positions are never reused.
+        """
+        written = {}  # position -> row, for rows this batch writes
+        batch = {}  # id -> position, for rows this batch writes
+        gone = set()  # ids this batch removed
+        dead = []
+        changes = []
+        count = len(self.arrays["live"])
+        for opportunity in upserts:
+            row = opportunity if isinstance(opportunity, VolunteerOpportunity) else VolunteerOpportunity.model_validate(opportunity)
+            position = batch.get(row.id)
+            if position is not None:
+                previous = written[position]
+            else:
+                position = None if row.id in gone else self.positions.get(row.id)
+                previous = None if position is None else self.rows[position]
+                if position is None:
+                    position, count = count, count + 1
+                batch[row.id] = position
+            # A replacement always gets a newer record version than the one it replaces
+            if previous is not None and row.version <= previous.version:
+                row = row.model_copy(update={"version": previous.version + 1})
+            written[position] = row
+            changes.append((previous, row))
+        for opportunity_id in removals:
+            position = batch.pop(opportunity_id, None)
+            if position is None and opportunity_id not in gone:
+                position = self.positions.get(opportunity_id)
+            if position is None:
+                continue
+            gone.add(opportunity_id)
+            previous = written.pop(position, None) or self.rows[position]
+            dead.append(position)
+            changes.append((previous, None))
+
+        existing = len(self.arrays["live"])
+        rewritten = [position for position in written if position < existing]
+        removed_existing = [position for position in dead if position < existing]
+        tails = dict(self._tails)
+        arrays = {}
+        for name in (*COLUMNS, "text_offsets"):
+            in_place = not rewritten and not (name == "live" and removed_existing)
+            tails[name], arrays[name] = _room(self.arrays[name], self._tails.get(name) if in_place else None, count)
+        arrays["text_data"] = self.arrays["text_data"]
+        dictionaries = dict(self.dictionaries)
+        meta = self._meta()
+        # The old text of rewritten and removed rows is never read again
+        replaced = np.array(rewritten + removed_existing, dtype=np.int64)
+        old_offsets = self.arrays["text_offsets"][replaced]
+        meta["text_garbage"] += int((old_offsets[:, -1] - old_offsets[:, 0]).sum())
+        frequencies = {}
+        if written:
+            positions = np.fromiter(written, dtype=np.int64, count=len(written))
+            rows = list(written.values())
+            for field in DICTIONARY_FIELDS:
+                dictionaries[field], codes = dictionaries[field].intern([getattr(row, field) for row in rows])
+                arrays[field + "_codes"][positions] = codes
+            self._write_rows(arrays, tails, meta, positions, rows, frequencies)
+        removed = np.array(dead, dtype=np.int64)
+        arrays["live"][removed] = False
+        recent = dict(self._recent)
+        for position in dead:
+            recent.pop(position, None)
+        recent.update(frequencies)
+        stale = np.union1d(self._stale, replaced)
+        vocabulary = self._vocabulary
+        if len(recent) + len(stale) > max(RECENT_POSTINGS_MIN, count * RECENT_POSTINGS_SHARE):
+            # Fold the side table into the arrays: O(catalog), once every so many edited rows
+            postings, vocabulary = self._edited_postings(np.union1d(stale, list(recent)), recent)
+            arrays.update(postings)
+            recent, stale = {}, np.zeros(0, dtype=np.int64)
+        else:
+            arrays.update((name, self.arrays[name]) for name in POSTING_ARRAYS)
+        positions = positions if written else np.zeros(0, dtype=np.int64)
+        arrays.update(self._edited_ids(arrays, positions))
+        arrays.update(self._edited_geo(arrays, np.concatenate([positions, removed])))
+
+        if meta["text_garbage"] >= max(COMPACT_MIN_BYTES, len(arrays["text_data"]) // 2):
+            arrays["text_offsets"], arrays["text_data"] = _compacted_text(arrays["text_offsets"], arrays["text_data"], arrays["live"])
+            tails["text_offsets"] = _Tail(arrays["text_offsets"], len(arrays["text_offsets"]))
+            tails["text_data"] = _Tail(arrays["text_data"], len(arrays["text_data"]))
+            meta["text_garbage"] = 0
+
+        live = arrays["live"]
+        meta["size"] = int(np.count_nonzero(live))
+        meta["total_length"] = float(arrays["lengths"][live].sum(dtype=np.float64))
+        snapshot = ColumnarSnapshot(meta, arrays, dictionaries, self.gazetteer, self.weights, self.version + len(changes))
+        snapshot.rows = _Rows(snapshot, written.items())
+        snapshot._vocabulary = vocabulary
+        snapshot._tails = tails
+        snapshot._recent, snapshot._stale = recent, stale
+        return snapshot, changes
+
+    def _write_rows(self, arrays, tails, meta, positions, rows, frequencies):
+        """Fill the columns of the rows at positions, collecting their term frequencies"""
+        category_sets = {tuple(causes): code for code, causes in enumerate(meta["category_sets"])}
+        places = {place_id: code for code, place_id in enumerate(meta["places"])}
+        values = {name: [] for name in ("id_hashes", "versions", "masks", "category_codes", "given_latitudes", "given_longitudes",
+                                        "latitudes", "longitudes", "stored_scores", "starts", "ends", "place_codes", "lengths")}
+        texts = []
+        for position, row in zip(positions.tolist(), rows):
+            causes = [category.value for category in row.categories]
+            values["id_hashes"].append(id_hash(row.id))
+            values["versions"].append(row.version)
+            values["masks"].append(category_mask(row.categories))
+            values["category_codes"].append(category_sets.setdefault(tuple(causes), len(category_sets)))
+            given = (row.latitude, row.longitude) if row.latitude is not None and row.longitude is not None else None
+            values["given_latitudes"].append(np.nan if row.latitude is None else row.latitude)
+            values["given_longitudes"].append(np.nan if row.longitude is None else row.longitude)
+            values["stored_scores"].append(np.nan if row.score is None else row.score)
+            place_id = self.gazetteer.resolve(row.location)
+            values["place_codes"].append(MISSING if place_id is None else places.setdefault(place_id, len(places)))
+            # Exact coordinates when the organizer gave them, otherwise the middle of the place we resolved
+            point = given or (self.gazetteer.center(place_id) if place_id else None)
+            values["latitudes"].append(np.nan if point is None else point[0])
+            values["longitudes"].append(np.nan if point is None else point[1])
+            interval = event_interval(row.date, row.time) or (MISSING, MISSING)
+            values["starts"].append(interval[0])
+            values["ends"].append(interval[1])
+            frequencies[position] = TextIndex.frequencies(row)
+            values["lengths"].append(sum(frequencies[position].values()))
+            texts.append([getattr(row, field) for field in TEXT_FIELDS])
+
+        for name, column in values.items():
+            arrays[name][positions] = np.array(column, dtype=COLUMNS[name])
+        starts = arrays["starts"][positions]
+        arrays["days"][positions] = np.where(starts >= 0, starts // MINUTES_PER_DAY, MISSING)
+        arrays["live"][positions] = True
+        meta["category_sets"] = [list(causes) for causes in category_sets]
+        meta["places"] = list(places)
+
+        # Each row's strings go on the end of the arena; an updated row's old bytes are left behind as garbage
+        encoded = [[text.encode("utf-8") for text in row] for row in texts]
+        lengths = np.array([[len(text) for text in row] for row in encoded], dtype=np.int64).reshape(len(rows), len(TEXT_FIELDS))
+        start = len(self.arrays["text_data"])
+        ends = start + np.cumsum(lengths.reshape(-1)).reshape(lengths.shape)
+        arrays["text_offsets"][positions] = np.concatenate([ends[:, :1] - lengths[:, :1], ends], axis=1)
+        added = np.frombuffer(b"".join(b"".join(row) for row in encoded), dtype=np.uint8)
+        tails["text_data"], arrays["text_data"] = _room(self.arrays["text_data"], self._tails.get("text_data"), start + len(added))
+        arrays["text_data"][start:] = added
+
+    def _edited_postings(self, touched, frequencies):
+        """The postings arrays with touched positions' entries replaced by frequencies ({position: {term: weight}}).
+
+        Also returns the new vocabulary. Terms stay sorted (Python orders
+        strings the way their UTF-8 bytes sort), and new ones are spliced in.
+        """
+        offsets = self.arrays["posting_offsets"]
+        positions, weights = self.arrays["posting_positions"], self.arrays["posting_frequencies"]
+        vocabulary = self._terms_list()
+        term_ids = np.repeat(np.arange(len(vocabulary), dtype=np.int64), np.diff(offsets))
+        if len(touched):
+            keep = ~np.isin(positions, touched)
+            term_ids, positions, weights = term_ids[keep], positions[keep], weights[keep]
+
+        new_terms = sorted({term for terms in frequencies.values() for term in terms if not _holds(vocabulary, term)})
+        terms = self.terms
+        if new_terms:
+            at = np.array([bisect_left(vocabulary, term) for term in new_terms], dtype=np.int64)
+            # Every old term moves up by the number of new terms sorting before it
+            term_ids = term_ids + np.searchsorted(at, term_ids, side="right")
+            terms = terms.inserted(at, new_terms)
+            merged = []
+            previous = 0
+            for index, term in zip(at.tolist(), new_terms):
+                merged.extend(vocabulary[previous:index])
+                merged.append(term)
+                previous = index
+            merged.extend(vocabulary[previous:])
+            vocabulary = merged
+
+        added = [(bisect_left(vocabulary, term), position, weight)
+                 for position, terms_of_row in frequencies.items() for term, weight in terms_of_row.items()]
+        if added:
+            added_terms, added_positions, added_weights = (np.array(column) for column in zip(*added))
+            order = np.lexsort((added_positions, added_terms))
+            added_terms, added_positions, added_weights = added_terms[order], added_positions[order], added_weights[order]
+            # Both runs are sorted by (term, position), so the new entries slot straight in
+            at = np.searchsorted((term_ids << 32) | positions, (added_terms << 32) | added_positions)
+            term_ids = np.insert(term_ids, at, added_terms)
+            positions = np.insert(positions, at, added_positions.astype(np.int32))
+            weights = np.insert(weights, at, added_weights.astype(np.float32))
+        posting_offsets = np.searchsorted(term_ids, np.arange(len(vocabulary) + 1)).astype(np.int64)
+        return {
+            "term_offsets": terms.offsets, "term_data": terms.data, "posting_offsets": posting_offsets,
+            "posting_positions": positions.astype(np.int32), "posting_frequencies": weights.astype(np.float32),
+        }, vocabulary
+
+    def _terms_list(self):
+        """The vocabulary as a list, for bisecting while editing"""
+        if self._vocabulary is None:
+            self._vocabulary = list(self.terms)
+        return self._vocabulary
+
+    def _edited_ids(self, arrays, positions):
+        """The id lookup arrays with the rows at new positions added"""
+        hashes, order = self.arrays["id_sorted_hashes"], self.arrays["id_order"]
+        new = positions[positions >= len(self.arrays["live"])]
+        new = new[arrays["live"][new]]
+        if len(new):
+            added = arrays["id_hashes"][new]
+            sort = np.argsort(added, kind="stable")
+            at = np.searchsorted(hashes, added[sort], side="right")
+            hashes, order = np.insert(hashes, at, added[sort]), np.insert(order, at, new[sort])
+        return {"id_sorted_hashes": hashes, "id_order": order}
+
+    def _edited_geo(self, arrays, changed):
+        """The latitude-sorted map arrays with the rows at changed positions taken out and put back where they now belong"""
+        order, latitudes = self.arrays["geo_order"], self.arrays["geo_latitudes"]
+        if not len(changed):
+            return {"geo_order": order, "geo_latitudes": latitudes}
+        keep = ~np.isin(order, changed)
+        order, latitudes = order[keep], latitudes[keep]
+        added = np.unique(changed)
+        added = added[arrays["live"][added] & ~np.isnan(arrays["latitudes"][added])]
+        added_latitudes = arrays["latitudes"][added]
+        sort = np.argsort(added_latitudes, kind="stable")
+        at = np.searchsorted(latitudes, added_latitudes[sort], side="right")
+        return {"geo_order": np.insert(order, at, added[sort]), "geo_latitudes": np.insert(latitudes, at, added_latitudes[sort])}
+
+    def _latitude_band(self, latitude, km):
+        """Positions on the map less than km north or south of latitude (nothing outside is within km of a point there)"""
+        span = math.degrees(km / EARTH_RADIUS_KM)
+        latitudes = self.arrays["geo_latitudes"]
+        low = np.searchsorted(latitudes, latitude - span, side="left")
+        high = np.searchsorted(latitudes, latitude + span, side="right")
+        return self.arrays["geo_order"][low:high]
+
+    def _within(self, selected, near, radius_km):
+        """Selected positions within radius_km of near, in catalog order"""
+        candidates = self._latitude_band(near[0], radius_km)
+        candidates = np.sort(candidates[selected[candidates]])
+        distances = haversine_km_array(near[0], near[1], self.latitudes[candidates], self.longitudes[candidates])
+        return candidates[distances <= radius_km]
+
+    def _nearest(self, selected, near, k):
+        """The k selected positions on the map closest to near, closest first (ties to the earlier position)"""
+        km = NEAREST_START_KM
+        while True:
+            band = self._latitude_band(near[0], km)
+            candidates = np.sort(band[selected[band]])
+            everything = len(band) == len(self.arrays["geo_order"])
+            if len(candidates) >= k or everything:
+                distances = haversine_km_array(near[0], near[1], self.latitudes[candidates], self.longitudes[candidates])
+                picked = _first(distances, candidates, k)
+                # Anything outside the band is more than km away, so a k-th best inside km can't be beaten
+                if everything or distances[picked[-1]] <= km:
+                    return candidates[picked]
+            km *= 4
+
+    def find(self, interests, location=None, max_results=None, near=None, radius_km=None, weights=None, today=None,
+             availability=None, upcoming=False, now=None):
+        """The same results as CatalogSnapshot.find, worked out over the whole columns at once.
+
+        Searches around a point only measure distances to rows in a band of
+        latitude around it, found by bisecting the latitude-sorted index.
+        """
+        wanted, place_id, origin, weights, today = self._prepare(interests, location, near, weights, today)
+        selected = self._selected(wanted, location, place_id, availability, upcoming, now, today)
+
+        if near is not None and radius_km is None:
+            candidates = self._nearest(selected, near, max_results or 5)
+        elif near is not None:
+            candidates = self._within(selected, near, radius_km)
+        else:
+            candidates = np.flatnonzero(selected)
+        scores, distances = self._scores(candidates, wanted, origin, weights, today)
+        if near is None or radius_km is not None:
+            picked = _first(-scores, candidates, max_results)
+            candidates, scores = candidates[picked], scores[picked]
+            distances = None if distances is None else distances[picked]
+        return [self.materialize(entry) for entry in _entries(candidates, scores, distances)]
+
+    def scored(self, interests, location=None, near=None, radius_km=None, weights=None, today=None,
+               availability=None, upcoming=False, now=None):
+        """Yield (sort key, entry) for everything find() could return, in catalog order.
+
+        Entries are (position, score, distance) tuples; materialize() turns the
+        ones that end up on a page into Matches, so ranking a broad search
+        never builds rows nobody looks at.
+        """
+        wanted, place_id, origin, weights, today = self._prepare(interests, location, near, weights, today)
+        selected = self._selected(wanted, location, place_id, availability, upcoming, now, today)
+        by_distance = near is not None and radius_km is None
+        if by_distance:
+            selected &= ~np.isnan(self.latitudes)
+        candidates = self._within(selected, near, radius_km) if near is not None and not by_distance else np.flatnonzero(selected)
+        scores, distances = self._scores(candidates, wanted, origin, weights, today)
+        for entry in _entries(candidates, scores, distances):
+            position, score, distance = entry
+            yield ((distance, position) if by_distance else (-score, position)), entry
+
+    def materialize(self, entry):
+        """The Match for an entry scored() yielded"""
+        position, score, distance = entry
+        return Match(self.rows[position], score, distance)
+
+    def search(self, query, interests=None, location=None, max_results=10):
+        """Opportunities whose title, organization or description match the query, best BM25 score first"""
+        scores = np.zeros(len(self.masks))
+        if self.size:
+            average_length = self.total_length / self.size or 1.0
+            base = BM25_K1 * (1 - BM25_B)
+            slope = BM25_K1 * BM25_B / average_length
+            for term in set(tokenize(query)):
+                positions, frequencies = self._postings(term)
+                matching = len(positions)
+                if not matching:
+                    continue
+                idf = np.log(1 + (self.size - matching + 0.5) / (matching + 0.5))
+                lengths = self.arrays["lengths"][positions].astype(np.float64)
+                scores[positions] += idf * (BM25_K1 + 1) * frequencies / (frequencies + base + slope * lengths)
+        selected = scores > 0
+        if interests:
+            selected &= (self.masks & category_mask(interests)) != 0
+        if location:
+            selected &= self._location_mask(location, self.gazetteer.resolve(location))
+        candidates = np.flatnonzero(selected)
+        picked = _first(-scores[candidates], candidates, max_results)
+        return [Match(self.rows[position], float(score))
+                for position, score in zip(candidates[picked].tolist(), scores[candidates[picked]].tolist())]
+
+    def _postings(self, term):
+        """(positions, weights) of the live rows containing term: the postings arrays plus rows written since"""
+        index = self.terms.find(term)
+        if index is None:
+            positions, weights = np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float64)
+        else:
+            start, end = self.arrays["posting_offsets"][index:index + 2]
+            positions = self.arrays["posting_positions"][start:end].astype(np.int64)
+            weights = self.arrays["posting_frequencies"][start:end].astype(np.float64)
+            if len(self._stale):
+                fresh = ~np.isin(positions, self._stale, assume_unique=True)
+                positions, weights = positions[fresh], weights[fresh]
+        added = [(position, terms[term]) for position, terms in self._recent.items() if term in terms]
+        if added:
+            positions = np.concatenate([positions, np.array([position for position, _ in added], dtype=np.int64)])
+            weights = np.concatenate([weights, np.array([weight for _, weight in added], dtype=np.float64)])
+        return positions, weights
+
+    def score_one(self, opportunity_id, interests, location=None, weights=None, today=None,
+                  availability=None, upcoming=False, now=None):
+        """The Match find() would give this opportunity, or None if it wouldn't list it"""
+        position = self.positions.get(opportunity_id)
+        if position is None:
+            return None
+        wanted, place_id, origin, weights, today = self._prepare(interests, location, None, weights, today)
+        if not self.masks[position] & wanted:
+            return None
+        if availability or upcoming:
+            start, end = int(self.starts[position]), int(self.ends[position])
+            moment = timestamp(now or datetime.now())
+            if upcoming and start >= 0 and end <= moment:
+                return None
+            windows = availability_windows(availability, date.fromordinal(today)) if availability else None
+            if windows is not None:
+                if upcoming:
+                    windows = from_moment(windows, moment)
+                if start < 0 or not overlaps_any((start, end), windows):
+                    return None
+        if location and not self._row_in_location(position, location, place_id):
+            return None
+        candidates = np.array([position])
+        scores, distances = self._scores(candidates, wanted, origin, weights, today)
+        return self.materialize(next(_entries(candidates, scores, distances)))
+
+    def columns(self):
+        """Per-row arrays for vectorized scoring (see CatalogSnapshot.columns)"""
+        live = self.arrays["live"]
+        if self.size == len(live):
+            # Nothing removed: hand out the columns themselves
+            return {"positions": np.arange(len(live), dtype=np.int64), "masks": self.masks, "days": self.days,
+                    "latitudes": self.latitudes, "longitudes": self.longitudes}
+        positions = np.flatnonzero(live)
+        return {"positions": positions, "masks": self.masks[positions], "days": self.days[positions],
+                "latitudes": self.latitudes[positions], "longitudes": self.longitudes[positions]}
+
+    def value_counts(self, field):
+        """{value: how many opportunities have it} for one of DICTIONARY_FIELDS, counted on its codes"""
+        dictionary = self.dictionaries[field]
+        codes = self.arrays[field + "_codes"][self.arrays["live"]]
+        counts = np.bincount(codes[codes != MISSING])
+        return {dictionary[code]: int(counts[code]) for code in np.flatnonzero(counts).tolist()}
+
+    def location_mask(self, location, positions):
+        """For each of positions (from columns()), whether find() counts it as inside location"""
+        return self._location_mask(location, self.gazetteer.resolve(location))[positions]
+
+    def happening_during(self, windows, positions):
+        """For each of positions (from columns()), whether it overlaps one of the (sorted, merged) windows"""
+        return self._happening_during(windows)[positions]
+
+    def _happening_during(self, windows):
+        if not windows:
+            return np.zeros(len(self.starts), dtype=bool)
+        window_starts = np.array([start for start, _ in windows], dtype=np.int64)
+        window_ends = np.array([end for _, end in windows], dtype=np.int64)
+        # Merged windows don't overlap, so the last one starting before a row ends is the only candidate
+        index = np.searchsorted(window_starts, self.ends, side="left") - 1
+        found = (index >= 0) & (self.starts >= 0)
+        found[found] = window_ends[index[found]] > self.starts[found]
+        return found
+
+    def _prepare(self, interests, location, near, weights, today):
+        place_id = self.gazetteer.resolve(location) if location else None
+        origin = near if near is not None else (self.gazetteer.center(place_id) if place_id else None)
+        return category_mask(interests), place_id, origin, weights or self.weights, (today or date.today()).toordinal()
+
+    def _selected(self, wanted, location, place_id, availability, upcoming, now, today):
+        selected = ((self.masks & wanted) != 0) & self.arrays["live"]
+        if location:
+            selected &= self._location_mask(location, place_id)
+        timed, cutoff = self._when(availability, upcoming, now, today)
+        if timed is not None:
+            selected &= timed
+        if cutoff is not None:
+            selected &= (self.starts < 0) | (self.ends > cutoff)
+        return selected
+
+    def _when(self, availability, upcoming, now, today):
+        """(rows happening while the user is free, or None; the moment results must still be on at, or None)"""
+        if not availability and not upcoming:
+            return None, None
+        now = timestamp(now or datetime.now())
+        windows = availability_windows(availability, date.fromordinal(today)) if availability else None
+        if windows is None:
+            return None, now if upcoming else None
+        if upcoming:
+            windows = from_moment(windows, now)
+        return self._happening_during(windows), None
+
+    def _location_mask(self, location, place_id):
+        # Like CatalogSnapshot._in_location: places the gazetteer knows by containment, the rest by substring
+        needle = location.lower()
+        codes = self._location_matches.get(needle)
+        if codes is None:
+            locations = self.dictionaries["location"]
+            codes = np.array([code for code, text in enumerate(locations.arena) if needle in text.lower()], dtype=np.int32)
+            self._location_matches.put(needle, codes)
+        mentioned = np.isin(self.location_codes, codes)
+        if place_id is None:
+            return mentioned
+        inside = [code for place, code in self._places().items() if place in self.gazetteer.descendants.get(place_id, ())]
+        return np.isin(self.place_codes, np.array(inside, dtype=np.int32)) | ((self.place_codes < 0) & mentioned)
+
+    def _row_in_location(self, position, location, place_id):
+        code = int(self.place_codes[position])
+        if place_id is not None and code >= 0:
+            return self.places[code] in self.gazetteer.descendants.get(place_id, ())
+        return location.lower() in self.dictionaries["location"][int(self.location_codes[position])].lower()
+
+    def _places(self):
+        if self._place_codes is None:
+            self._place_codes = {place_id: code for code, place_id in enumerate(self.places)}
+        return self._place_codes
+
+    def _scores(self, candidates, wanted, origin, weights, today):
+        """Scores (and distances, or None without an origin) of the candidate rows, as Scorer computes them"""
+        scores = weights.interests * SHARED_CAUSES[self.masks[candidates] & wanted]
+        distances = None
+        if origin is not None:
+            distances = haversine_km_array(origin[0], origin[1], self.latitudes[candidates], self.longitudes[candidates])
+            known = ~np.isnan(distances)
+            scores[known] += weights.proximity / (1 + distances[known] / weights.proximity_scale_km)
+        days = self.days[candidates]
+        upcoming = (days >= 0) & (days >= today)
+        scores[upcoming] += weights.recency / (1 + (days[upcoming] - today) / weights.recency_scale_days)
+        return scores, distances
+
+def _holds(vocabulary, term):
+    index = bisect_left(vocabulary, term)
+    return index < len(vocabulary) and vocabulary[index] == term
+
+def _compacted_text(offsets, data, live):
+    """(offsets, data) with only live rows' text left in the arena, in position order"""
+    offsets = offsets.copy()
+    starts, ends = offsets[live, 0], offsets[live, -1]
+    lengths = ends - starts
+    shift = starts - (np.cumsum(lengths) - lengths)
+    data = data[np.repeat(shift, lengths) + np.arange(int(lengths.sum()), dtype=np.int64)]
+    offsets[live] -= shift[:, None]
+    offsets[~live] = 0
+    return offsets, data
+
+def _first(keys, candidates, k):
+    """Indexes of the k smallest keys, ties to the smaller candidate, in that order (all of them if k is falsy)"""
+    if k and k < len(keys):
+        cut = np.partition(keys, k - 1)[k - 1]
+        kept = np.flatnonzero(keys <= cut)
+    else:
+        kept = np.arange(len(keys))
+    order = kept[np.lexsort((candidates[kept], keys[kept]))]
+    return order[:k] if k else order
+
+def _entries(candidates, scores, distances):
+    """(position, score, distance) tuples with plain Python numbers"""
+    distances = [None] * len(candidates) if distances is None else [
+        None if distance != distance else distance for distance in distances.tolist()
+    ]
+    return zip(candidates.tolist(), scores.tolist(), distances)
+
+class ColumnarCatalog(OpportunityCatalog):
+    """OpportunityCatalog over a ColumnarSnapshot: the same interface in a fraction of the memory.
+
+    Each batch of changes becomes a new snapshot through edited(), so
+    readers still see one whole version at a time.
+    """
+
+    def __init__(self, opportunities=(), gazetteer=None, weights=None):
+        self._snapshot = ColumnarSnapshot.build(opportunities, gazetteer, weights)
+        self._write_lock = threading.Lock()
+        self._listeners = []
+        self._follow(None)
+
+    def apply(self, upserts=(), removals=()):
+        """Apply a batch of upserts and removals as one new snapshot; returns the (previous, current) changes"""
+        with self._write_lock:
+            self._snapshot, changes = self._snapshot.edited(upserts, removals)
+            self._caught_up()
+            for previous, current in changes:
+                for listener in self._listeners:
+                    listener(previous, current)
+            return changes
@@ -1,5 +1,5 @@
-from pydantic import BaseModel, Field
-from typing import List, Optional
+from pydantic import BaseModel, ConfigDict, Field
+from typing import List, Optional, Tuple
 from enum import Enum
 
 # Types of volunteer opportunities users can choose from
@@ -22,26 +22,46 @@ class UserInterests(BaseModel):
     location: Optional[str] = Field(None, description="Where the user wants to volunteer")
     availability: Optional[List[str]] = Field(None, description="When the user is free to help")
 
-# Information about a volunteer opportunity
+# Information about a volunteer opportunity (read-only once validated, so the catalog can share it)
 class VolunteerOpportunity(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
     id: str = Field(..., description="Unique ID for this opportunity")
     title: str = Field(..., description="Name of the volunteer opportunity")
     organization: str = Field(..., description="Who's organizing this event")
     description: str = Field(..., description="What volunteers will be doing")
-    categories: List[InterestCategory] = Field(..., description="What causes this supports")
+    categories: Tuple[InterestCategory, ...] = Field(..., description="What causes this supports")
     location: str = Field(..., description="Where the volunteering happens")
     date: Optional[str] = Field(None, description="When it takes place")
     time: Optional[str] = Field(None, description="What time it happens")
     registration_link: str = Field(..., description="Link to sign up")
     image_url: Optional[str] = Field(None, description="Picture of the activity")
+    latitude: Optional[float] = Field(None, ge=-90, le=90, description="Where it is on the map (latitude)")
+    longitude: Optional[float] = Field(None, ge=-180, le=180, description="Where it is on the map (longitude)")
+    score: Optional[float] = Field(None, description="How well this matches the search (higher is better)")
+    version: int = Field(1, ge=1, description="Goes up every time this opportunity is changed")
 
 # What we need to find matching opportunities
 class OpportunityMatchRequest(BaseModel):
     interests: List[InterestCategory] = Field(..., description="What the user cares about")
     location: Optional[str] = Field(None, description="Where to look for opportunities")
-    max_results: Optional[int] = Field(5, description="How many results to show")
+    max_results: Optional[int] = Field(5, ge=1, description="How many results to show")
+    latitude: Optional[float] = Field(None, ge=-90, le=90, description="The user's latitude, for distance searches")
+    longitude: Optional[float] = Field(None, ge=-180, le=180, description="The user's longitude, for distance searches")
+    radius_km: Optional[float] = Field(None, gt=0, description="Only show opportunities this close; without it we show the nearest ones")
+    cursor: Optional[str] = Field(None, description="Where the previous page of results left off")
+    availability: Optional[List[str]] = Field(None, description="When the user is free, e.g. \"Saturday mornings\" or \"2023-10-20\"")
+    upcoming_only: bool = Field(False, description="Leave out opportunities that are already over")
 
 # The opportunities we found for the user
 class OpportunityMatchResponse(BaseModel):
     opportunities: List[VolunteerOpportunity] = Field(..., description="Matching volunteer opportunities")
-    match_count: int = Field(..., description="How many matches we found")
\ No newline at end of file
+    match_count: int = Field(..., description="How many matches we found")
+
+# How much each signal counts when ranking matches
+class ScoringWeights(BaseModel):
+    interests: float = Field(1.0, ge=0, description="Weight per cause the opportunity shares with the user")
+    proximity: float = Field(1.0, ge=0, description="Weight for being close to where the user is looking")
+    recency: float = Field(0.5, ge=0, description="Weight for happening soon")
+    proximity_scale_km: float = Field(10.0, gt=0, description="Distance at which the proximity bonus halves")
+    recency_scale_days: float = Field(30.0, gt=0, description="Days ahead at which the recency bonus halves")
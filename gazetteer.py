@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Offline gazetteer: turns free-text locations into canonical place ids
+"""
+
+import re
+from collections import defaultdict
+from typing import NamedTuple, Optional, Tuple
+
+# One entry in the gazetteer, from a whole region down to a single venue
+class Place(NamedTuple):
+    id: str
+    name: str
+    kind: str  # region, city, neighbourhood or venue
+    parent: Optional[str]
+    aliases: Tuple[str, ...] = ()
+    center: Optional[Tuple[float, float]] = None  # rough (latitude, longitude)
+
+# Local alias table so location matching works without calling any geocoding service.
+# Parents must be listed before their children.
+PLACES = [
+    Place("ca", "California", "region", None, ("california", "ca"), (36.7783, -119.4179)),
+    Place("ny", "New York State", "region", None, ("new york state", "ny"), (42.9538, -75.5268)),
+    Place("on", "Ontario", "region", None, ("ontario", "on"), (50.0, -85.0)),
+
+    Place("los-angeles", "Los Angeles", "city", "ca", ("los angeles", "la", "city of los angeles"), (34.0522, -118.2437)),
+    Place("downtown-la", "Downtown LA", "neighbourhood", "los-angeles", ("downtown la", "downtown los angeles", "dtla"), (34.0407, -118.2468)),
+    Place("santa-monica", "Santa Monica", "neighbourhood", "los-angeles", ("santa monica",), (34.0195, -118.4912)),
+    Place("santa-monica-beach", "Santa Monica Beach", "venue", "santa-monica", ("santa monica beach", "santa monica pier"), (34.0094, -118.4973)),
+    Place("westwood", "Westwood", "neighbourhood", "los-angeles", ("westwood", "westwood village"), (34.0561, -118.4297)),
+    Place("westwood-community-center", "Westwood Community Center", "venue", "westwood", ("westwood community center", "westwood community centre"), (34.0529, -118.4378)),
+    Place("los-feliz", "Los Feliz", "neighbourhood", "los-angeles", ("los feliz",), (34.1063, -118.2848)),
+    Place("griffith-park", "Griffith Park", "venue", "los-feliz", ("griffith park", "griffith observatory"), (34.1366, -118.2942)),
+    Place("hollywood", "Hollywood", "neighbourhood", "los-angeles", ("hollywood",), (34.0928, -118.3287)),
+    Place("venice", "Venice", "neighbourhood", "los-angeles", ("venice", "venice beach"), (33.985, -118.4695)),
+    Place("koreatown", "Koreatown", "neighbourhood", "los-angeles", ("koreatown", "ktown"), (34.0618, -118.3004)),
+    Place("echo-park", "Echo Park", "neighbourhood", "los-angeles", ("echo park",), (34.0782, -118.2606)),
+    Place("pasadena", "Pasadena", "neighbourhood", "los-angeles", ("pasadena",), (34.1478, -118.1445)),
+    Place("san-francisco", "San Francisco", "city", "ca", ("san francisco", "sf"), (37.7749, -122.4194)),
+    Place("san-diego", "San Diego", "city", "ca", ("san diego",), (32.7157, -117.1611)),
+
+    Place("new-york-city", "New York City", "city", "ny", ("new york", "new york city", "nyc"), (40.7128, -74.006)),
+    Place("manhattan", "Manhattan", "neighbourhood", "new-york-city", ("manhattan",), (40.7831, -73.9712)),
+    Place("brooklyn", "Brooklyn", "neighbourhood", "new-york-city", ("brooklyn",), (40.6782, -73.9442)),
+    Place("central-park", "Central Park", "venue", "manhattan", ("central park",), (40.7829, -73.9654)),
+
+    Place("toronto", "Toronto", "city", "on", ("toronto",), (43.6532, -79.3832)),
+    Place("downtown-toronto", "Downtown Toronto", "neighbourhood", "toronto", ("downtown toronto",), (43.6487, -79.3817)),
+]
+
+# Very short aliases ("la", "ca", "on") only count when they are a whole part of the
+# location, otherwise "Community Center on Main" would land in Ontario
+MIN_EMBEDDED_ALIAS_LENGTH = 3
+
+def normalize(text):
+    """Lowercase a location and strip punctuation so "L.A." and "la" look the same"""
+    text = text.lower().replace(".", "")
+    return " ".join(re.sub(r"[^a-z0-9]+", " ", text).split())
+
+class Gazetteer:
+    """Resolves location text to place ids and knows which places sit inside which"""
+
+    def __init__(self, places=PLACES):
+        self.places = {}
+        self.aliases = {}  # normalized alias -> place id
+        self.children = defaultdict(list)
+        for place in places:
+            if place.parent is not None and place.parent not in self.places:
+                raise ValueError(f"Place '{place.id}' is listed before its parent '{place.parent}'")
+            self.places[place.id] = place
+            if place.parent is not None:
+                self.children[place.parent].append(place.id)
+            for alias in (place.name,) + tuple(place.aliases):
+                self.aliases.setdefault(normalize(alias), place.id)
+        self._longest_alias = max(len(alias.split()) for alias in self.aliases)
+
+        # Precompute every place's subtree once, so containment is a set lookup
+        self.descendants = {}
+        for place in reversed(list(self.places.values())):
+            subtree = {place.id}
+            for child in self.children[place.id]:
+                subtree |= self.descendants[child]
+            self.descendants[place.id] = frozenset(subtree)
+
+    def resolve(self, text):
+        """Return the most specific place id mentioned in text, or None if we don't recognise it"""
+        if not text:
+            return None
+        # "Santa Monica Beach, CA": the first part that resolves is the most specific one
+        for part in text.split(","):
+            words = normalize(part).split()
+            if not words:
+                continue
+            whole = " ".join(words)
+            if whole in self.aliases:
+                return self.aliases[whole]
+            # Otherwise look for the longest alias hiding inside the part ("Los Angeles Animal Shelter")
+            for size in range(min(len(words), self._longest_alias), 0, -1):
+                for start in range(len(words) - size + 1):
+                    alias = " ".join(words[start:start + size])
+                    if len(alias) >= MIN_EMBEDDED_ALIAS_LENGTH and alias in self.aliases:
+                        return self.aliases[alias]
+        return None
+
+    def lineage(self, place_id):
+        """The place itself followed by every place that contains it"""
+        while place_id is not None:
+            yield place_id
+            place_id = self.places[place_id].parent
+
+    def contains(self, outer_id, inner_id):
+        return inner_id in self.descendants.get(outer_id, ())
+
+    def name(self, place_id):
+        return self.places[place_id].name
+
+    def center(self, place_id):
+        return self.places[place_id].center if place_id in self.places else None
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Grid-bucket spatial index for "within 10 km" and "the 5 closest" searches
+"""
+
+import heapq
+import math
+
+from paged_dict import PagedDict
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = 111.32
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance between two points in kilometres"""
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+class GeoGridIndex:
+    """Buckets points into fixed-size lat/lon cells so a search only visits nearby cells"""
+
+    def __init__(self, cell_degrees=0.05):
+        self.cell_degrees = cell_degrees
+        self.points = PagedDict()  # key -> (latitude, longitude)
+        self.cells = PagedDict()  # (row, column) -> keys in that cell
+        # (min row, max row, min column, max column) bounding every occupied cell, or None when empty.
+        # It only grows as points are added, so after removals it can be wider than it needs to be.
+        self.extent = None
+        self._owned = None  # cells this copy may change in place (None: all of them)
+
+    def __len__(self):
+        return len(self.points)
+
+    def copy(self):
+        """A copy that shares cell sets with this index until it changes them"""
+        clone = GeoGridIndex.__new__(GeoGridIndex)
+        clone.cell_degrees = self.cell_degrees
+        clone.points = self.points.copy()
+        clone.cells = self.cells.copy()
+        clone.extent = self.extent
+        clone._owned = set()
+        return clone
+
+    def _writable(self, cell):
+        # Copy a shared cell set the first time this index changes it
+        keys = self.cells.get(cell)
+        if keys is None or (self._owned is not None and cell not in self._owned):
+            keys = self.cells[cell] = set(keys or ())
+            if self._owned is not None:
+                self._owned.add(cell)
+        return keys
+
+    def _cell(self, latitude, longitude):
+        return (math.floor(latitude / self.cell_degrees), math.floor(longitude / self.cell_degrees))
+
+    def add(self, key, latitude, longitude):
+        self.remove(key)
+        self.points[key] = (latitude, longitude)
+        row, column = cell = self._cell(latitude, longitude)
+        self._writable(cell).add(key)
+        if self.extent is None:
+            self.extent = (row, row, column, column)
+        else:
+            min_row, max_row, min_column, max_column = self.extent
+            if not (min_row <= row <= max_row and min_column <= column <= max_column):
+                self.extent = (min(min_row, row), max(max_row, row), min(min_column, column), max(max_column, column))
+
+    def remove(self, key):
+        point = self.points.pop(key, None)
+        if point is None:
+            return
+        cell = self._cell(*point)
+        keys = self._writable(cell)
+        keys.discard(key)
+        if not keys:
+            del self.cells[cell]
+            if not self.cells:
+                self.extent = None
+
+    def within(self, latitude, longitude, radius_km):
+        """Return {key: distance_km} for every point within radius_km"""
+        lat_span = radius_km / KM_PER_DEGREE
+        lon_span = radius_km / (KM_PER_DEGREE * max(math.cos(math.radians(min(89.9, abs(latitude) + lat_span))), 1e-6))
+        min_row, min_column = self._cell(latitude - lat_span, longitude - lon_span)
+        max_row, max_column = self._cell(latitude + lat_span, longitude + lon_span)
+
+        found = {}
+        for row in range(min_row, max_row + 1):
+            for column in range(min_column, max_column + 1):
+                for key in self.cells.get((row, column), ()):
+                    distance = haversine_km(latitude, longitude, *self.points[key])
+                    if distance <= radius_km:
+                        found[key] = distance
+        return found
+
+    def nearest(self, latitude, longitude, k, accept=None, available=None):
+        """Return up to k (distance_km, key) pairs, closest first, skipping keys accept() rejects.
+
+        Searches outward one ring of cells at a time and stops as soon as no
+        unvisited cell could hold anything closer than the k-th best so far,
+        or, when accept() can let at most `available` keys through, once it
+        has let that many through. Once a ring would have more cells than are
+        occupied (points clustered in a few cities, far apart), the occupied
+        cells left are visited directly instead, nearest ring first. Keys
+        must be numbers here; ties in distance go to the smaller key.
+        """
+        if k <= 0 or self.extent is None or available == 0:
+            return []
+        center_row, center_column = self._cell(latitude, longitude)
+        min_row, max_row, min_column, max_column = self.extent
+        max_ring = max(abs(center_row - min_row), abs(center_row - max_row),
+                       abs(center_column - min_column), abs(center_column - max_column))
+
+        # Max-heap of the k closest so far, stored as (-distance, -key) so that
+        # of two equally distant points the smaller key wins, whatever order we meet them in
+        best = []
+        accepted = 0
+
+        def finished(ring):
+            if len(best) == k and -best[0][0] < self._ring_lower_bound_km(latitude, ring):
+                return True
+            return available is not None and accepted >= available  # everything a filter could let through has been seen
+
+        def visit(cell):
+            nonlocal accepted
+            for key in self.cells.get(cell, ()):
+                if accept is not None and not accept(key):
+                    continue
+                accepted += 1
+                distance = haversine_km(latitude, longitude, *self.points[key])
+                if len(best) < k:
+                    heapq.heappush(best, (-distance, -key))
+                elif (-distance, -key) > best[0]:
+                    heapq.heapreplace(best, (-distance, -key))
+
+        for ring in range(max_ring + 1):
+            if finished(ring):
+                break
+            if 8 * ring > len(self.cells):
+                remaining = sorted(
+                    (max(abs(row - center_row), abs(column - center_column)), (row, column))
+                    for row, column in self.cells
+                )
+                for cell_ring, cell in remaining:
+                    if cell_ring < ring:
+                        continue
+                    if finished(cell_ring):
+                        break
+                    visit(cell)
+                break
+            for cell in self._ring_cells(center_row, center_column, ring):
+                visit(cell)
+        return sorted((-negative, -key) for negative, key in best)
+
+    def _ring_lower_bound_km(self, latitude, ring):
+        # Every cell in this ring is at least ring - 1 whole cells away from the query point
+        steps = max(ring - 1, 0) * self.cell_degrees
+        widest = math.cos(math.radians(min(89.9, abs(latitude) + (ring + 1) * self.cell_degrees)))
+        return steps * KM_PER_DEGREE * min(1.0, max(widest, 0.0))
+
+    @staticmethod
+    def _ring_cells(center_row, center_column, ring):
+        if ring == 0:
+            yield (center_row, center_column)
+            return
+        for column in range(center_column - ring, center_column + ring + 1):
+            yield (center_row - ring, column)
+            yield (center_row + ring, column)
+        for row in range(center_row - ring + 1, center_row + ring):
+            yield (row, center_column - ring)
+            yield (row, center_column + ring)
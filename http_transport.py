@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Serving the MCP server over the network (streamable HTTP or SSE) with uvicorn
+
+Over stdio a server process talks to exactly one client. Here one process
+serves many sessions on one event loop, sharing a single catalog, and
+uvicorn can run several such worker processes on the same port.
+"""
+
+import contextlib
+import ipaddress
+import os
+import sys
+
+import uvicorn
+from mcp.server.sse import SseServerTransport
+from mcp.server.streamable_http_manager import StreamableHTTPSessionManager
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse, Response
+from starlette.routing import Mount, Route
+
+import auth_setup
+from auth_setup import flush_user_interests, setup_descope
+from metrics import REGISTRY
+from opportunity_store import open_store
+from shared_catalog import publish
+
+TRANSPORTS = ("http", "sse")
+
+class _ASGIEndpoint:
+    """Hands requests straight to an ASGI callable (Starlette would treat a bare function as a request handler)"""
+
+    def __init__(self, handle):
+        self.handle = handle
+
+    async def __call__(self, scope, receive, send):
+        await self.handle(scope, receive, send)
+
+def create_app(matcher, transport="http", stateless=False):
+    """A Starlette app serving one VolunteerMatcherServer to every client that connects.
+
+    "http" is the streamable HTTP transport at /mcp; "sse" is the older
+    transport with its event stream at /sse and messages posted to
+    /messages/. With OPERATOR_TOOLS=1, /metrics serves this worker's
+    metrics either way (anyone who can reach the port can read it).
+
+    A stateless app keeps nothing between HTTP requests, so any worker can
+    answer any request; clients then have to send their session token with
+    every call. Otherwise each MCP session is one client's, so it remembers
+    the token that client last sent.
+    """
+    server = matcher.server
+    matcher.remember_tokens = not stateless
+    routes = []
+    if auth_setup.OPERATOR_TOOLS_OPEN:
+        routes.append(Route("/metrics", lambda request: PlainTextResponse(REGISTRY.render())))
+
+    if transport == "http":
+        sessions = StreamableHTTPSessionManager(app=server, stateless=stateless)
+        routes.append(Route("/mcp", endpoint=_ASGIEndpoint(sessions.handle_request)))
+        run_sessions = sessions.run
+    elif transport == "sse":
+        sse = SseServerTransport("/messages/")
+
+        async def handle_sse(scope, receive, send):
+            async with sse.connect_sse(scope, receive, send) as (read_stream, write_stream):
+                await server.run(read_stream, write_stream, server.create_initialization_options())
+            return Response()
+
+        routes.append(Route("/sse", endpoint=_ASGIEndpoint(handle_sse)))
+        routes.append(Mount("/messages/", app=sse.handle_post_message))
+        run_sessions = contextlib.nullcontext
+    else:
+        raise ValueError("Unknown transport: " + str(transport))
+
+    @contextlib.asynccontextmanager
+    async def lifespan(app):
+        try:
+            async with run_sessions():
+                yield
+        finally:
+            # uvicorn has stopped taking requests and let in-flight ones finish (or timed them out)
+            matcher.auth.close()
+            flush_user_interests()
+
+    return Starlette(routes=routes, lifespan=lifespan)
+
+def create_app_from_env():
+    """App factory for uvicorn's worker processes; each one loads its own copy of the catalog (or maps the shared one)"""
+    from main import VolunteerMatcherServer
+
+    setup_descope()
+    return create_app(VolunteerMatcherServer(), os.getenv("MCP_TRANSPORT", "http"), os.getenv("MCP_STATELESS") == "1")
+
+def is_loopback(host):
+    """Whether only this machine can connect to host"""
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+def check_exposure(host):
+    """Raise ValueError if serving on host would let other machines use tools nobody is checking them for"""
+    if is_loopback(host):
+        return
+    if not os.getenv("DESCOPE_PROJECT_ID"):
+        raise ValueError(f"Refusing to serve on {host} without authentication: set DESCOPE_PROJECT_ID, or serve on 127.0.0.1")
+    if auth_setup.OPERATOR_TOOLS_OPEN:
+        raise ValueError(f"Refusing to serve on {host} with OPERATOR_TOOLS=1, which opens the operator tools to every client")
+
+def serve(transport="http", host="127.0.0.1", port=8000, workers=1, shutdown_timeout=10.0, shared_catalog=None):
+    """Run the server until SIGINT/SIGTERM, then finish open requests (for up to shutdown_timeout seconds) and exit.
+
+    With shared_catalog (a directory) the catalog is published there once,
+    here, and every worker maps that file instead of building its own indexes.
+
+    Only loopback hosts are served unless Descope is configured, since the
+    catalog editing and operator tools rely on its session tokens.
+    """
+    if transport not in TRANSPORTS:
+        raise ValueError("Unknown transport: " + str(transport))
+    check_exposure(host)
+    if workers > 1 and transport == "sse":
+        # The event stream and the posted messages could land on different workers
+        raise ValueError("SSE sessions live in one process; use the http transport for several workers")
+    print(f"Serving MCP over {transport} on http://{host}:{port} with {workers} worker(s)", file=sys.stderr)
+    # Worker processes build their app from the environment
+    os.environ["MCP_TRANSPORT"] = transport
+    # A session's requests can reach any worker, so none of them may rely on earlier ones
+    os.environ["MCP_STATELESS"] = "1" if workers > 1 else "0"
+    if shared_catalog:
+        store = open_store()
+        publish(store, shared_catalog)
+        store.close()
+        os.environ["SHARED_CATALOG_DIR"] = os.path.abspath(shared_catalog)
+    uvicorn.run(
+        "http_transport:create_app_from_env",
+        factory=True,
+        host=host,
+        port=port,
+        workers=workers,
+        timeout_graceful_shutdown=shutdown_timeout,
+        app_dir=os.path.dirname(os.path.abspath(__file__)),
+    )
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Cached reads and batched, coalesced writes of users' saved interests
+"""
+
+import sys
+import threading
+import time
+
+from descope import UserObj
+
+from metrics import descope_request
+from result_cache import LRUCache
+
+class DescopeUserBackend:
+    """Reads and writes users' custom attributes through the Descope management API"""
+
+    def __init__(self, client):
+        self.client = client
+
+    def load(self, user_id):
+        with descope_request("user_load"):
+            response = self.client.management.user.load(user_id) or {}
+        user = response.get("user", response)
+        return dict(user.get("customAttributes") or {})
+
+    def update_many(self, updates):
+        """Apply {user_id: custom_attributes} in one batch patch; returns the user ids that failed"""
+        if not updates:
+            return []
+        users = [UserObj(login_id=user_id, custom_attributes=custom_attributes) for user_id, custom_attributes in updates.items()]
+        try:
+            with descope_request("user_patch_batch"):
+                response = self.client.management.user.patch_batch(users) or {}
+        except Exception as e:
+            print("Failed to save user interests: " + str(e), file=sys.stderr)
+            return list(updates)
+        failed = set()
+        for failure in response.get("failedUsers") or []:
+            user = failure.get("user") or {}
+            failed.update(user.get("loginIds") or [user.get("loginId")])
+            print("Failed to save user interests: " + str(failure.get("failure")), file=sys.stderr)
+        return [user_id for user_id in updates if user_id in failed]
+
+class FakeUserBackend:
+    """An in-memory stand-in for the Descope management API, for tests and benchmarks"""
+
+    def __init__(self, users=None, latency_seconds=0.0):
+        self.users = {user_id: dict(attributes) for user_id, attributes in (users or {}).items()}
+        self.latency_seconds = latency_seconds
+        self.loads = 0
+        self.updates = 0
+        self.batches = 0
+
+    def load(self, user_id):
+        self.loads += 1
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+        return dict(self.users.get(user_id, {}))
+
+    def update_many(self, updates):
+        self.batches += 1
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+        for user_id, custom_attributes in updates.items():
+            self.updates += 1
+            self.users.setdefault(user_id, {}).update(custom_attributes)
+        return []
+
+class UserInterestStore:
+    """Read-through cache in front of the user backend, with write-behind batching.
+
+    Reads come from pending writes first, then a per-user TTL cache, then the
+    backend. Writes are queued; a user who saves several times within one flush
+    interval costs a single backend write (the last one wins). Pending writes
+    are flushed in batches on a background thread and always on close().
+    """
+
+    def __init__(self, backend, ttl_seconds=300, flush_interval=2.0, max_batch=100, cache_size=10_000):
+        self.backend = backend
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.cache = LRUCache(max_size=cache_size, ttl_seconds=ttl_seconds)
+        self.coalesced_writes = 0
+        self._pending = {}  # user_id -> custom attributes waiting to be written
+        self._inflight = {}  # user_id -> custom attributes being written right now
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._closed = False
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="interest-writer", daemon=True)
+            self._thread.start()
+
+    def close(self):
+        """Stop the background writer and write everything still queued; save() raises afterwards"""
+        with self._lock:
+            self._closed = True
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        while self.pending_count():
+            if not self.flush():
+                break
+
+    def peek(self, user_id):
+        """The user's attributes if we have them in memory, else None (never calls the backend)"""
+        with self._lock:
+            pending = self._pending.get(user_id, self._inflight.get(user_id))
+        if pending is not None:
+            return dict(pending)
+        attributes = self.cache.get(user_id)
+        return None if attributes is None else dict(attributes)
+
+    def get(self, user_id):
+        """The user's saved custom attributes (interests, location)"""
+        attributes = self.peek(user_id)
+        if attributes is None:
+            attributes = self.backend.load(user_id)
+            self.cache.put(user_id, attributes)
+        return dict(attributes)
+
+    def save(self, user_id, custom_attributes):
+        """Queue a write; any earlier queued write for this user is replaced"""
+        self.cache.discard(user_id)
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("The interest store is closed, so this save would never be written")
+            if user_id in self._pending:
+                self.coalesced_writes += 1
+            self._pending[user_id] = dict(custom_attributes)
+        self.start()
+
+    def pending_count(self):
+        with self._lock:
+            return len(self._pending)
+
+    def flush(self):
+        """Write one batch of queued updates; returns False if any of them failed"""
+        with self._flush_lock:
+            with self._lock:
+                batch = dict(list(self._pending.items())[:self.max_batch])
+                for user_id in batch:
+                    del self._pending[user_id]
+                self._inflight = batch
+            if not batch:
+                return True
+
+            try:
+                failed = set(self.backend.update_many(batch))
+            except Exception as e:
+                print("Failed to save user interests: " + str(e), file=sys.stderr)
+                failed = set(batch)
+
+            with self._lock:
+                self._inflight = {}
+                for user_id, attributes in batch.items():
+                    if user_id in failed:
+                        # Put it back unless the user has saved something newer meanwhile
+                        self._pending.setdefault(user_id, attributes)
+                    elif user_id not in self._pending:
+                        self.cache.put(user_id, attributes)
+            return not failed
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            while self.pending_count() and self.flush() and not self._stop.is_set():
+                pass
@@ -5,17 +5,35 @@ Community Volunteer Matcher MCP Server with Descope Authentication
 """
 
 import os
+import sys
 from dotenv import load_dotenv
-from mcp.server import Server
+from mcp.server import NotificationOptions, Server
+from mcp.server.models import InitializationOptions
 from mcp.server.stdio import stdio_server
+from mcp.types import CallToolResult, Tool
+import argparse
 import asyncio
 import json
+import weakref
+from datetime import date
 
 # Load environment variables
 load_dotenv()
 
 # Import auth functions
-from auth_setup import setup_descope, verify_session_token, get_user_interests, save_user_interests
+from async_auth import AsyncAuth
+from auth_setup import ADMIN_ROLES, ADMIN_TOKEN_SCHEMA, EDITOR_ROLES, OPERATOR_TOOLS_OPEN, has_role, setup_descope, flush_user_interests
+from autocomplete import KINDS, MAX_SUGGESTIONS, Autocomplete
+from batch_matcher import BatchMatcher
+from catalog_editor import OPPORTUNITY_FIELDS_SCHEMA, REQUIRED_OPPORTUNITY_FIELDS, SESSION_TOKEN_SCHEMA, CatalogEditor
+from data_models import ScoringWeights
+from metrics import REGISTRY, instrument_tool_calls, start_periodic_dump, tool_failed
+from opportunity_store import open_store
+from profiling import ToolProfiler
+from recommendations import RecommendationBook
+from result_cache import FragmentCache, ResponseCache, query_key
+from result_pages import Paginator, progress_notifier, search_spec
+from shared_catalog import open_catalog
 
 # Define interest categories
 class InterestCategory:
@@ -30,42 +48,55 @@ class InterestCategory:
     SENIORS = "seniors"
     YOUTH = "youth"
 
-# Sample volunteer opportunities
-SAMPLE_OPPORTUNITIES = [
-    {
-        "id": "1",
-        "title": "Beach Cleanup Day",
-        "organization": "Ocean Preservation Society",
-        "description": "Help clean up local beaches and protect marine life",
-        "categories": ["environment"],
-        "location": "Santa Monica Beach, CA",
-        "date": "2023-10-15",
-        "time": "9:00 AM - 12:00 PM",
-        "registration_link": "https://example.com/beach-cleanup"
-    },
-    {
-        "id": "2",
-        "title": "Animal Shelter Helper",
-        "organization": "Paws and Claws Rescue",
-        "description": "Walk dogs and socialize cats at our shelter",
-        "categories": ["animals"],
-        "location": "Los Angeles, CA",
-        "date": "2023-10-20",
-        "time": "1:00 PM - 4:00 PM",
-        "registration_link": "https://example.com/animal-shelter"
-    }
-]
+def render_opportunity(opp):
+    """Format one opportunity for the results list (its number and score are added per search)"""
+    return (
+        "**" + opp.title + "** - " + opp.organization + "\n"
+        + "   Location: " + opp.location + "\n"
+        + "   Description: " + opp.description + "\n"
+        + "   Categories: " + ", ".join(opp.categories) + "\n"
+        + "   Register: " + opp.registration_link + "\n"
+    )
 
 class VolunteerMatcherServer:
-    def __init__(self):
+    def __init__(self, store=None):
         self.server = Server("community-volunteer-matcher")
+        self.store = store or open_store()
+        # Ranking weights can be tuned without a code change, e.g. MATCH_SCORING_WEIGHTS={"recency": 0}
+        weights = ScoringWeights.model_validate_json(os.getenv("MATCH_SCORING_WEIGHTS") or "{}")
+        self.catalog = open_catalog(self.store, weights=weights)
+        self.fragments = FragmentCache(render_opportunity)
+        self.responses = ResponseCache()
+        # Later pages of a search come from its cached ranking instead of a fresh scan
+        self.pages = Paginator(self.catalog)
+        # Opportunities can be added, changed and retired without a restart
+        self.editor = CatalogEditor(self.store, self.catalog)
+        self.catalog.subscribe(lambda previous, current: previous and self.fragments.discard(previous))
+        # Matches whole batches of profiles at once for the recommendation jobs
+        self.batch = BatchMatcher(self.catalog)
+        # Logged-in users' recommendations, kept current as interests and the catalog change
+        self.recommendations = RecommendationBook(self.catalog)
+        # Location and organization names by prefix, for typeahead in the location boxes
+        self.autocomplete = Autocomplete(self.catalog)
+        # Descope calls run off the event loop, so a slow identity call never holds up a search
+        self.auth = AsyncAuth.from_env()
+        # Off unless PROFILE_SAMPLE_RATE (or the set_profiling tool) turns it on
+        self.profiler = ToolProfiler.from_env("main")
+        REGISTRY.watch_cache("main", "responses", self.responses.stats)
+        REGISTRY.watch_cache("main", "fragments", self.fragments.stats)
+        REGISTRY.watch_cache("main", "search_pages", self.pages.searches.stats)
+        # Per MCP session: the token it last logged in with. Only kept where a session belongs to one
+        # client (the stateful HTTP transport turns it on); a stdio session can be shared, as the web
+        # UI's pool shares them between all its visitors, so there every call brings its own token.
+        self.remember_tokens = False
+        self.session_auth = weakref.WeakKeyDictionary()
         self.setup_handlers()
         self.user_data = {}  # Temporary storage for demo
     
     def setup_handlers(self):
         @self.server.list_tools()
         async def list_tools():
-            return [
+            tools = [
                 {
                     "name": "find_volunteer_opportunities",
                     "description": "Find volunteer opportunities based on interests and location",
@@ -84,11 +115,86 @@ class VolunteerMatcherServer:
                             "max_results": {
                                 "type": "number",
                                 "description": "Maximum number of results to return (default: 5)"
+                            },
+                            "latitude": {
+                                "type": "number",
+                                "description": "Latitude to search around (optional)"
+                            },
+                            "longitude": {
+                                "type": "number",
+                                "description": "Longitude to search around (optional)"
+                            },
+                            "radius_km": {
+                                "type": "number",
+                                "description": "Search radius in km; without it the nearest opportunities are returned (optional)"
+                            },
+                            "cursor": {
+                                "type": "string",
+                                "description": "Cursor from a previous result, to get the next page (optional)"
+                            },
+                            "availability": {
+                                "type": "array",
+                                "items": {"type": "string"},
+                                "description": "When the user is free, e.g. \"Saturday mornings\", \"weekdays 6-9pm\" or \"2023-10-20\" (optional)"
+                            },
+                            "upcoming_only": {
+                                "type": "boolean",
+                                "description": "Leave out opportunities that have already happened (optional)"
                             }
                         },
                         "required": ["interests"]
                     }
                 },
+                {
+                    "name": "search_opportunities",
+                    "description": "Search volunteer opportunities by keywords in their title, organization and description",
+                    "inputSchema": {
+                        "type": "object",
+                        "properties": {
+                            "query": {
+                                "type": "string",
+                                "description": "Words to search for, e.g. \"beach cleanup\" or \"tutoring kids\""
+                            },
+                            "interests": {
+                                "type": "array",
+                                "items": {"type": "string", "enum": ["animals", "environment", "education", "healthcare", "homelessness", "arts_culture", "community", "technology", "seniors", "youth"]},
+                                "description": "Only opportunities matching at least one of these interests (optional)"
+                            },
+                            "location": {
+                                "type": "string",
+                                "description": "Location to search for opportunities (optional)"
+                            },
+                            "max_results": {
+                                "type": "number",
+                                "description": "Maximum number of results to return (default: 5)"
+                            }
+                        },
+                        "required": ["query"]
+                    }
+                },
+                {
+                    "name": "autocomplete",
+                    "description": "Suggest locations and organizations from the catalog as the user types, with how many opportunities each has (JSON)",
+                    "inputSchema": {
+                        "type": "object",
+                        "properties": {
+                            "prefix": {
+                                "type": "string",
+                                "description": "What the user has typed so far, e.g. \"santa m\""
+                            },
+                            "kinds": {
+                                "type": "array",
+                                "items": {"type": "string", "enum": list(KINDS)},
+                                "description": "Only suggest these (default: locations and organizations)"
+                            },
+                            "max_results": {
+                                "type": "number",
+                                "description": "Maximum number of suggestions to return (default: 8, at most " + str(MAX_SUGGESTIONS) + ")"
+                            }
+                        },
+                        "required": ["prefix"]
+                    }
+                },
                 {
                     "name": "set_user_interests",
                     "description": "Set or update user interests for volunteer matching",
@@ -108,6 +214,45 @@ class VolunteerMatcherServer:
                         "required": ["interests"]
                     }
                 },
+                {
+                    "name": "match_user_profiles",
+                    "description": "Find the best volunteer opportunities for many user profiles in one call",
+                    "inputSchema": {
+                        "type": "object",
+                        "properties": {
+                            "profiles": {
+                                "type": "array",
+                                "items": {
+                                    "type": "object",
+                                    "properties": {
+                                        "user_id": {"type": "string"},
+                                        "interests": {
+                                            "type": "array",
+                                            "items": {"type": "string", "enum": ["animals", "environment", "education", "healthcare", "homelessness", "arts_culture", "community", "technology", "seniors", "youth"]}
+                                        },
+                                        "location": {"type": "string"},
+                                        "availability": {"type": "array", "items": {"type": "string"}}
+                                    },
+                                    "required": ["user_id", "interests"]
+                                },
+                                "description": "User profiles to match"
+                            },
+                            "max_results": {
+                                "type": "number",
+                                "description": "Maximum number of results per user (default: 5)"
+                            },
+                            "date_from": {
+                                "type": "string",
+                                "description": "Only opportunities on or after this date, YYYY-MM-DD (optional)"
+                            },
+                            "date_to": {
+                                "type": "string",
+                                "description": "Only opportunities on or before this date, YYYY-MM-DD (optional)"
+                            }
+                        },
+                        "required": ["profiles"]
+                    }
+                },
                 {
                     "name": "get_user_interests",
                     "description": "Get current user interests for volunteer matching",
@@ -115,102 +260,443 @@ class VolunteerMatcherServer:
                         "type": "object",
                         "properties": {}
                     }
+                },
+                {
+                    "name": "get_my_recommendations",
+                    "description": "Get volunteer opportunities recommended for the logged-in user's saved interests",
+                    "inputSchema": {
+                        "type": "object",
+                        "properties": {
+                            "session_token": {
+                                "type": "string",
+                                "description": "The user's Descope session token (can be left out once this session has sent one)"
+                            },
+                            "max_results": {
+                                "type": "number",
+                                "description": "Maximum number of results to return (default: 5)"
+                            }
+                        }
+                    }
+                },
+                {
+                    "name": "add_opportunity",
+                    "description": "Add a new volunteer opportunity to the catalog (editors only)",
+                    "inputSchema": {
+                        "type": "object",
+                        "properties": dict(OPPORTUNITY_FIELDS_SCHEMA, session_token=SESSION_TOKEN_SCHEMA),
+                        "required": REQUIRED_OPPORTUNITY_FIELDS
+                    }
+                },
+                {
+                    "name": "update_opportunity",
+                    "description": "Change some details of an existing volunteer opportunity (editors only)",
+                    "inputSchema": {
+                        "type": "object",
+                        "properties": dict(OPPORTUNITY_FIELDS_SCHEMA, session_token=SESSION_TOKEN_SCHEMA),
+                        "required": ["id"]
+                    }
+                },
+                {
+                    "name": "retire_opportunity",
+                    "description": "Remove a volunteer opportunity that is over or cancelled (editors only)",
+                    "inputSchema": {
+                        "type": "object",
+                        "properties": {
+                            "id": {
+                                "type": "string",
+                                "description": "ID of the opportunity to remove"
+                            },
+                            "session_token": SESSION_TOKEN_SCHEMA
+                        },
+                        "required": ["id"]
+                    }
+                },
+                {
+                    "name": "set_profiling",
+                    "description": "Profile a share of tool calls and write flame graph stacks to the server's profile directory (admins only)",
+                    "inputSchema": {
+                        "type": "object",
+                        "properties": {
+                            "session_token": ADMIN_TOKEN_SCHEMA,
+                            "sample_rate": {
+                                "type": "number",
+                                "description": "Share of tool calls to profile, from 0 (off) to 1 (all of them)"
+                            },
+                            "interval_ms": {
+                                "type": "number",
+                                "description": "How often to sample a profiled call's stack, in milliseconds"
+                            }
+                        }
+                    }
+                },
+                {
+                    "name": "get_metrics",
+                    "description": "Tool call counts, latencies, Descope calls and cache hit ratios of this server, in the Prometheus text format (admins only)",
+                    "inputSchema": {
+                        "type": "object",
+                        "properties": {
+                            "session_token": ADMIN_TOKEN_SCHEMA
+                        }
+                    }
                 }
             ]
+            return [Tool(**tool) for tool in tools]
         
         @self.server.call_tool()
+        @instrument_tool_calls("main")
+        @self.profiler.profile
         async def call_tool(name, arguments):
             if name == "find_volunteer_opportunities":
-                return await self.find_volunteer_opportunities(arguments)
+                return await self.versioned(self.find_volunteer_opportunities, arguments)
+            elif name == "search_opportunities":
+                return await self.search_opportunities(arguments)
+            elif name == "autocomplete":
+                return await self.versioned(self.suggest, arguments)
             elif name == "set_user_interests":
                 return await self.set_user_interests(arguments)
             elif name == "get_user_interests":
                 return await self.get_user_interests(arguments)
+            elif name == "match_user_profiles":
+                return await self.match_user_profiles(arguments)
+            elif name == "get_my_recommendations":
+                return await self.get_my_recommendations(arguments)
+            elif name == "add_opportunity":
+                return await self.add_opportunity(arguments)
+            elif name == "update_opportunity":
+                return await self.update_opportunity(arguments)
+            elif name == "retire_opportunity":
+                return await self.retire_opportunity(arguments)
+            elif name == "set_profiling":
+                return await self.set_profiling(arguments)
+            elif name == "get_metrics":
+                return await self.get_metrics(arguments)
             else:
                 raise ValueError("Unknown tool: " + name)
     
+    async def versioned(self, handler, arguments):
+        """A catalog read's reply, with the store version it was answered from in _meta.catalog_version"""
+        # Read first: the answer can only come from this version or a newer one, so the web UI
+        # never files an older answer under a newer version
+        version = self.catalog.store_version
+        content = await handler(arguments)
+        if version is None:
+            return content
+        return CallToolResult(content=content, _meta={"catalog_version": version})
+
     async def find_volunteer_opportunities(self, arguments):
         try:
             interests = arguments.get("interests", [])
             location = arguments.get("location", "").lower()
             max_results = arguments.get("max_results", 5)
+            radius_km = float(arguments["radius_km"]) if arguments.get("radius_km") is not None else None
+            near = None
+            if arguments.get("latitude") is not None and arguments.get("longitude") is not None:
+                near = (float(arguments["latitude"]), float(arguments["longitude"]))
             
-            matched_opportunities = []
-            for opp in SAMPLE_OPPORTUNITIES:
-                interest_match = any(category in interests for category in opp["categories"])
-                location_match = True
-                if location and location not in opp["location"].lower():
-                    location_match = False
-                
-                if interest_match and location_match:
-                    matched_opportunities.append(opp)
-                    if len(matched_opportunities) >= max_results:
-                        break
-            
-            if not matched_opportunities:
-                return [{"type": "text", "text": "No volunteer opportunities found matching your criteria."}]
-            
-            result_text = "Found " + str(len(matched_opportunities)) + " volunteer opportunities:\n\n"
-            for i, opp in enumerate(matched_opportunities, 1):
-                result_text += str(i) + ". **" + opp["title"] + "** - " + opp["organization"] + "\n"
-                result_text += "   Location: " + opp["location"] + "\n"
-                result_text += "   Description: " + opp["description"] + "\n"
-                result_text += "   Categories: " + ", ".join(opp["categories"]) + "\n"
-                result_text += "   Register: " + opp["registration_link"] + "\n\n"
+            cursor = arguments.get("cursor")
+            availability = arguments.get("availability") or None
+            upcoming = bool(arguments.get("upcoming_only"))
             
+            # Repeat searches against an unchanged catalog are answered from the cache, except
+            # "upcoming only" ones, which change as the clock moves (availability is read from today)
+            cache_key = query_key(
+                interests, location, max_results, near=near, radius_km=radius_km, cursor=cursor,
+                availability=tuple(availability or ()), day=date.today().toordinal() if availability else None
+            )
+            catalog_version = self.catalog.version
+            cacheable = not upcoming
+            if cacheable:
+                result_text = self.responses.lookup(catalog_version, cache_key)
+                if result_text is not None:
+                    return [{"type": "text", "text": result_text}]
+            
+            # The paginator searches a single catalog snapshot, however the catalog changes meanwhile.
+            # A later page that needs a full ranking reports progress, if the client asked for it.
+            progress = progress_notifier(self.server)
+            spec = search_spec(interests, location, near, radius_km, availability, upcoming)
+            matches, offset, total, next_cursor = await self.pages.page(spec, int(max_results), cursor, progress)
+            more_text = "More results available: call again with cursor " + next_cursor + "\n" if next_cursor else ""
+            
+            if not matches:
+                result_text = "No volunteer opportunities found matching your criteria."
+            else:
+                result_text = self.render_matches(matches, offset, total) + more_text
+            
+            if cacheable:
+                self.responses.store(catalog_version, cache_key, result_text)
             return [{"type": "text", "text": result_text}]
             
         except Exception as e:
+            tool_failed(e)
             return [{"type": "text", "text": "Error finding opportunities: " + str(e)}]
     
+    async def search_opportunities(self, arguments):
+        try:
+            query = arguments.get("query", "")
+            matches = self.catalog.search(
+                query,
+                interests=arguments.get("interests"),
+                location=arguments.get("location"),
+                max_results=int(arguments.get("max_results", 5))
+            )
+            
+            if not matches:
+                return [{"type": "text", "text": "No volunteer opportunities found for \"" + query + "\"."}]
+            return [{"type": "text", "text": self.render_matches(matches)}]
+            
+        except Exception as e:
+            tool_failed(e)
+            return [{"type": "text", "text": "Error searching opportunities: " + str(e)}]
+    
+    async def suggest(self, arguments):
+        try:
+            suggestions = self.autocomplete.suggest(
+                arguments.get("prefix", ""),
+                kinds=arguments.get("kinds") or KINDS,
+                limit=int(arguments.get("max_results", 8))
+            )
+            return [{"type": "text", "text": json.dumps([suggestion._asdict() for suggestion in suggestions])}]
+            
+        except Exception as e:
+            tool_failed(e)
+            return [{"type": "text", "text": "Error finding suggestions: " + str(e)}]
+    
+    def results_header(self, matches, offset=0, total=None):
+        if not offset and total is None:
+            return "Found " + str(len(matches)) + " volunteer opportunities:\n\n"
+        return "Volunteer opportunities " + str(offset + 1) + "-" + str(offset + len(matches)) + " of " + str(total) + ":\n\n"
+    
+    def render_match(self, number, match):
+        return str(number) + ". " + self.fragments.get(match.opportunity) + "   Match score: " + str(round(match.score, 2)) + "\n\n"
+    
+    def render_matches(self, matches, offset=0, total=None):
+        parts = [self.results_header(matches, offset, total)]
+        for i, match in enumerate(matches, offset + 1):
+            parts.append(self.render_match(i, match))
+        return "".join(parts)
+    
+    async def match_user_profiles(self, arguments):
+        try:
+            results = self.batch.match(
+                arguments.get("profiles", []),
+                int(arguments.get("max_results", 5)),
+                date_from=arguments.get("date_from"),
+                date_to=arguments.get("date_to")
+            )
+            # Results are for other programs, so they come back as JSON
+            payload = {
+                user_id: [{"id": opp.id, "title": opp.title, "score": round(score, 3)} for opp, score, _ in matches]
+                for user_id, matches in results.items()
+            }
+            return [{"type": "text", "text": json.dumps({"results": payload})}]
+            
+        except Exception as e:
+            tool_failed(e)
+            return [{"type": "text", "text": "Error matching profiles: " + str(e)}]
+    
+    def current_session_auth(self):
+        """Auth state of the MCP session making the current request ({} outside of a request, or when tokens aren't remembered)"""
+        if not self.remember_tokens:
+            return {}
+        try:
+            session = self.server.request_context.session
+        except LookupError:
+            return {}
+        return self.session_auth.setdefault(session, {})
+    
     async def set_user_interests(self, arguments):
         try:
-            session_token = arguments.get("session_token")
+            session_auth = self.current_session_auth()
+            session_token = arguments.get("session_token") or session_auth.get("session_token")
             if not session_token:
                 return [{"type": "text", "text": "Authentication required. Please provide a session token."}]
             
             # Verify user session
-            user_info = verify_session_token(session_token)
+            user_info = await self.auth.verify_session_token(session_token)
             if not user_info:
                 return [{"type": "text", "text": "Invalid session token. Please login again."}]
+            session_auth["session_token"] = session_token
             
             interests = arguments.get("interests", [])
             location = arguments.get("location")
             
             # Save to Descope
-            success = save_user_interests(user_info["user_id"], interests, location)
+            success = await self.auth.save_user_interests(user_info["user_id"], interests, location)
             
             if success:
+                self.recommendations.set_profile(user_info["user_id"], interests, location)
                 location_text = " in " + location if location else ""
                 return [{"type": "text", "text": "Success! Your interests have been saved: " + ", ".join(interests) + location_text}]
             else:
                 return [{"type": "text", "text": "Failed to save your interests. Please try again."}]
                 
+        except asyncio.TimeoutError as e:
+            tool_failed(e)
+            return [{"type": "text", "text": "The login service is taking too long to respond. Please try again in a moment."}]
         except Exception as e:
+            tool_failed(e)
             return [{"type": "text", "text": "Error saving interests: " + str(e)}]
     
     async def get_user_interests(self, arguments):
         try:
-            session_token = arguments.get("session_token")
+            session_auth = self.current_session_auth()
+            session_token = arguments.get("session_token") or session_auth.get("session_token")
             if not session_token:
                 return [{"type": "text", "text": "Authentication required. Please provide a session token."}]
             
             # Verify user session
-            user_info = verify_session_token(session_token)
+            user_info = await self.auth.verify_session_token(session_token)
             if not user_info:
                 return [{"type": "text", "text": "Invalid session token. Please login again."}]
+            session_auth["session_token"] = session_token
             
             # Get from Descope
-            interests = get_user_interests(user_info["user_id"])
+            interests = await self.auth.get_user_interests(user_info["user_id"])
             
             if not interests:
                 return [{"type": "text", "text": "You haven't set any interests yet. Use set_user_interests to tell us what causes you care about."}]
             
             return [{"type": "text", "text": "Your current interests: " + ", ".join(interests)}]
                 
+        except asyncio.TimeoutError as e:
+            tool_failed(e)
+            return [{"type": "text", "text": "The login service is taking too long to respond. Please try again in a moment."}]
         except Exception as e:
+            tool_failed(e)
             return [{"type": "text", "text": "Error retrieving interests: " + str(e)}]
 
+    async def get_my_recommendations(self, arguments):
+        try:
+            session_auth = self.current_session_auth()
+            session_token = arguments.get("session_token") or session_auth.get("session_token")
+            if not session_token:
+                return [{"type": "text", "text": "Authentication required. Please provide a session token."}]
+            
+            user_info = await self.auth.verify_session_token(session_token)
+            if not user_info:
+                return [{"type": "text", "text": "Invalid session token. Please login again."}]
+            session_auth["session_token"] = session_token
+            
+            user_id = user_info["user_id"]
+            if user_id not in self.recommendations:
+                # First time we've seen this user since starting up
+                interests = await self.auth.get_user_interests(user_id)
+                if not interests:
+                    return [{"type": "text", "text": "You haven't set any interests yet. Use set_user_interests to tell us what causes you care about."}]
+                self.recommendations.set_profile(user_id, interests)
+            
+            matches = self.recommendations.get(user_id)[:int(arguments.get("max_results", 5))]
+            if not matches:
+                return [{"type": "text", "text": "No volunteer opportunities match your interests right now."}]
+            return [{"type": "text", "text": self.render_matches(matches)}]
+                
+        except asyncio.TimeoutError as e:
+            tool_failed(e)
+            return [{"type": "text", "text": "The login service is taking too long to respond. Please try again in a moment."}]
+        except Exception as e:
+            tool_failed(e)
+            return [{"type": "text", "text": "Error getting recommendations: " + str(e)}]
+
+    async def authorize(self, arguments, roles):
+        """(user info, None) if the session behind this call holds one of roles, else (None, the reply to send instead)"""
+        session_auth = self.current_session_auth()
+        session_token = arguments.get("session_token") or session_auth.get("session_token")
+        if not session_token:
+            return None, [{"type": "text", "text": "Authentication required. Please provide a session token."}]
+        
+        user_info = await self.auth.verify_session_token(session_token)
+        if not user_info:
+            return None, [{"type": "text", "text": "Invalid session token. Please login again."}]
+        session_auth["session_token"] = session_token
+        
+        if not has_role(user_info, roles):
+            return None, [{"type": "text", "text": "Your account isn't allowed to do that. Ask an admin for the " + " or ".join(sorted(roles)) + " role."}]
+        return user_info, None
+
+    async def add_opportunity(self, arguments):
+        try:
+            user_info, denied = await self.authorize(arguments, EDITOR_ROLES)
+            if denied:
+                return denied
+            fields = {key: value for key, value in arguments.items() if key != "session_token"}
+            opp = self.editor.add_opportunity(fields)
+            return [{"type": "text", "text": "Added opportunity " + opp.id + ": " + opp.title}]
+        except asyncio.TimeoutError as e:
+            tool_failed(e)
+            return [{"type": "text", "text": "The login service is taking too long to respond. Please try again in a moment."}]
+        except Exception as e:
+            tool_failed(e)
+            return [{"type": "text", "text": "Error adding opportunity: " + str(e)}]
+    
+    async def update_opportunity(self, arguments):
+        try:
+            user_info, denied = await self.authorize(arguments, EDITOR_ROLES)
+            if denied:
+                return denied
+            changes = {key: value for key, value in arguments.items() if key != "session_token"}
+            opp = self.editor.update_opportunity(changes.pop("id", None), changes)
+            return [{"type": "text", "text": "Updated opportunity " + opp.id + " (version " + str(opp.version) + ")"}]
+        except asyncio.TimeoutError as e:
+            tool_failed(e)
+            return [{"type": "text", "text": "The login service is taking too long to respond. Please try again in a moment."}]
+        except Exception as e:
+            tool_failed(e)
+            return [{"type": "text", "text": "Error updating opportunity: " + str(e)}]
+    
+    async def retire_opportunity(self, arguments):
+        try:
+            user_info, denied = await self.authorize(arguments, EDITOR_ROLES)
+            if denied:
+                return denied
+            opportunity_id = arguments.get("id")
+            if self.editor.retire_opportunity(opportunity_id):
+                return [{"type": "text", "text": "Retired opportunity " + str(opportunity_id)}]
+            return [{"type": "text", "text": "No opportunity with id " + str(opportunity_id)}]
+        except asyncio.TimeoutError as e:
+            tool_failed(e)
+            return [{"type": "text", "text": "The login service is taking too long to respond. Please try again in a moment."}]
+        except Exception as e:
+            tool_failed(e)
+            return [{"type": "text", "text": "Error retiring opportunity: " + str(e)}]
+
+    async def operator_check(self, arguments):
+        """None if this call may use the operator tools, else the reply to send instead"""
+        if OPERATOR_TOOLS_OPEN:
+            return None
+        user_info, denied = await self.authorize(arguments, ADMIN_ROLES)
+        return denied
+
+    async def set_profiling(self, arguments):
+        try:
+            denied = await self.operator_check(arguments)
+            if denied:
+                return denied
+            interval_ms = arguments.get("interval_ms")
+            self.profiler.configure(
+                rate=arguments.get("sample_rate"),
+                interval_seconds=None if interval_ms is None else float(interval_ms) / 1000
+            )
+            return [{"type": "text", "text": self.profiler.describe()}]
+        except asyncio.TimeoutError as e:
+            tool_failed(e)
+            return [{"type": "text", "text": "The login service is taking too long to respond. Please try again in a moment."}]
+        except Exception as e:
+            tool_failed(e)
+            return [{"type": "text", "text": "Error changing profiling: " + str(e)}]
+
+    async def get_metrics(self, arguments):
+        try:
+            denied = await self.operator_check(arguments)
+            if denied:
+                return denied
+            return [{"type": "text", "text": REGISTRY.render()}]
+        except asyncio.TimeoutError as e:
+            tool_failed(e)
+            return [{"type": "text", "text": "The login service is taking too long to respond. Please try again in a moment."}]
+        except Exception as e:
+            tool_failed(e)
+            return [{"type": "text", "text": "Error collecting metrics: " + str(e)}]
+
 async def main():
     # Setup Descope
     setup_descope()
@@ -218,18 +704,56 @@ async def main():
     # Create server instance
     server = VolunteerMatcherServer()
     
+    # stdout is taken by MCP, so metrics can only be dumped, e.g. METRICS_DUMP_SECONDS=60 METRICS_FILE=/var/lib/node_exporter/matcher.prom
+    dump_seconds = float(os.getenv("METRICS_DUMP_SECONDS", "0"))
+    if dump_seconds > 0:
+        start_periodic_dump(dump_seconds, os.getenv("METRICS_FILE"))
+    
     # Start the server
-    async with stdio_server() as (read_stream, write_stream):
-        await server.server.run(
-            read_stream,
-            write_stream,
-            {
-                "name": "community-volunteer-matcher",
-                "version": "1.0.0"
-            }
-        )
+    try:
+        async with stdio_server() as (read_stream, write_stream):
+            await server.server.run(
+                read_stream,
+                write_stream,
+                InitializationOptions(
+                    server_name="community-volunteer-matcher",
+                    server_version="1.0.0",
+                    capabilities=server.server.get_capabilities(NotificationOptions(), {})
+                )
+            )
+    finally:
+        # Don't lose interest changes that are still waiting to be written
+        server.auth.close()
+        flush_user_interests()
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Community Volunteer Matcher MCP Server")
+    parser.add_argument("--transport", choices=["stdio", "http", "sse"], default="stdio",
+                        help="stdio serves one client; http (streamable HTTP at /mcp) and sse (/sse) serve many")
+    parser.add_argument("--host", default="127.0.0.1",
+                        help="address to listen on (anything but loopback needs DESCOPE_PROJECT_ID)")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=1,
+                        help="worker processes for http/sse (each loads its own catalog unless --shared-catalog)")
+    parser.add_argument("--shutdown-timeout", type=float, default=10.0,
+                        help="seconds to let open requests finish after SIGTERM")
+    parser.add_argument("--shared-catalog", metavar="DIR",
+                        help="publish the catalog to DIR and have every worker map it instead of loading its own")
+    args = parser.parse_args()
+    if args.workers > 1 and args.transport != "http":
+        parser.error("--workers needs --transport http (SSE sessions can't move between workers)")
+    return args
 
 if __name__ == "__main__":
-    print("Starting Community Volunteer Matcher MCP Server with Authentication...")
-    asyncio.run(main())
+    args = parse_args()
+    if args.transport == "stdio":
+        # stdout carries the MCP protocol, so anything for humans goes to stderr
+        print("Starting Community Volunteer Matcher MCP Server with Authentication...", file=sys.stderr)
+        asyncio.run(main())
+    else:
+        from http_transport import serve
+        try:
+            serve(args.transport, args.host, args.port, args.workers, args.shutdown_timeout, args.shared_catalog)
+        except ValueError as e:
+            sys.exit(str(e))
     
\ No newline at end of file
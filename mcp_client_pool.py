@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+A pool of long-lived MCP client sessions, so the web UI talks to the real server
+with one JSON-RPC round trip per click instead of starting Python every time
+"""
+
+import asyncio
+import itertools
+import os
+import sys
+import threading
+
+from mcp import ClientSession, StdioServerParameters
+from mcp.client.stdio import stdio_client
+from mcp.shared.exceptions import McpError
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+class _Slot:
+    """One pooled connection: a server process plus the client session talking to it"""
+
+    def __init__(self, index):
+        self.index = index
+        self.session = None
+        self.restart = asyncio.Event()
+
+class MCPClientPool:
+    """Keeps `size` MCP server sessions open and spreads tool calls across them.
+
+    Sessions are pinged every `health_interval` seconds; a session that fails a
+    ping or a call is torn down and a fresh server is started in its place.
+    The pool runs its own event loop on a background thread, so synchronous
+    code (Flask views) can call it directly.
+    """
+
+    def __init__(self, script="main.py", size=2, call_timeout=10.0, health_interval=15.0, env=None):
+        self.params = StdioServerParameters(
+            command=sys.executable,
+            args=[os.path.join(BASE_DIR, script)],
+            env={**os.environ, **(env or {})},
+            cwd=BASE_DIR,
+        )
+        self.size = size
+        self.call_timeout = call_timeout
+        self.health_interval = health_interval
+        self.restarts = 0
+        self._slots = []
+        self._turns = itertools.count()
+        self._loop = None
+        self._thread = None
+        self._tasks = []
+        self._closing = False
+        self._start_lock = threading.Lock()
+
+    def start(self):
+        with self._start_lock:
+            if self._thread is not None:
+                return
+            self._loop = asyncio.new_event_loop()
+            self._thread = threading.Thread(target=self._loop.run_forever, name="mcp-client-pool", daemon=True)
+            self._thread.start()
+            asyncio.run_coroutine_threadsafe(self._spawn_all(), self._loop).result()
+
+    def close(self):
+        """Stop every session and the pool's event loop"""
+        if self._loop is None:
+            return
+        self._closing = True
+        asyncio.run_coroutine_threadsafe(self._stop_all(), self._loop).result(timeout=self.call_timeout)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=self.call_timeout)
+        self._loop = self._thread = None
+
+    def call_tool(self, name, arguments=None):
+        """Call a tool on one of the pooled sessions and return the result as plain JSON data"""
+        result = self._run(self._request("call_tool", name, arguments or {}))
+        return result.model_dump(mode="json", exclude_none=True)
+
+    def call_tool_on_each(self, name, arguments=None):
+        """Call a tool on every session that's up; returns {session number: result as plain JSON data}.
+
+        Sessions that fail or time out are left out rather than failing the whole call.
+        """
+        results = self._run(self._request_each("call_tool", name, arguments or {}))
+        return {index: result.model_dump(mode="json", exclude_none=True) for index, result in results.items()}
+
+    def list_tools(self):
+        result = self._run(self._request("list_tools"))
+        return {"tools": [tool.model_dump(mode="json", exclude_none=True) for tool in result.tools]}
+
+    def healthy_sessions(self):
+        return sum(1 for slot in self._slots if slot.session is not None)
+
+    def _run(self, coroutine):
+        self.start()
+        # The coroutine enforces call_timeout itself; the extra second covers getting onto the loop
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result(timeout=self.call_timeout * 2 + 1)
+
+    async def _spawn_all(self):
+        self._slots = [_Slot(index) for index in range(self.size)]
+        self._tasks = [asyncio.ensure_future(self._keep_alive(slot)) for slot in self._slots]
+
+    async def _stop_all(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def _keep_alive(self, slot):
+        """Run one server session, health-check it, and respawn it whenever it dies"""
+        backoff = 0.5
+        while not self._closing:
+            try:
+                async with stdio_client(self.params) as (read_stream, write_stream):
+                    async with ClientSession(read_stream, write_stream) as session:
+                        await asyncio.wait_for(session.initialize(), self.call_timeout)
+                        slot.restart.clear()
+                        slot.session = session
+                        backoff = 0.5
+                        while not slot.restart.is_set():
+                            try:
+                                await asyncio.wait_for(slot.restart.wait(), self.health_interval)
+                            except asyncio.TimeoutError:
+                                await asyncio.wait_for(session.send_ping(), self.call_timeout)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print("MCP session " + str(slot.index) + " failed, restarting: " + str(e), file=sys.stderr)
+            finally:
+                slot.session = None
+            if self._closing:
+                break
+            self.restarts += 1
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 10.0)
+
+    async def _request(self, method, *args):
+        # If a session dies under us we retry once on another one
+        for attempt in range(2):
+            slot = await self._ready_slot()
+            try:
+                return await asyncio.wait_for(getattr(slot.session, method)(*args), self.call_timeout)
+            except McpError:
+                # The server answered with an error, so the session itself is fine
+                raise
+            except Exception:
+                # Whatever went wrong, don't trust this session again
+                slot.restart.set()
+                if attempt:
+                    raise
+
+    async def _request_each(self, method, *args):
+        await self._ready_slot()  # wait until at least one session is up
+        slots = [slot for slot in self._slots if slot.session is not None and not slot.restart.is_set()]
+        results = await asyncio.gather(
+            *(asyncio.wait_for(getattr(slot.session, method)(*args), self.call_timeout) for slot in slots),
+            return_exceptions=True
+        )
+        return {slot.index: result for slot, result in zip(slots, results) if not isinstance(result, BaseException)}
+
+    async def _ready_slot(self):
+        """Round-robin over the sessions that are up, waiting briefly if none are yet"""
+        deadline = asyncio.get_running_loop().time() + self.call_timeout
+        while True:
+            for _ in range(len(self._slots)):
+                slot = self._slots[next(self._turns) % len(self._slots)]
+                if slot.session is not None and not slot.restart.is_set():
+                    return slot
+            if asyncio.get_running_loop().time() >= deadline:
+                raise TimeoutError("No MCP server session is available")
+            await asyncio.sleep(0.05)
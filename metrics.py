@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Counters and latency histograms for the tools and Descope calls, rendered in the Prometheus text format
+"""
+
+import contextvars
+import functools
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# Upper bounds (seconds) of the latency buckets; anything slower lands in +Inf
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Tool names come from clients, so past this many distinct ones the rest share one label
+MAX_TOOL_NAMES = 64
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    """A value per label combination that only goes up"""
+
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}  # label values -> count
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels):
+        return self._values.get(labels, 0)
+
+    def render(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}" for labels, value in values]
+
+class Histogram:
+    """Observations per label combination, counted into fixed buckets (plus their sum and count)"""
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}  # label values -> [count per bucket..., count above the last bucket, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                state = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            state[index] += 1
+            state[-1] += value
+
+    @contextmanager
+    def time(self, *labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labels)
+
+    def count(self, *labels):
+        state = self._values.get(labels)
+        return sum(state[:-1]) if state else 0
+
+    def render(self):
+        with self._lock:
+            values = sorted((labels, list(state)) for labels, state in self._values.items())
+        lines = []
+        for labels, state in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), state[:-1]):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, [('le', _number(bound))])} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(state[-1])}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+class Registry:
+    """Every metric a process exports, plus cache statistics read when someone asks for them"""
+
+    def __init__(self):
+        self.metrics = []
+        self.caches = {}  # (owner, cache name) -> function returning the cache's stats() dict, or None
+        self._lock = threading.Lock()
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._add(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram(name, documentation, labelnames, buckets))
+
+    def _add(self, metric):
+        with self._lock:
+            self.metrics.append(metric)
+        return metric
+
+    def watch_cache(self, owner, name, stats):
+        """Export hits, misses and hit ratio of a cache; stats() returns an LRUCache.stats()-style dict (or None).
+
+        Watching the same owner and name again replaces the earlier one.
+        """
+        with self._lock:
+            self.caches[(owner, name)] = stats
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        for metric in list(self.metrics):
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        lines.extend(self._render_caches())
+        return "\n".join(lines) + "\n"
+
+    def _render_caches(self):
+        families = {
+            "cache_hits_total": ("counter", "Lookups answered from the cache", "hits"),
+            "cache_misses_total": ("counter", "Lookups the cache couldn't answer", "misses"),
+            "cache_evictions_total": ("counter", "Entries pushed out to make room", "evictions"),
+            "cache_entries": ("gauge", "Entries in the cache right now", "size"),
+            "cache_hit_ratio": ("gauge", "Hits as a share of all lookups so far", "hit_ratio"),
+        }
+        samples = []
+        with self._lock:
+            caches = sorted(self.caches.items())
+        for (owner, name), stats in caches:
+            try:
+                values = stats()
+            except Exception:
+                continue  # a broken cache mustn't take the whole page down
+            if values:
+                samples.append((owner, name, values))
+        lines = []
+        for family, (kind, documentation, field) in families.items():
+            lines.append(f"# HELP {family} {documentation}")
+            lines.append(f"# TYPE {family} {kind}")
+            for owner, name, values in samples:
+                if field in values:
+                    lines.append(f"{family}{_labels(('owner', 'cache'), (owner, name))} {_number(values[field])}")
+        return lines
+
+REGISTRY = Registry()
+
+TOOL_CALLS = REGISTRY.counter("mcp_tool_calls_total", "Tool calls handled", ("server", "tool"))
+TOOL_ERRORS = REGISTRY.counter("mcp_tool_errors_total", "Tool calls that failed, by error type", ("server", "tool", "error"))
+TOOL_SECONDS = REGISTRY.histogram("mcp_tool_duration_seconds", "Time spent handling a tool call", ("server", "tool"))
+AUTH_CALLS = REGISTRY.counter(
+    "auth_calls_total", "Identity calls made by the tools: ok, error, timeout, or cached (answered from memory)",
+    ("operation", "outcome"),
+)
+AUTH_SECONDS = REGISTRY.histogram(
+    "auth_call_duration_seconds", "Time a tool waited for an identity call, including waiting for a free slot", ("operation",)
+)
+DESCOPE_REQUESTS = REGISTRY.counter("descope_requests_total", "Requests sent to Descope", ("operation", "outcome"))
+DESCOPE_SECONDS = REGISTRY.histogram("descope_request_duration_seconds", "Descope request latency", ("operation",))
+
+def merge_expositions(parts):
+    """Combine several processes' render() output into one page.
+
+    parts is a list of (labels, text), where labels ({"session": "0"}) are
+    added to every sample of that text. Each metric family is written once,
+    with the samples from all the parts under it.
+    """
+    families = {}  # family name -> [HELP line, TYPE line, samples...]
+    for labels, text in parts:
+        extra = ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items())
+        family = None
+        for line in text.splitlines():
+            if line.startswith("# "):
+                fields = line.split(" ", 3)
+                if len(fields) >= 3 and fields[1] in ("HELP", "TYPE"):
+                    family = families.setdefault(fields[2], [None, None])
+                    header = 0 if fields[1] == "HELP" else 1
+                    if family[header] is None:
+                        family[header] = line
+                continue
+            if not line.strip() or family is None:
+                continue
+            if extra:
+                cut = min(index for index in (line.find("{"), line.find(" "), len(line)) if index >= 0)
+                if line[cut:cut + 1] == "{":
+                    line = line[:cut + 1] + extra + ("," if line[cut + 1:cut + 2] != "}" else "") + line[cut + 1:]
+                else:
+                    line = line[:cut] + "{" + extra + "}" + line[cut:]
+            family.append(line)
+    lines = []
+    for family in families.values():
+        lines.extend(line for line in family if line is not None)
+    return "\n".join(lines) + "\n"
+
+_tool_call = contextvars.ContextVar("tool_call", default=None)
+_tool_names = set()
+
+def instrument_tool_calls(server_name):
+    """Decorator for a call_tool dispatcher: counts calls, errors and latency per tool.
+
+    Handlers that catch their own exceptions report them with tool_failed().
+    """
+    def decorate(dispatch):
+        @functools.wraps(dispatch)
+        async def dispatch_and_measure(name, arguments):
+            call = [None]  # the error type, once someone reports one
+            token = _tool_call.set(call)
+            started = time.perf_counter()
+            try:
+                return await dispatch(name, arguments)
+            except BaseException as e:
+                call[0] = type(e).__name__
+                raise
+            finally:
+                elapsed = time.perf_counter() - started
+                _tool_call.reset(token)
+                tool = _tool_label(name)
+                TOOL_CALLS.inc(server_name, tool)
+                TOOL_SECONDS.observe(elapsed, server_name, tool)
+                if call[0] is not None:
+                    TOOL_ERRORS.inc(server_name, tool, call[0])
+        return dispatch_and_measure
+    return decorate
+
+def _tool_label(name):
+    if name in _tool_names:
+        return name
+    if len(_tool_names) < MAX_TOOL_NAMES:
+        _tool_names.add(name)
+        return name
+    return "other"
+
+def tool_failed(error):
+    """Count the tool call in progress as failed (for handlers that turn exceptions into a friendly reply)"""
+    call = _tool_call.get()
+    if call is not None:
+        call[0] = type(error).__name__
+
+def lru_cache_stats(function):
+    """A stats() function for watch_cache() reading a functools.lru_cache's cache_info()"""
+    def stats():
+        info = function.cache_info()
+        lookups = info.hits + info.misses
+        return {
+            "size": info.currsize,
+            "hits": info.hits,
+            "misses": info.misses,
+            "hit_ratio": info.hits / lookups if lookups else 0.0,
+        }
+    return stats
+
+@contextmanager
+def descope_request(operation):
+    """Time one request to Descope; it counts as an error if it raises"""
+    started = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "ok"
+    finally:
+        DESCOPE_SECONDS.observe(time.perf_counter() - started, operation)
+        DESCOPE_REQUESTS.inc(operation, outcome)
+
+def start_periodic_dump(interval_seconds, path=None, registry=REGISTRY):
+    """Write the metrics every interval_seconds on a daemon thread, for the stdio server.
+
+    There stdout belongs to MCP and there's no port to scrape. With path, the
+    file is replaced atomically each time (point node_exporter's textfile
+    collector at it). Without a path, the metrics go to stderr. Returns an
+    Event; set it to stop.
+    """
+    stop = threading.Event()
+
+    def run():
+        while not stop.wait(interval_seconds):
+            try:
+                text = registry.render()
+                if path:
+                    partial = path + ".tmp"
+                    with open(partial, "w", encoding="utf-8") as f:
+                        f.write(text)
+                    os.replace(partial, path)
+                else:
+                    sys.stderr.write(f"# metrics at {time.strftime('%Y-%m-%dT%H:%M:%S')}\n{text}")
+                    sys.stderr.flush()
+            except Exception as e:
+                print("Failed to write metrics: " + str(e), file=sys.stderr)
+
+    threading.Thread(target=run, name="metrics-dump", daemon=True).start()
+    return stop
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+SQLite-backed storage for volunteer opportunities, shared by both MCP servers and the web UI
+"""
+
+import json
+import os
+import sqlite3
+import threading
+
+from gazetteer import Gazetteer
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DB_PATH = os.path.join(BASE_DIR, "opportunities.db")
+SEED_FILE = os.path.join(BASE_DIR, "sample_opportunities.json")
+
+# Columns stored as-is on the opportunities table (categories live in their own table)
+FIELDS = (
+    "id", "title", "organization", "description", "location", "date", "time",
+    "registration_link", "image_url", "latitude", "longitude",
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS opportunities (
+    seq INTEGER PRIMARY KEY,
+    id TEXT NOT NULL UNIQUE,
+    title TEXT NOT NULL,
+    organization TEXT NOT NULL,
+    description TEXT NOT NULL,
+    location TEXT NOT NULL,
+    place_id TEXT,
+    date TEXT,
+    time TEXT,
+    registration_link TEXT NOT NULL,
+    image_url TEXT,
+    latitude REAL,
+    longitude REAL,
+    version INTEGER NOT NULL DEFAULT 1
+);
+CREATE INDEX IF NOT EXISTS idx_opportunities_place ON opportunities (place_id);
+CREATE INDEX IF NOT EXISTS idx_opportunities_date ON opportunities (date);
+
+CREATE TABLE IF NOT EXISTS opportunity_categories (
+    category TEXT NOT NULL,
+    opportunity_id TEXT NOT NULL REFERENCES opportunities (id) ON DELETE CASCADE,
+    rank INTEGER NOT NULL,
+    PRIMARY KEY (category, opportunity_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_categories_opportunity ON opportunity_categories (opportunity_id);
+
+CREATE TABLE IF NOT EXISTS catalog_meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO catalog_meta (key, value) VALUES ('version', 0);
+"""
+
+class OpportunityStore:
+    """Get, upsert and delete opportunities; searching is left to the in-memory catalogs"""
+
+    def __init__(self, path=DEFAULT_DB_PATH, gazetteer=None):
+        self.path = path
+        self.gazetteer = gazetteer or Gazetteer()
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA foreign_keys = ON")
+        if path != ":memory:":
+            # WAL lets the servers and the web UI read while someone else writes
+            self._db.execute("PRAGMA journal_mode = WAL")
+        self._db.executescript(SCHEMA)
+
+    def close(self):
+        self._db.close()
+
+    def version(self):
+        """A number that goes up every time the catalog changes"""
+        with self._lock:
+            return self._db.execute("SELECT value FROM catalog_meta WHERE key = 'version'").fetchone()[0]
+
+    def count(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM opportunities").fetchone()[0]
+
+    def get(self, opportunity_id):
+        with self._lock:
+            rows = self._select("WHERE o.id = ?", [opportunity_id])
+        return rows[0] if rows else None
+
+    def all(self):
+        """Every opportunity, in the order they were first added"""
+        with self._lock:
+            return self._select("", [])
+
+    def upsert(self, opportunity):
+        """Add an opportunity, or replace the one with the same id; returns its new version"""
+        return self.upsert_many([opportunity])[0]
+
+    def upsert_many(self, opportunities):
+        """Upsert several opportunities in one transaction; returns their new versions in order"""
+        return self.apply(upserts=opportunities)[0]
+
+    def apply(self, upserts=(), removals=()):
+        """Upsert and delete in one transaction; returns (new versions, ids that were deleted)"""
+        with self._lock, self._db:
+            versions = [self._write(opportunity) for opportunity in upserts]
+            deleted = [
+                opportunity_id for opportunity_id in removals
+                if self._db.execute("DELETE FROM opportunities WHERE id = ?", [opportunity_id]).rowcount
+            ]
+            if versions or deleted:
+                self._bump_version()
+            return versions, deleted
+
+    def _write(self, opportunity):
+        values = [opportunity.get(field) for field in FIELDS]
+        place_id = self.gazetteer.resolve(opportunity["location"])
+        categories = list(dict.fromkeys(getattr(category, "value", category) for category in opportunity["categories"]))
+        self._db.execute(
+            "INSERT INTO opportunities (%s, place_id) VALUES (%s, ?) "
+            "ON CONFLICT (id) DO UPDATE SET %s, place_id = excluded.place_id, version = version + 1"
+            % (", ".join(FIELDS), ", ".join("?" * len(FIELDS)),
+               ", ".join("%s = excluded.%s" % (field, field) for field in FIELDS[1:])),
+            values + [place_id],
+        )
+        self._db.execute("DELETE FROM opportunity_categories WHERE opportunity_id = ?", [opportunity["id"]])
+        self._db.executemany(
+            "INSERT INTO opportunity_categories (category, opportunity_id, rank) VALUES (?, ?, ?)",
+            [(category, opportunity["id"], rank) for rank, category in enumerate(categories)],
+        )
+        return self._db.execute("SELECT version FROM opportunities WHERE id = ?", [opportunity["id"]]).fetchone()[0]
+
+    def delete(self, opportunity_id):
+        """Remove an opportunity; returns False if it wasn't there"""
+        return bool(self.delete_many([opportunity_id]))
+
+    def delete_many(self, opportunity_ids):
+        """Remove several opportunities in one transaction; returns the ids that were there"""
+        return self.apply(removals=opportunity_ids)[1]
+
+    def seed(self, opportunities):
+        """Load opportunities into an empty store (does nothing if it already has some)"""
+        if self.count():
+            return False
+        self.upsert_many(opportunities)
+        return True
+
+    def _bump_version(self):
+        self._db.execute("UPDATE catalog_meta SET value = value + 1 WHERE key = 'version'")
+
+    def _select(self, where, params):
+        sql = (
+            "SELECT o.*, (SELECT group_concat(category) FROM (SELECT category FROM opportunity_categories c "
+            "WHERE c.opportunity_id = o.id ORDER BY c.rank)) AS categories FROM opportunities o %s ORDER BY o.seq" % where
+        )
+        rows = self._db.execute(sql, params).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    @staticmethod
+    def _to_dict(row):
+        opportunity = {field: row[field] for field in FIELDS}
+        opportunity["categories"] = row["categories"].split(",") if row["categories"] else []
+        opportunity["version"] = row["version"]
+        return opportunity
+
+def open_store(path=None):
+    """Open the shared opportunity store, filling it with the sample catalog the first time"""
+    store = OpportunityStore(path or os.getenv("OPPORTUNITY_DB") or DEFAULT_DB_PATH)
+    if not store.count():
+        with open(SEED_FILE, encoding="utf-8") as f:
+            store.seed(json.load(f))
+    return store
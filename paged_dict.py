@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+A dict split into pages, so copies share every page they don't change
+"""
+
+PAGE_COUNT = 256
+PAGE_MASK = PAGE_COUNT - 1
+
+class PagedDict:
+    """A mapping whose copy() is O(pages) instead of O(items).
+
+    Keys are spread over a fixed number of plain dicts by hash. A copy starts
+    out sharing all of them and copies a page only the first time it writes
+    to it, so changing a few keys in a copy of a big map costs a few small
+    dict copies. The catalog snapshots use it for their per-row tables.
+    """
+
+    __slots__ = ("_pages", "_owned", "_size")
+
+    def __init__(self, items=()):
+        self._pages = [{} for _ in range(PAGE_COUNT)]
+        self._owned = None  # pages this copy may change in place (None: all of them)
+        self._size = 0
+        for key, value in dict(items).items():
+            self[key] = value
+
+    def copy(self):
+        clone = PagedDict.__new__(PagedDict)
+        clone._pages = list(self._pages)
+        clone._owned = set()
+        clone._size = self._size
+        return clone
+
+    def _writable(self, index):
+        if self._owned is not None and index not in self._owned:
+            self._pages[index] = dict(self._pages[index])
+            self._owned.add(index)
+        return self._pages[index]
+
+    def __getitem__(self, key):
+        return self._pages[hash(key) & PAGE_MASK][key]
+
+    def get(self, key, default=None):
+        return self._pages[hash(key) & PAGE_MASK].get(key, default)
+
+    def __contains__(self, key):
+        return key in self._pages[hash(key) & PAGE_MASK]
+
+    def __setitem__(self, key, value):
+        page = self._writable(hash(key) & PAGE_MASK)
+        if key not in page:
+            self._size += 1
+        page[key] = value
+
+    def setdefault(self, key, default=None):
+        page = self._pages[hash(key) & PAGE_MASK]
+        if key in page:
+            return page[key]
+        self[key] = default
+        return default
+
+    def __delitem__(self, key):
+        del self._writable(hash(key) & PAGE_MASK)[key]
+        self._size -= 1
+
+    def pop(self, key, *default):
+        index = hash(key) & PAGE_MASK
+        if key not in self._pages[index]:
+            if default:
+                return default[0]
+            raise KeyError(key)
+        self._size -= 1
+        return self._writable(index).pop(key)
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self):
+        for page in self._pages:
+            yield from page
+
+    def keys(self):
+        return iter(self)
+
+    def values(self):
+        for page in self._pages:
+            yield from page.values()
+
+    def items(self):
+        for page in self._pages:
+            yield from page.items()
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Opt-in sampling profiles of tool calls, written as collapsed stacks for flame graphs
+
+A fraction of tool calls (PROFILE_SAMPLE_RATE, or the set_profiling tool) is
+profiled: while the call runs, a background thread looks at the event loop
+thread's stack every PROFILE_INTERVAL_MS and counts what it sees. Each call
+becomes one file in PROFILE_DIR, one "frame;frame;frame count" line per
+stack, ready for flamegraph.pl or speedscope. The root frame names the tool
+and the shape of its arguments (never their values, which can hold session
+tokens). Only the newest PROFILE_MAX_FILES files are kept.
+
+With the rate at 0 (the default) a tool call costs one attribute check.
+"""
+
+import functools
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+
+# Python only hands the GIL to another thread this often, which caps how finely we can sample
+DEFAULT_SWITCH_INTERVAL = sys.getswitchinterval()
+
+def argument_shape(arguments):
+    """The argument names and types without their values, e.g. interests=list[2],location=str"""
+    if not isinstance(arguments, dict):
+        return type(arguments).__name__
+    parts = []
+    for key in sorted(arguments):
+        value = arguments[key]
+        if isinstance(value, (list, tuple, dict)):
+            parts.append(f"{key}={type(value).__name__}[{len(value)}]")
+        else:
+            parts.append(f"{key}={type(value).__name__}")
+    return ",".join(parts)
+
+class _Recording:
+    """Stacks seen while one tool call was running"""
+
+    def __init__(self, root, thread_id):
+        self.root = root
+        self.thread_id = thread_id
+        self.stacks = Counter()
+
+class ToolProfiler:
+    """Profiles a sampled fraction of the tool calls going through a call_tool dispatcher.
+
+    Samples cover everything the event loop thread does while the call is in
+    flight, so time spent waiting (in select) or on other requests shows up
+    too; that's what the call was waiting on.
+    """
+
+    def __init__(self, server_name, rate=0.0, directory="profiles", interval_seconds=0.001, max_files=200):
+        self.server_name = server_name
+        self.directory = directory
+        self.max_files = max_files
+        self.rate = 0.0
+        self.interval_seconds = interval_seconds
+        self.written = 0
+        self._active = set()
+        self._sampler = None
+        self._labels = {}  # code object -> frame label
+        self._lock = threading.Lock()
+        self._sequence = 0
+        self.configure(rate=rate, interval_seconds=interval_seconds)
+
+    @classmethod
+    def from_env(cls, server_name):
+        return cls(
+            server_name,
+            rate=float(os.getenv("PROFILE_SAMPLE_RATE", "0")),
+            directory=os.getenv("PROFILE_DIR", "profiles"),
+            interval_seconds=float(os.getenv("PROFILE_INTERVAL_MS", "1")) / 1000,
+            max_files=int(os.getenv("PROFILE_MAX_FILES", "200")),
+        )
+
+    def configure(self, rate=None, interval_seconds=None):
+        """Change the share of calls profiled (0 turns profiling off, 1 profiles every call) and the sampling interval"""
+        if rate is not None:
+            rate = float(rate)
+            if not 0.0 <= rate <= 1.0:
+                raise ValueError("The sample rate must be between 0 and 1")
+            self.rate = rate
+        if interval_seconds is not None:
+            interval_seconds = float(interval_seconds)
+            if interval_seconds <= 0:
+                raise ValueError("The sampling interval must be positive")
+            self.interval_seconds = interval_seconds
+
+    def describe(self):
+        if not self.rate:
+            return "Profiling is off"
+        return (f"Profiling {self.rate:.0%} of tool calls, sampling every {self.interval_seconds * 1000:g} ms, "
+                f"into {os.path.abspath(self.directory)} ({self.written} profiles written so far)")
+
+    def profile(self, dispatch):
+        """Decorator for a call_tool dispatcher"""
+        @functools.wraps(dispatch)
+        async def dispatch_and_profile(name, arguments):
+            rate = self.rate
+            if not rate or (rate < 1.0 and random.random() >= rate):
+                return await dispatch(name, arguments)
+            recording = self._begin(f"{name}({argument_shape(arguments)})")
+            started = time.perf_counter()
+            try:
+                return await dispatch(name, arguments)
+            finally:
+                self._end(recording)
+                self._write(recording, name, time.perf_counter() - started)
+        return dispatch_and_profile
+
+    def _begin(self, root):
+        recording = _Recording(root, threading.get_ident())
+        with self._lock:
+            if not self._active:
+                # Let the sampler get the GIL as often as it wants to sample
+                sys.setswitchinterval(min(DEFAULT_SWITCH_INTERVAL, self.interval_seconds))
+            self._active.add(recording)
+            if self._sampler is None:
+                self._sampler = threading.Thread(target=self._sample, name="tool-profiler", daemon=True)
+                self._sampler.start()
+        return recording
+
+    def _end(self, recording):
+        with self._lock:
+            self._active.discard(recording)
+            if not self._active:
+                sys.setswitchinterval(DEFAULT_SWITCH_INTERVAL)
+
+    def _sample(self):
+        while True:
+            with self._lock:
+                if not self._active:
+                    self._sampler = None
+                    return
+                recordings = list(self._active)
+            frames = sys._current_frames()
+            for recording in recordings:
+                frame = frames.get(recording.thread_id)
+                if frame is not None:
+                    recording.stacks[self._collapse(frame)] += 1
+            del frames
+            time.sleep(self.interval_seconds)
+
+    def _collapse(self, frame):
+        labels = []
+        while frame is not None:
+            code = frame.f_code
+            label = self._labels.get(code)
+            if label is None:
+                name = getattr(code, "co_qualname", code.co_name)
+                label = self._labels[code] = f"{name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+            labels.append(label)
+            frame = frame.f_back
+        labels.reverse()
+        return ";".join(labels)
+
+    def _write(self, recording, name, elapsed):
+        if not recording.stacks:
+            return  # over before the first sample
+        with self._lock:
+            self._sequence += 1
+            sequence = self._sequence
+        tool = re.sub(r"[^A-Za-z0-9_.-]", "_", str(name))[:64]
+        filename = (f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{sequence:06d}-"
+                    f"{self.server_name}-{tool}-{elapsed * 1000:.0f}ms.folded")
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(os.path.join(self.directory, filename), "w", encoding="utf-8") as f:
+                for stack, count in recording.stacks.most_common():
+                    f.write(f"{recording.root};{stack} {count}\n")
+            self.written += 1
+            self._rotate()
+        except OSError as e:
+            print("Failed to write a profile: " + str(e), file=sys.stderr)
+
+    def _rotate(self):
+        # Names start with the time, so sorting them puts the oldest first
+        profiles = sorted(name for name in os.listdir(self.directory) if name.endswith(".folded"))
+        for name in profiles[:max(len(profiles) - self.max_files, 0)]:
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass  # another process sharing the directory got there first
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Relevance scoring and top-k selection for opportunity searches
+"""
+
+import heapq
+import threading
+from bisect import bisect_right
+from datetime import date
+
+from data_models import ScoringWeights
+from geo_index import haversine_km
+
+def parse_date_ordinal(value):
+    """Turn "2023-10-15" into a day number, or None if there's no usable date"""
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(value).toordinal()
+    except ValueError:
+        return None
+
+class Scorer:
+    """Scores opportunities for one search: shared causes, closeness and how soon it happens"""
+
+    def __init__(self, weights: ScoringWeights, wanted_mask, origin=None, today=None):
+        self.weights = weights
+        self.wanted_mask = wanted_mask
+        self.origin = origin  # (latitude, longitude) the user is searching around, if any
+        self.today = (today or date.today()).toordinal()
+
+    def __call__(self, mask, point=None, date_ordinal=None):
+        """Return (score, distance_km); distance is None when we can't tell"""
+        weights = self.weights
+        score = weights.interests * bin(mask & self.wanted_mask).count("1")
+
+        distance = None
+        if self.origin is not None and point is not None:
+            distance = haversine_km(self.origin[0], self.origin[1], point[0], point[1])
+            score += weights.proximity / (1 + distance / weights.proximity_scale_km)
+
+        # Upcoming events score higher the sooner they are; past ones get nothing
+        if date_ordinal is not None and date_ordinal >= self.today:
+            score += weights.recency / (1 + (date_ordinal - self.today) / weights.recency_scale_days)
+
+        return score, distance
+
+def top_k(scored, k):
+    """Best k of (score, position, ...) tuples using a bounded heap: O(N log k), no full sort.
+
+    Ties go to the earlier catalog position so results stay stable.
+    """
+    keyed = ((entry[0], -entry[1], entry) for entry in scored)
+    if k:
+        best = heapq.nlargest(k, keyed)
+    else:
+        best = sorted(keyed, reverse=True)
+    return [entry for _, _, entry in best]
+
+class RankedResults:
+    """Search results handed out in order, sorted only as far as anyone has paged.
+
+    Takes (sort key, entry) pairs and heapifies them in O(N). Each page then
+    pops just the entries it needs, and pages already handed out are kept, so
+    reading page 3 never re-sorts pages 1 and 2. materialize, if given,
+    turns an entry into what a page hands out, once it makes it onto a page.
+    """
+
+    def __init__(self, keyed, materialize=None):
+        self._heap = list(keyed)
+        self._materialize = materialize
+        heapq.heapify(self._heap)
+        self._ranked = []
+        self._keys = []  # sort keys of _ranked
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._ranked) + len(self._heap)
+
+    def page(self, offset, limit):
+        with self._lock:
+            while len(self._ranked) < offset + limit and self._heap:
+                key, entry = heapq.heappop(self._heap)
+                self._ranked.append(self._materialize(entry) if self._materialize else entry)
+                self._keys.append(key)
+            return self._ranked[offset:offset + limit]
+
+    def key(self, index):
+        """The sort key of a result a page has already handed out"""
+        return self._keys[index]
+
+    def count_through(self, key):
+        """How many results sort at or before key: the offset of the first one after it"""
+        with self._lock:
+            return bisect_right(self._keys, key) + sum(1 for item in self._heap if item[0] <= key)
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Each user's top recommendations, worked out ahead of time and kept current as the catalog changes
+"""
+
+import threading
+from collections import defaultdict
+from datetime import date
+
+class RecommendationBook:
+    """A materialized top-k list per user, so serving recommendations is a dict lookup.
+
+    A user's list is computed when they save their interests. After that,
+    catalog changes only touch users who care about one of the changed
+    opportunity's causes. A new or updated opportunity is scored for just those
+    users and slotted into their lists if it makes the cut. A full recompute
+    only happens when something already on a user's list changes or goes away.
+    Recency scores depend on today's date, so a list is also rebuilt the first
+    time it is read on a new day.
+    """
+
+    def __init__(self, catalog, k=10, clock=date.today):
+        self.catalog = catalog
+        self.k = k
+        self.clock = clock
+        self.profiles = {}  # user id -> (interests, location)
+        self.lists = {}  # user id -> (day computed, [Match, ...] best first)
+        self.by_category = defaultdict(set)  # cause -> ids of users interested in it
+        self.recomputes = 0
+        self._lock = threading.RLock()
+        catalog.subscribe(self.on_catalog_change)
+
+    def __contains__(self, user_id):
+        return user_id in self.profiles
+
+    def set_profile(self, user_id, interests, location=None):
+        """Remember what a user cares about and (re)compute their list"""
+        interests = tuple(dict.fromkeys(getattr(interest, "value", interest) for interest in interests))
+        with self._lock:
+            self._unindex(user_id)
+            self.profiles[user_id] = (interests, location)
+            for interest in interests:
+                self.by_category[interest].add(user_id)
+            self._recompute(user_id)
+
+    def remove_profile(self, user_id):
+        with self._lock:
+            self._unindex(user_id)
+            self.profiles.pop(user_id, None)
+            self.lists.pop(user_id, None)
+
+    def get(self, user_id):
+        """The user's current recommendations, or None if we don't know their interests"""
+        entry = self.lists.get(user_id)
+        if entry is None:
+            return None
+        if entry[0] != self.clock():
+            with self._lock:
+                if user_id in self.profiles:
+                    self._recompute(user_id)
+                entry = self.lists.get(user_id, (None, []))
+        return entry[1]
+
+    def on_catalog_change(self, previous, current):
+        """Catalog listener: bring affected users' lists up to date"""
+        causes = set()
+        for opportunity in (previous, current):
+            if opportunity is not None:
+                causes.update(getattr(category, "value", category) for category in opportunity.categories)
+        opportunity_id = (current or previous).id
+
+        with self._lock:
+            affected = set()
+            for cause in causes:
+                affected |= self.by_category.get(cause, set())
+            for user_id in affected:
+                matches = self.lists.get(user_id, (None, []))[1]
+                if previous is not None and any(match.opportunity.id == opportunity_id for match in matches):
+                    # Something on their list changed or left; whatever replaces it could be anything
+                    self._recompute(user_id)
+                elif current is not None:
+                    self._offer(user_id, opportunity_id)
+
+    def _offer(self, user_id, opportunity_id):
+        # Put one new or changed opportunity on a user's list if it beats what's there
+        interests, location = self.profiles[user_id]
+        day, matches = self.lists[user_id]
+        if any(match.opportunity.id == opportunity_id for match in matches):
+            # A batch is published before its listeners run, so an earlier change's recompute already took it in
+            return
+        match = self.catalog.score_one(opportunity_id, interests, location, today=day)
+        if match is None:
+            return
+        key = self._rank_key(match)
+        if len(matches) >= self.k and key <= self._rank_key(matches[-1]):
+            return
+        matches = matches + [match]
+        matches.sort(key=self._rank_key, reverse=True)
+        self.lists[user_id] = (day, matches[:self.k])
+
+    def _recompute(self, user_id):
+        interests, location = self.profiles[user_id]
+        today = self.clock()
+        self.lists[user_id] = (today, self.catalog.find(interests, location, self.k, today=today))
+        self.recomputes += 1
+
+    def _rank_key(self, match):
+        # The same order find() uses: higher score first, then earlier catalog position
+        return match.score, -self.catalog.positions[match.opportunity.id]
+
+    def _unindex(self, user_id):
+        interests, _ = self.profiles.get(user_id, ((), None))
+        for interest in interests:
+            self.by_category[interest].discard(user_id)
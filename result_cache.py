@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Caches for search results: rendered opportunity blocks and whole responses
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+class LRUCache:
+    """A size-bounded least-recently-used cache with an optional time-to-live and hit/miss counters"""
+
+    def __init__(self, max_size=1024, ttl_seconds=None, clock=time.monotonic):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] is not None and entry[0] <= self.clock():
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value, ttl_seconds=None):
+        """Store value; ttl_seconds overrides the cache-wide time-to-live for this entry"""
+        ttl_seconds = ttl_seconds if ttl_seconds is not None else self.ttl_seconds
+        expires_at = self.clock() + ttl_seconds if ttl_seconds else None
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def discard(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+class FragmentCache:
+    """Each opportunity's rendered text block, keyed by id and record version"""
+
+    def __init__(self, render, max_size=100_000):
+        self.render = render
+        self._cache = LRUCache(max_size=max_size)
+
+    def get(self, opportunity):
+        key = (opportunity.id, opportunity.version)
+        text = self._cache.get(key)
+        if text is None:
+            text = self.render(opportunity)
+            self._cache.put(key, text)
+        return text
+
+    def discard(self, opportunity):
+        self._cache.discard((opportunity.id, opportunity.version))
+
+    def stats(self):
+        return self._cache.stats()
+
+class ResponseCache(LRUCache):
+    """Whole search responses keyed by the normalized query; a catalog change drops them all"""
+
+    def __init__(self, max_size=1024, ttl_seconds=300, clock=time.monotonic):
+        super().__init__(max_size=max_size, ttl_seconds=ttl_seconds, clock=clock)
+        self.catalog_version = None
+
+    def lookup(self, catalog_version, query):
+        if catalog_version != self.catalog_version:
+            self.clear()
+            self.catalog_version = catalog_version
+        return self.get((catalog_version, query))
+
+    def store(self, catalog_version, query, response):
+        # The version is part of the key, so a response computed just before a
+        # catalog change can never be served after it
+        self.put((catalog_version, query), response)
+
+def query_key(interests, location=None, max_results=None, **extra):
+    """Normalize a search so equivalent ones ("LA" vs "la", interests in any order) share a cache entry.
+
+    The location is only lowercased, like the substring match for places the
+    gazetteer doesn't know: stripping punctuation too would let "Main St."
+    and "Main St" share an entry although they can match different rows.
+    """
+    causes = tuple(sorted({getattr(interest, "value", interest) for interest in interests}))
+    return (causes, location.lower() if location else None, max_results) + tuple(sorted(extra.items()))
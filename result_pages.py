@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Paging through search results with opaque cursors, reporting progress while a full ranking is built
+"""
+
+import asyncio
+import base64
+import binascii
+import json
+
+from ranking import RankedResults
+from result_cache import LRUCache, query_key
+
+# How many candidates we score between progress updates (and chances for other requests to run)
+SCAN_CHUNK = 5000
+
+class CursorError(ValueError):
+    """A cursor we can't read, or one whose results are gone"""
+
+def encode_cursor(state):
+    text = json.dumps(state, separators=(",", ":"), sort_keys=True)
+    return base64.urlsafe_b64encode(text.encode("utf-8")).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        state = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        state["v"], state["o"], state["n"], state["q"]["interests"]
+    except (binascii.Error, ValueError, UnicodeError, KeyError, TypeError):
+        raise CursorError("That cursor isn't valid; please run the search again") from None
+    return state
+
+def search_spec(interests, location=None, near=None, radius_km=None, availability=None, upcoming=False):
+    """A search's parameters in the plain, canonical form that goes inside a cursor"""
+    return {
+        "interests": sorted({getattr(interest, "value", interest) for interest in interests}),
+        "location": location or None,
+        "near": list(near) if near is not None else None,
+        "radius_km": radius_km,
+        "availability": list(availability) if availability else None,
+        "upcoming": bool(upcoming),
+    }
+
+def _filters(spec):
+    # find() and scored() keyword arguments for a spec (cursors from before a filter existed just lack it)
+    near = tuple(spec["near"]) if spec.get("near") else None
+    return {
+        "near": near,
+        "radius_km": spec.get("radius_km"),
+        "availability": spec.get("availability"),
+        "upcoming": bool(spec.get("upcoming")),
+    }
+
+class Paginator:
+    """Serves a search one page at a time.
+
+    The first page of a plain search comes straight from find() (asking for
+    one extra result tells us whether there's more). Fetching any later page
+    scores every candidate once, heapifies them and caches the heap under the
+    catalog version and query. Each page after that only pops what it needs.
+    Cursors carry the version they were made against and the sort key of the
+    last result handed out. While the ranking is cached a cursor pages through
+    it, even if the catalog changes meanwhile; once it's gone and the catalog
+    has moved on, the search is ranked again and picks up after that key.
+    """
+
+    def __init__(self, catalog, max_searches=64, ttl_seconds=900):
+        self.catalog = catalog
+        self.searches = LRUCache(max_size=max_searches, ttl_seconds=ttl_seconds)
+
+    async def page(self, spec=None, page_size=5, cursor=None, progress=None):
+        """Return (matches, offset, total, next_cursor); total is None when we didn't need to count.
+
+        progress, if given, is awaited as progress(scanned, message) while a
+        later page's full ranking is built. The first page of a search doesn't
+        need one and is picked with a bounded top-k instead.
+        """
+        snapshot = self.catalog.snapshot()
+        after = None
+        if cursor:
+            state = decode_cursor(cursor)
+            spec, version, offset, page_size = state["q"], state["v"], state["o"], state["n"]
+            after = tuple(state["k"]) if state.get("k") else None
+        else:
+            version, offset = snapshot.version, 0
+        if page_size < 1:
+            raise ValueError("max_results must be at least 1")
+        filters = _filters(spec)
+        availability = tuple(filters["availability"] or ())
+        query = query_key(spec["interests"], spec.get("location"), None, **dict(filters, availability=availability))
+
+        ranked = self.searches.get((version, query))
+        if ranked is None and not offset:
+            matches = snapshot.find(spec["interests"], spec.get("location"), page_size + 1, **filters)
+            next_cursor = None
+            if len(matches) > page_size:
+                last = _sort_key(snapshot, spec, matches[page_size - 1])
+                next_cursor = self._cursor(version, spec, page_size, page_size, last)
+            return matches[:page_size], 0, None, next_cursor
+
+        if ranked is None:
+            moved = snapshot.version != version
+            if moved:
+                if after is None:
+                    raise CursorError("The catalog has changed since this search; please run it again")
+                # The ranking this cursor was paging through is gone: rank the current catalog and pick
+                # up after the last result the cursor handed out, at that ranking's own offsets from now on
+                version = snapshot.version
+                ranked = self.searches.get((version, query))
+            if ranked is None:
+                ranked = await self._rank(snapshot, spec, filters, progress)
+                self.searches.put((version, query), ranked)
+            if moved:
+                offset = ranked.count_through(after)
+        matches = ranked.page(offset, page_size)
+        next_offset = offset + len(matches)
+        next_cursor = None
+        if next_offset < len(ranked):
+            next_cursor = self._cursor(version, spec, next_offset, page_size, ranked.key(next_offset - 1))
+        return matches, offset, len(ranked), next_cursor
+
+    async def _rank(self, snapshot, spec, filters, progress):
+        keyed = []
+        scanned = 0
+        for item in snapshot.scored(spec["interests"], spec.get("location"), **filters):
+            keyed.append(item)
+            scanned += 1
+            if scanned % SCAN_CHUNK == 0:
+                if progress is not None:
+                    await progress(scanned, f"Checked {scanned} matching opportunities so far")
+                await asyncio.sleep(0)
+        if progress is not None:
+            await progress(scanned, f"Ranking {scanned} matching opportunities")
+        return RankedResults(keyed, snapshot.materialize)
+
+    @staticmethod
+    def _cursor(version, spec, offset, page_size, last_key):
+        return encode_cursor({"v": version, "q": spec, "o": offset, "n": page_size, "k": list(last_key)})
+
+def _sort_key(snapshot, spec, match):
+    """The key scored() gives a match find() returned: closest first for a nearest search, else best score first"""
+    position = snapshot.positions.get(match.opportunity.id)
+    if spec.get("near") and spec.get("radius_km") is None:
+        return (match.distance_km, position)
+    return (-match.score, position)
+
+def progress_notifier(server):
+    """An async progress(done, message) that sends MCP progress notifications for the current request.
+
+    Returns None outside a request or if the client didn't ask for progress.
+    """
+    try:
+        context = server.request_context
+    except LookupError:
+        return None
+    token = getattr(context.meta, "progressToken", None) if context.meta else None
+    if token is None:
+        return None
+
+    async def notify(done, message=None):
+        try:
+            await context.session.send_progress_notification(token, done, None, message)
+        except Exception:
+            pass  # progress is a courtesy; it must never fail the search
+    return notify
@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+When opportunities happen and when volunteers are free: parsing, and an index for time range queries
+"""
+
+import re
+from bisect import bisect_left, insort
+from datetime import date, datetime
+
+from paged_dict import PagedDict
+
+# Times are whole minutes since 0001-01-01, in the event's local time (opportunities don't carry a time zone)
+MINUTES_PER_DAY = 24 * 60
+
+# An event with a start time but no end is assumed to last this long
+DEFAULT_DURATION_MINUTES = 60
+
+# How far ahead "Saturdays" or "weekday evenings" reach
+AVAILABILITY_HORIZON_DAYS = 90
+
+# The longest date range we expand into daily windows ("2024-01-01 to 2024-03-01 mornings")
+MAX_RANGE_DAYS = 366
+
+ISO_DATE = re.compile(r"\b(\d{4}-\d{2}-\d{2})\b")
+CLOCK = r"(?:\b(noon|midnight)\b|(?<![\d:])(\d{1,2})(?!\d)(?:[:.](\d{2}))?\s*(?:([ap])\.?\s*m\b\.?)?)"
+TIME_RANGE = re.compile(CLOCK + r"\s*(?:-|–|—|to|until|till)\s*" + CLOCK, re.IGNORECASE)
+SINGLE_TIME = re.compile(CLOCK, re.IGNORECASE)
+RANGE_WORDS = re.compile(r"\bto\b|\bthrough\b|\buntil\b|\s[-–—]\s|/")
+ANYTIME = re.compile(r"\bany\s*time\b|\bany\s*day\b|\bflexible\b|\bwhenever\b|\bdaily\b|\bevery\s*day\b")
+
+PARTS_OF_DAY = {
+    "morning": (6 * 60, 12 * 60),
+    "afternoon": (12 * 60, 17 * 60),
+    "evening": (17 * 60, 22 * 60),
+    "night": (18 * 60, 24 * 60),
+}
+
+WEEKDAYS = {
+    "mon": (0,), "monday": (0,), "tue": (1,), "tues": (1,), "tuesday": (1,),
+    "wed": (2,), "wednesday": (2,), "thu": (3,), "thur": (3,), "thurs": (3,), "thursday": (3,),
+    "fri": (4,), "friday": (4,), "sat": (5,), "saturday": (5,), "sun": (6,), "sunday": (6,),
+    "weekday": (0, 1, 2, 3, 4), "weekend": (5, 6),
+}
+DAY_WORDS = WEEKDAYS.keys() | PARTS_OF_DAY.keys()
+
+def timestamp(moment):
+    """A date or datetime as minutes since 0001-01-01"""
+    minutes = moment.hour * 60 + moment.minute if isinstance(moment, datetime) else 0
+    return moment.toordinal() * MINUTES_PER_DAY + minutes
+
+def to_datetime(stamp):
+    day, minutes = divmod(stamp, MINUTES_PER_DAY)
+    return datetime.fromordinal(day).replace(hour=minutes // 60, minute=minutes % 60)
+
+def _clock(word, hour, minute, meridiem):
+    # One matched CLOCK as minutes after midnight, or None if it isn't a real time
+    if word:
+        return 12 * 60 if word.lower() == "noon" else 0
+    hour, minute = int(hour), int(minute or 0)
+    if meridiem:
+        if not 1 <= hour <= 12:
+            return None
+        hour = hour % 12 + (12 if meridiem.lower() == "p" else 0)
+    if hour > 23 or minute > 59:
+        return None
+    return hour * 60 + minute
+
+def parse_time_range(text):
+    """Turn "9:00 AM - 12:00 PM" (or "9-11am", "14:00 to 16:30", "7pm") into (start, end) minutes after midnight.
+
+    An end at or before the start runs past midnight, so it comes back
+    bigger than a day. Returns None if there's no time in the text.
+    """
+    if not text:
+        return None
+    match = TIME_RANGE.search(text)
+    if match:
+        start_parts, end_parts = match.groups()[:4], match.groups()[4:]
+        end = _clock(*end_parts)
+        if not start_parts[3] and end_parts[3] and not start_parts[0]:
+            # "9-11am": the start shares the end's am/pm, unless that puts it after the end ("11-1pm")
+            start = _clock(*start_parts[:3], end_parts[3])
+            if start is not None and end is not None and start > end:
+                start = _clock(*start_parts[:3], "a")
+        else:
+            start = _clock(*start_parts)
+            if start is not None and end is not None and not start_parts[3] and not end_parts[3] and end < min(start, 12 * 60):
+                end += 12 * 60  # "9-5" is a working day, not an overnight shift
+        if start is not None and end is not None:
+            return start, end + MINUTES_PER_DAY if end <= start else end
+
+    for match in SINGLE_TIME.finditer(text):
+        word, hour, minute, meridiem = match.groups()
+        # A bare number isn't a time ("Saturday 10" could mean anything)
+        if word or minute or meridiem:
+            start = _clock(word, hour, minute, meridiem)
+            if start is not None:
+                return start, start + DEFAULT_DURATION_MINUTES
+    return None
+
+def parse_days(text):
+    """(first, last) day numbers from "2023-10-15" or "2023-10-15 to 2023-10-17", or None"""
+    days = [day for day in map(_ordinal, ISO_DATE.findall(text or "")) if day is not None]
+    if not days:
+        return None
+    return min(days[:2]), max(days[:2])
+
+def event_interval(date_text, time_text=None):
+    """When an opportunity happens, as (start, end) timestamps, or None if it has no usable date.
+
+    A date without a time takes the whole day.
+    """
+    days = parse_days(date_text)
+    if days is None:
+        return None
+    first, last = days
+    start, end = parse_time_range(time_text) or (0, MINUTES_PER_DAY)
+    return first * MINUTES_PER_DAY + start, last * MINUTES_PER_DAY + end
+
+def availability_windows(entries, today=None, horizon_days=AVAILABILITY_HORIZON_DAYS):
+    """Turn availability like ["Saturday mornings", "2023-10-20", "weekdays 6-9pm"] into sorted (start, end) windows.
+
+    Recurring entries are expanded over the next horizon_days from today.
+    Returns None when the availability doesn't restrict anything: none was
+    given, none of it made sense to us, or the user said they're free anytime.
+    """
+    first_day = (today or date.today()).toordinal()
+    windows = []
+    for entry in entries or ():
+        text = entry.lower()
+        if ANYTIME.search(text):
+            return None
+        windows.extend(_entry_windows(text, first_day, horizon_days))
+    return merge_windows(windows) if windows else None
+
+def _entry_windows(text, first_day, horizon_days):
+    dates = [day for day in map(_ordinal, ISO_DATE.findall(text)) if day is not None]
+    rest = ISO_DATE.sub(" ", text)
+    # "Saturdays", "mornings": plurals mean the same as the singular here
+    words = [word[:-1] if word[:-1] in DAY_WORDS else word for word in re.findall(r"[a-z]+", rest)]
+
+    hours = parse_time_range(rest)
+    spans = [hours] if hours else [PARTS_OF_DAY[word] for word in words if word in PARTS_OF_DAY]
+
+    if dates:
+        if len(dates) >= 2 and RANGE_WORDS.search(rest):
+            first, last = min(dates[:2]), max(dates[:2])
+            if not spans:
+                return [(first * MINUTES_PER_DAY, (last + 1) * MINUTES_PER_DAY)]
+            days = range(first, min(last, first + MAX_RANGE_DAYS - 1) + 1)
+        else:
+            days = dates
+    else:
+        weekdays = {weekday for word in words for weekday in WEEKDAYS.get(word, ())}
+        if not weekdays and not spans:
+            return []
+        days = [
+            day for day in range(first_day, first_day + horizon_days)
+            if not weekdays or date.fromordinal(day).weekday() in weekdays
+        ]
+
+    spans = spans or [(0, MINUTES_PER_DAY)]
+    return [(day * MINUTES_PER_DAY + start, day * MINUTES_PER_DAY + end) for day in days for start, end in spans]
+
+def _ordinal(value):
+    try:
+        return date.fromisoformat(value).toordinal()
+    except ValueError:
+        return None
+
+def merge_windows(windows):
+    """Sort windows and join the ones that overlap or touch"""
+    merged = []
+    for start, end in sorted(windows):
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+def from_moment(windows, moment):
+    """The parts of windows still ahead at moment"""
+    return [(max(start, moment), end) for start, end in windows if end > moment]
+
+def overlaps_any(interval, windows):
+    """Whether interval overlaps one of the windows (sorted and merged, as availability_windows returns them)"""
+    # Merged windows don't overlap, so the last one starting before the interval ends is the only candidate
+    index = bisect_left(windows, (interval[1],))
+    return index > 0 and windows[index - 1][1] > interval[0]
+
+class IntervalIndex:
+    """Opportunities sorted by start time, so "what's on between these two times" is a binary search.
+
+    Intervals live in a blocked sorted list: short sorted blocks of
+    (start, end, position), found by bisecting on each block's last entry.
+    An insert or removal only shifts one block, and copy() shares every
+    block it doesn't change, like the other snapshot indexes.
+
+    An interval overlaps [start, end) if it starts before end and ends after
+    start. Since no short interval is longer than the longest one we've
+    seen, only starts in [start - longest, end) can overlap, and that's one
+    bisect plus the matches. Rare long ones (multi-week events) are kept
+    aside and checked one by one, so they can't widen every query.
+    """
+
+    BLOCK_SIZE = 512
+    LONG_MINUTES = 7 * MINUTES_PER_DAY
+
+    def __init__(self):
+        self.intervals = PagedDict()  # catalog position -> (start, end)
+        self._blocks = []  # sorted lists of (start, end, position); every entry in a block sorts before the next block
+        self._maxes = []  # last entry of each block
+        self.long = {}  # catalog position -> (start, end) for intervals over LONG_MINUTES
+        self.longest = 0  # never shrinks; a stale value only widens the scan a little
+        self._owned = None  # ids of blocks this copy may change in place (None: all of them)
+
+    def __len__(self):
+        return len(self.intervals)
+
+    def copy(self):
+        clone = IntervalIndex.__new__(IntervalIndex)
+        clone.intervals = self.intervals.copy()
+        clone._blocks = list(self._blocks)
+        clone._maxes = list(self._maxes)
+        clone.long = self.long
+        clone.longest = self.longest
+        clone._owned = set()
+        return clone
+
+    def _writable(self, index):
+        block = self._blocks[index]
+        if self._owned is not None and id(block) not in self._owned:
+            block = self._blocks[index] = list(block)
+            self._owned.add(id(block))
+        return block
+
+    def add(self, position, interval):
+        start, end = interval
+        self.intervals[position] = interval
+        if end - start > self.LONG_MINUTES:
+            self.long = dict(self.long)
+            self.long[position] = interval
+            return
+        self.longest = max(self.longest, end - start)
+        entry = (start, end, position)
+        if not self._blocks:
+            block = [entry]
+            self._blocks.append(block)
+            self._maxes.append(entry)
+            if self._owned is not None:
+                self._owned.add(id(block))
+            return
+        index = min(bisect_left(self._maxes, entry), len(self._blocks) - 1)
+        block = self._writable(index)
+        insort(block, entry)
+        self._maxes[index] = block[-1]
+        if len(block) > 2 * self.BLOCK_SIZE:
+            half = block[self.BLOCK_SIZE:]
+            del block[self.BLOCK_SIZE:]
+            self._blocks.insert(index + 1, half)
+            self._maxes[index] = block[-1]
+            self._maxes.insert(index + 1, half[-1])
+            if self._owned is not None:
+                self._owned.add(id(half))
+
+    def remove(self, position):
+        interval = self.intervals.pop(position, None)
+        if interval is None:
+            return
+        if position in self.long:
+            self.long = dict(self.long)
+            del self.long[position]
+            return
+        entry = interval + (position,)
+        index = bisect_left(self._maxes, entry)
+        block = self._writable(index)
+        del block[bisect_left(block, entry)]
+        if block:
+            self._maxes[index] = block[-1]
+        else:
+            if self._owned is not None:
+                self._owned.discard(id(block))
+            del self._blocks[index]
+            del self._maxes[index]
+
+    def _entries_from(self, low):
+        # Every (start, end, position) at or after low, in order
+        first = bisect_left(self._maxes, low)
+        for index in range(first, len(self._blocks)):
+            block = self._blocks[index]
+            yield from block[bisect_left(block, low):] if index == first else block
+
+    def overlapping(self, start, end):
+        """Yield the positions of everything happening at some point in [start, end)"""
+        for entry_start, entry_end, position in self._entries_from((start - self.longest,)):
+            if entry_start >= end:
+                break
+            if entry_end > start:
+                yield position
+        for position, (long_start, long_end) in self.long.items():
+            if long_start < end and long_end > start:
+                yield position
+
+    def during(self, windows):
+        """Positions of everything overlapping any of the windows"""
+        found = set()
+        for start, end in windows:
+            found.update(self.overlapping(start, end))
+        return found
+
+    def ends_after(self, position, moment):
+        """Whether an opportunity is still on at moment (ones without a date always are)"""
+        interval = self.intervals.get(position)
+        return interval is None or interval[1] > moment
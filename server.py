@@ -1,79 +1,62 @@
 from mcp.server import Server
 from mcp.server.models import InitializationOptions
-from mcp.types import ListToolsResult, Tool, TextContent
+from mcp.types import CallToolResult, ListToolsResult, Tool, TextContent
+import asyncio
 import json
-from typing import List
+from datetime import date
+from typing import Dict, List, Optional, Tuple
 import auth_setup
+from async_auth import AsyncAuth
+from autocomplete import KINDS, MAX_SUGGESTIONS, Autocomplete
+from batch_matcher import BatchMatcher
+from catalog_editor import OPPORTUNITY_FIELDS_SCHEMA, REQUIRED_OPPORTUNITY_FIELDS, SESSION_TOKEN_SCHEMA, CatalogEditor
 from data_models import *
+from metrics import REGISTRY, instrument_tool_calls, tool_failed
+from opportunity_store import open_store
+from profiling import ToolProfiler
+from result_cache import FragmentCache, ResponseCache, query_key
+from result_pages import Paginator, progress_notifier, search_spec
+from shared_catalog import open_catalog
 
-# Some example volunteer opportunities to get started
-# In a real app, these would come from a database or API
-SAMPLE_VOLUNTEER_JOBS = [
-    {
-        "id": "1",
-        "title": "Beach Cleanup Day",
-        "organization": "Ocean Preservation Society",
-        "description": "Help clean up our local beaches and protect marine life from pollution. Gloves and bags provided!",
-        "categories": ["environment"],
-        "location": "Santa Monica Beach, CA",
-        "date": "2023-10-15",
-        "time": "9:00 AM - 12:00 PM",
-        "registration_link": "https://example.com/beach-cleanup",
-        "image_url": "https://example.com/images/beach-cleanup.jpg"
-    },
-    {
-        "id": "2",
-        "title": "Animal Shelter Helper",
-        "organization": "Paws and Claws Rescue",
-        "description": "Spend time with our furry friends! Walk dogs, socialize cats, and help with cleaning duties.",
-        "categories": ["animals"],
-        "location": "Los Angeles, CA",
-        "date": "2023-10-20",
-        "time": "1:00 PM - 4:00 PM",
-        "registration_link": "https://example.com/animal-shelter",
-        "image_url": "https://example.com/images/animal-shelter.jpg"
-    },
-    {
-        "id": "3",
-        "title": "Food Bank Volunteer",
-        "organization": "Community Food Share",
-        "description": "Help sort and package food donations for families in need. No experience needed!",
-        "categories": ["community", "homelessness"],
-        "location": "Downtown LA",
-        "date": "2023-10-18",
-        "time": "10:00 AM - 2:00 PM",
-        "registration_link": "https://example.com/food-bank",
-        "image_url": "https://example.com/images/food-bank.jpg"
-    },
-    {
-        "id": "4",
-        "title": "Tech Tutor for Seniors",
-        "organization": "Digital Literacy Foundation",
-        "description": "Teach seniors how to use smartphones, computers, and stay safe online. Patience is the only requirement!",
-        "categories": ["technology", "seniors"],
-        "location": "Westwood Community Center, CA",
-        "date": "2023-10-22",
-        "time": "3:00 PM - 5:00 PM",
-        "registration_link": "https://example.com/tech-tutor",
-        "image_url": "https://example.com/images/tech-tutor.jpg"
-    },
-    {
-        "id": "5",
-        "title": "Park Restoration Volunteer",
-        "organization": "City Parks Department",
-        "description": "Help restore native plants and maintain hiking trails in our beautiful local parks.",
-        "categories": ["environment", "community"],
-        "location": "Griffith Park, CA",
-        "date": "2023-10-25",
-        "time": "8:00 AM - 12:00 PM",
-        "registration_link": "https://example.com/park-restoration",
-        "image_url": "https://example.com/images/park-restoration.jpg"
-    }
-]
+def render_opportunity(opportunity: VolunteerOpportunity) -> str:
+    """Format one opportunity for the results list (without its number, which depends on the search)"""
+    lines = [
+        f"**{opportunity.title}** with {opportunity.organization}\n",
+        f"   📍 {opportunity.location}\n",
+        f"   📝 {opportunity.description}\n",
+    ]
+    if opportunity.date:
+        time_text = f" at {opportunity.time}" if opportunity.time else ""
+        lines.append(f"   📅 {opportunity.date}{time_text}\n")
+    lines.append(f"   🏷️  Causes: {', '.join(opportunity.categories)}\n")
+    lines.append(f"   🔗 Sign up: {opportunity.registration_link}\n\n")
+    return "".join(lines)
 
 class VolunteerMatchmaker:
-    def __init__(self):
+    def __init__(self, weights: Optional[ScoringWeights] = None, store=None):
         self.server = Server("community-volunteer-matchmaker")
+        # Volunteer opportunities live in the shared store; we just index them in memory
+        self.store = store or open_store()
+        self.catalog = open_catalog(self.store, weights=weights)
+        # Each opportunity is formatted once per version, and repeat searches reuse the whole answer
+        self.fragments = FragmentCache(render_opportunity)
+        self.responses = ResponseCache()
+        # Next pages are served from the search's ranking we already worked out
+        self.pages = Paginator(self.catalog)
+        # Organizers can add, change and retire opportunities while we're running
+        self.editor = CatalogEditor(self.store, self.catalog)
+        # Only people with an editor role may change the catalog; their tokens are checked off the event loop
+        self.auth = AsyncAuth.from_env()
+        self.catalog.subscribe(self._forget_rendered)
+        # Scores whole batches of profiles in one go (for the nightly recommendation job)
+        self.batch = BatchMatcher(self.catalog)
+        # Suggests places and organizations as people type them
+        self.autocomplete = Autocomplete(self.catalog)
+        # Samples where slow tool calls spend their time, when PROFILE_SAMPLE_RATE or set_profiling asks for it
+        self.profiler = ToolProfiler.from_env("server")
+        REGISTRY.watch_cache("server", "responses", self.responses.stats)
+        REGISTRY.watch_cache("server", "fragments", self.fragments.stats)
+        REGISTRY.watch_cache("server", "search_pages", self.pages.searches.stats)
         self.setup_tools()
     
     def setup_tools(self):
@@ -99,11 +82,86 @@ class VolunteerMatchmaker:
                             "max_results": {
                                 "type": "number",
                                 "description": "How many results would you like to see? (default: 5)"
+                            },
+                            "latitude": {
+                                "type": "number",
+                                "description": "Your latitude, to search by distance"
+                            },
+                            "longitude": {
+                                "type": "number",
+                                "description": "Your longitude, to search by distance"
+                            },
+                            "radius_km": {
+                                "type": "number",
+                                "description": "Only show opportunities within this many km (leave out to get the closest ones)"
+                            },
+                            "cursor": {
+                                "type": "string",
+                                "description": "Want to see more? Pass the cursor from the last page"
+                            },
+                            "availability": {
+                                "type": "array",
+                                "items": {"type": "string"},
+                                "description": "When are you free? e.g. \"Saturday mornings\", \"weekdays 6-9pm\" or \"2023-10-20\""
+                            },
+                            "upcoming_only": {
+                                "type": "boolean",
+                                "description": "Only show opportunities that haven't happened yet"
                             }
                         },
                         "required": ["interests"]
                     }
                 ),
+                Tool(
+                    name="search_opportunities",
+                    description="Search volunteer opportunities by keyword, like \"beach cleanup\" or \"tutoring\"",
+                    inputSchema={
+                        "type": "object",
+                        "properties": {
+                            "query": {
+                                "type": "string",
+                                "description": "What are you looking for?"
+                            },
+                            "interests": {
+                                "type": "array",
+                                "items": {"type": "string", "enum": [ic.value for ic in InterestCategory]},
+                                "description": "Only show opportunities for these causes (optional)"
+                            },
+                            "location": {
+                                "type": "string",
+                                "description": "Where would you like to volunteer? (optional)"
+                            },
+                            "max_results": {
+                                "type": "number",
+                                "description": "How many results would you like to see? (default: 5)"
+                            }
+                        },
+                        "required": ["query"]
+                    }
+                ),
+                Tool(
+                    name="autocomplete",
+                    description="Suggest places and organizations as they're typed, with how many opportunities each has (JSON)",
+                    inputSchema={
+                        "type": "object",
+                        "properties": {
+                            "prefix": {
+                                "type": "string",
+                                "description": "What's been typed so far"
+                            },
+                            "kinds": {
+                                "type": "array",
+                                "items": {"type": "string", "enum": list(KINDS)},
+                                "description": "Only suggest these (default: both)"
+                            },
+                            "max_results": {
+                                "type": "number",
+                                "description": f"How many suggestions would you like? (default: 8, at most {MAX_SUGGESTIONS})"
+                            }
+                        },
+                        "required": ["prefix"]
+                    }
+                ),
                 Tool(
                     name="set_my_interests",
                     description="Tell us what causes you care about to get better volunteer recommendations",
@@ -123,6 +181,45 @@ class VolunteerMatchmaker:
                         "required": ["interests"]
                     }
                 ),
+                Tool(
+                    name="match_many_profiles",
+                    description="Find the best volunteer opportunities for a whole list of people at once",
+                    inputSchema={
+                        "type": "object",
+                        "properties": {
+                            "profiles": {
+                                "type": "array",
+                                "items": {
+                                    "type": "object",
+                                    "properties": {
+                                        "user_id": {"type": "string"},
+                                        "interests": {
+                                            "type": "array",
+                                            "items": {"type": "string", "enum": [ic.value for ic in InterestCategory]}
+                                        },
+                                        "location": {"type": "string"},
+                                        "availability": {"type": "array", "items": {"type": "string"}}
+                                    },
+                                    "required": ["user_id", "interests"]
+                                },
+                                "description": "Who are we finding opportunities for?"
+                            },
+                            "max_results": {
+                                "type": "number",
+                                "description": "How many results per person? (default: 5)"
+                            },
+                            "date_from": {
+                                "type": "string",
+                                "description": "Only show opportunities from this date on (YYYY-MM-DD)"
+                            },
+                            "date_to": {
+                                "type": "string",
+                                "description": "Only show opportunities up to this date (YYYY-MM-DD)"
+                            }
+                        },
+                        "required": ["profiles"]
+                    }
+                ),
                 Tool(
                     name="check_my_interests",
                     description="See what volunteer causes you've told us you care about",
@@ -130,84 +227,354 @@ class VolunteerMatchmaker:
                         "type": "object",
                         "properties": {}
                     }
+                ),
+                Tool(
+                    name="add_opportunity",
+                    description="Add a new volunteer opportunity so people can find it (editors only)",
+                    inputSchema={
+                        "type": "object",
+                        "properties": dict(OPPORTUNITY_FIELDS_SCHEMA, session_token=SESSION_TOKEN_SCHEMA),
+                        "required": REQUIRED_OPPORTUNITY_FIELDS
+                    }
+                ),
+                Tool(
+                    name="update_opportunity",
+                    description="Change the details of a volunteer opportunity (only send what changed; editors only)",
+                    inputSchema={
+                        "type": "object",
+                        "properties": dict(OPPORTUNITY_FIELDS_SCHEMA, session_token=SESSION_TOKEN_SCHEMA),
+                        "required": ["id"]
+                    }
+                ),
+                Tool(
+                    name="retire_opportunity",
+                    description="Take down a volunteer opportunity that's finished or cancelled (editors only)",
+                    inputSchema={
+                        "type": "object",
+                        "properties": {
+                            "id": {
+                                "type": "string",
+                                "description": "Which opportunity should come down?"
+                            },
+                            "session_token": SESSION_TOKEN_SCHEMA
+                        },
+                        "required": ["id"]
+                    }
+                ),
+                Tool(
+                    name="set_profiling",
+                    description="Profile some of the tool calls to see where slow ones spend their time (flame graph stacks; admins only)",
+                    inputSchema={
+                        "type": "object",
+                        "properties": {
+                            "session_token": auth_setup.ADMIN_TOKEN_SCHEMA,
+                            "sample_rate": {
+                                "type": "number",
+                                "description": "What share of calls should be profiled? 0 turns it off, 1 profiles every call"
+                            },
+                            "interval_ms": {
+                                "type": "number",
+                                "description": "How many milliseconds between stack samples?"
+                            }
+                        }
+                    }
+                ),
+                Tool(
+                    name="get_metrics",
+                    description="How busy and how fast each tool has been, and how well the caches are doing (Prometheus text format; admins only)",
+                    inputSchema={"type": "object", "properties": {"session_token": auth_setup.ADMIN_TOKEN_SCHEMA}}
                 )
             ]
             return ListToolsResult(tools=tools)
         
         @self.server.call_tool()
+        @instrument_tool_calls("server")
+        @self.profiler.profile
         async def use_tool(name: str, arguments: dict) -> List[TextContent]:
             """Handle requests to use our tools"""
             if name == "find_volunteer_opportunities":
-                return await self.find_opportunities(arguments)
+                return await self.versioned(self.find_opportunities, arguments)
+            elif name == "search_opportunities":
+                return await self.search_opportunities(arguments)
+            elif name == "autocomplete":
+                return await self.versioned(self.suggest, arguments)
             elif name == "set_my_interests":
                 return await self.save_interests(arguments)
             elif name == "check_my_interests":
                 return await self.show_interests(arguments)
+            elif name == "match_many_profiles":
+                return await self.match_many_profiles(arguments)
+            elif name == "add_opportunity":
+                return await self.add_opportunity(arguments)
+            elif name == "update_opportunity":
+                return await self.update_opportunity(arguments)
+            elif name == "retire_opportunity":
+                return await self.retire_opportunity(arguments)
+            elif name == "set_profiling":
+                return await self.set_profiling(arguments)
+            elif name == "get_metrics":
+                return await self.show_metrics(arguments)
             else:
                 raise ValueError(f"We don't have a tool called '{name}'")
     
+    async def versioned(self, handler, arguments: dict):
+        """A catalog read's reply, tagged with the store version it was answered from (_meta.catalog_version)"""
+        # Read before answering, since the answer may come from a newer catalog but never an older one
+        version = self.catalog.store_version
+        content = await handler(arguments)
+        if version is None:
+            return content
+        return CallToolResult(content=content, _meta={"catalog_version": version})
+
     async def find_opportunities(self, arguments: dict) -> List[TextContent]:
         """Find volunteer opportunities that match what the user cares about"""
         try:
             # Understand what the user is looking for
             request = OpportunityMatchRequest(**arguments)
             
-            # Look for matching opportunities
-            good_matches = []
-            for opportunity_data in SAMPLE_VOLUNTEER_JOBS:
-                opportunity = VolunteerOpportunity(**opportunity_data)
-                
-                # Check if this matches the user's interests
-                matches_interests = any(category in request.interests for category in opportunity.categories)
-                
-                # Check if it's in the right area if specified
-                matches_location = True
-                if request.location and request.location.lower() not in opportunity.location.lower():
-                    matches_location = False
-                
-                if matches_interests and matches_location:
-                    good_matches.append(opportunity)
-                    
-                    # Stop if we have enough results
-                    if request.max_results and len(good_matches) >= request.max_results:
-                        break
+            # Same question against the same catalog? Reuse the answer we already built
+            # (availability is read from today on, and "upcoming" changes by the minute, so those depend on the clock too)
+            cache_key = query_key(
+                request.interests, request.location, request.max_results,
+                latitude=request.latitude, longitude=request.longitude, radius_km=request.radius_km, cursor=request.cursor,
+                availability=tuple(request.availability or ()), day=date.today().toordinal() if request.availability else None
+            )
+            catalog_version = self.catalog.version
+            cacheable = not request.upcoming_only
+            if cacheable:
+                cached_text = self.responses.lookup(catalog_version, cache_key)
+                if cached_text is not None:
+                    return [TextContent(type="text", text=cached_text)]
+            
+            # Distance searches need both coordinates
+            near = None
+            if request.latitude is not None and request.longitude is not None:
+                near = (request.latitude, request.longitude)
+            
+            # Look for the best matching opportunities (the catalog index skips rows that can't match).
+            # Later pages come from the ranking we saved for the first one, all from one catalog snapshot.
+            matches, offset, total, next_cursor = await self.pages.page(
+                search_spec(request.interests, request.location, near, request.radius_km, request.availability, request.upcoming_only),
+                request.max_results or 5, request.cursor,
+                progress_notifier(self.server)
+            )
+            # Catalog records are already validated, so we only stamp this search's score on a copy
+            good_matches = [
+                match.opportunity.model_copy(update={"score": round(match.score, 3)})
+                for match in matches
+            ]
             
-            # Prepare our response
-            response = OpportunityMatchResponse(
+            # Prepare our response (no need to validate the records a second time)
+            response = OpportunityMatchResponse.model_construct(
                 opportunities=good_matches,
                 match_count=len(good_matches)
             )
+            more_text = f"👉 There's more! Ask again with cursor {next_cursor} to see the next page.\n\n" if next_cursor else ""
+            if offset:
+                header = f"🎉 Here are more volunteer opportunities for you ({offset + 1}-{offset + len(good_matches)} of {total}):\n\n"
+            else:
+                header = f"🎉 We found {total or len(good_matches)} volunteer opportunities for you!\n\n"
             
             # If we didn't find anything
             if not good_matches:
+                result_text = "We couldn't find any volunteer opportunities that match your criteria. 😔\n\nTry broadening your interests or checking a different location."
+            else:
+                # Format the results in a friendly way, reusing each opportunity's cached block
+                parts = [header]
+                for i, opportunity in enumerate(good_matches, offset + 1):
+                    parts.append(f"{i}. {self.fragments.get(opportunity)}")
+                parts.append(more_text)
+                parts.append("Thank you for wanting to make a difference in your community! 🌟")
+                result_text = "".join(parts)
+            
+            if cacheable:
+                self.responses.store(catalog_version, cache_key, result_text)
+            return [TextContent(type="text", text=result_text)]
+            
+        except Exception as e:
+            tool_failed(e)
+            return [TextContent(
+                type="text", 
+                text=f"Sorry, we encountered a problem while searching: {str(e)}"
+            )]
+    
+    async def search_opportunities(self, arguments: dict) -> List[TextContent]:
+        """Find opportunities by the words in their title, organization and description"""
+        try:
+            query = arguments.get("query", "")
+            interests = [InterestCategory(interest) for interest in arguments.get("interests") or []]
+            matches = self.catalog.search(
+                query, interests=interests, location=arguments.get("location"),
+                max_results=int(arguments.get("max_results", 5))
+            )
+            
+            if not matches:
                 return [TextContent(
                     type="text",
-                    text="We couldn't find any volunteer opportunities that match your criteria. 😔\n\nTry broadening your interests or checking a different location."
+                    text=f"We couldn't find any volunteer opportunities mentioning \"{query}\". 😔\n\nTry different words or fewer filters."
                 )]
             
-            # Format the results in a friendly way
-            result_text = f"🎉 We found {len(good_matches)} volunteer opportunities for you!\n\n"
-            
-            for i, opportunity in enumerate(good_matches, 1):
-                result_text += f"{i}. **{opportunity.title}** with {opportunity.organization}\n"
-                result_text += f"   📍 {opportunity.location}\n"
-                result_text += f"   📝 {opportunity.description}\n"
-                if opportunity.date:
-                    result_text += f"   📅 {opportunity.date}"
-                    if opportunity.time:
-                        result_text += f" at {opportunity.time}"
-                    result_text += "\n"
-                result_text += f"   🏷️  Causes: {', '.join(opportunity.categories)}\n"
-                result_text += f"   🔗 Sign up: {opportunity.registration_link}\n\n"
+            parts = [f"🔎 {len(matches)} volunteer opportunities match \"{query}\":\n\n"]
+            for i, match in enumerate(matches, 1):
+                parts.append(f"{i}. {self.fragments.get(match.opportunity)}")
+            return [TextContent(type="text", text="".join(parts))]
             
-            result_text += "Thank you for wanting to make a difference in your community! 🌟"
+        except Exception as e:
+            tool_failed(e)
+            return [TextContent(
+                type="text", 
+                text=f"Sorry, we encountered a problem while searching: {str(e)}"
+            )]
+    
+    async def suggest(self, arguments: dict) -> List[TextContent]:
+        """Places and organizations starting with what the user has typed, busiest first"""
+        try:
+            suggestions = self.autocomplete.suggest(
+                arguments.get("prefix", ""), kinds=arguments.get("kinds") or KINDS,
+                limit=int(arguments.get("max_results", 8))
+            )
+            return [TextContent(type="text", text=json.dumps([suggestion._asdict() for suggestion in suggestions]))]
             
-            return [TextContent(type="text", text=result_text)]
+        except Exception as e:
+            tool_failed(e)
+            return [TextContent(type="text", text=f"Sorry, we couldn't look up suggestions: {str(e)}")]
+    
+    def _forget_rendered(self, previous: Optional[VolunteerOpportunity], current: Optional[VolunteerOpportunity]) -> None:
+        """Catalog listener: an old version's rendered block will never be shown again"""
+        if previous is not None:
+            self.fragments.discard(previous)
+    
+    async def _authorize(self, arguments: dict, roles) -> Tuple[Optional[dict], Optional[List[TextContent]]]:
+        """(user info, None) if the caller's session token carries one of roles, else (None, the reply to send instead)"""
+        session_token = arguments.get("session_token")
+        if not session_token:
+            return None, [TextContent(type="text", text="Authentication required. Please provide a session token.")]
+        user_info = await self.auth.verify_session_token(session_token)
+        if not user_info:
+            return None, [TextContent(type="text", text="Invalid session token. Please login again.")]
+        if not auth_setup.has_role(user_info, roles):
+            return None, [TextContent(type="text", text=f"Sorry, only people with the {' or '.join(sorted(roles))} role can do that.")]
+        return user_info, None
+    
+    async def add_opportunity(self, arguments: dict) -> List[TextContent]:
+        """Put a new volunteer opportunity in front of people straight away"""
+        try:
+            user_info, denied = await self._authorize(arguments, auth_setup.EDITOR_ROLES)
+            if denied:
+                return denied
+            fields = {key: value for key, value in arguments.items() if key != "session_token"}
+            opportunity = self.editor.add_opportunity(fields)
+            return [TextContent(type="text", text=f"✅ '{opportunity.title}' is now listed (id {opportunity.id}).")]
+        except asyncio.TimeoutError as e:
+            tool_failed(e)
+            return [TextContent(type="text", text="The login service is taking too long to respond. Please try again in a moment.")]
+        except Exception as e:
+            tool_failed(e)
+            return [TextContent(type="text", text=f"Sorry, we couldn't add that opportunity: {str(e)}")]
+    
+    async def update_opportunity(self, arguments: dict) -> List[TextContent]:
+        """Change the details of a listed opportunity"""
+        try:
+            user_info, denied = await self._authorize(arguments, auth_setup.EDITOR_ROLES)
+            if denied:
+                return denied
+            changes = {key: value for key, value in arguments.items() if key != "session_token"}
+            opportunity = self.editor.update_opportunity(changes.pop("id", None), changes)
+            return [TextContent(type="text", text=f"✅ '{opportunity.title}' has been updated.")]
+        except asyncio.TimeoutError as e:
+            tool_failed(e)
+            return [TextContent(type="text", text="The login service is taking too long to respond. Please try again in a moment.")]
+        except Exception as e:
+            tool_failed(e)
+            return [TextContent(type="text", text=f"Sorry, we couldn't update that opportunity: {str(e)}")]
+    
+    async def retire_opportunity(self, arguments: dict) -> List[TextContent]:
+        """Take down an opportunity that's over or cancelled"""
+        try:
+            user_info, denied = await self._authorize(arguments, auth_setup.EDITOR_ROLES)
+            if denied:
+                return denied
+            opportunity_id = arguments.get("id")
+            if self.editor.retire_opportunity(opportunity_id):
+                return [TextContent(type="text", text=f"✅ Opportunity {opportunity_id} has been taken down.")]
+            return [TextContent(type="text", text=f"We couldn't find an opportunity with id {opportunity_id}.")]
+        except asyncio.TimeoutError as e:
+            tool_failed(e)
+            return [TextContent(type="text", text="The login service is taking too long to respond. Please try again in a moment.")]
+        except Exception as e:
+            tool_failed(e)
+            return [TextContent(type="text", text=f"Sorry, we couldn't take that opportunity down: {str(e)}")]
+    
+    async def _operator_check(self, arguments: dict) -> Optional[List[TextContent]]:
+        """None if this call may use the operator tools, else the reply to send instead"""
+        if auth_setup.OPERATOR_TOOLS_OPEN:
+            return None
+        user_info, denied = await self._authorize(arguments, auth_setup.ADMIN_ROLES)
+        return denied
+    
+    async def set_profiling(self, arguments: dict) -> List[TextContent]:
+        """Turn profiling of tool calls on, off, or change how much of it we do"""
+        try:
+            denied = await self._operator_check(arguments)
+            if denied:
+                return denied
+            interval_ms = arguments.get("interval_ms")
+            self.profiler.configure(
+                rate=arguments.get("sample_rate"),
+                interval_seconds=None if interval_ms is None else float(interval_ms) / 1000
+            )
+            return [TextContent(type="text", text=self.profiler.describe())]
+        except asyncio.TimeoutError as e:
+            tool_failed(e)
+            return [TextContent(type="text", text="The login service is taking too long to respond. Please try again in a moment.")]
+        except Exception as e:
+            tool_failed(e)
+            return [TextContent(type="text", text=f"Sorry, we couldn't change profiling: {str(e)}")]
+    
+    async def show_metrics(self, arguments: dict) -> List[TextContent]:
+        """This server's metrics, for admins and operators"""
+        try:
+            denied = await self._operator_check(arguments)
+            if denied:
+                return denied
+            return [TextContent(type="text", text=REGISTRY.render())]
+        except asyncio.TimeoutError as e:
+            tool_failed(e)
+            return [TextContent(type="text", text="The login service is taking too long to respond. Please try again in a moment.")]
+        except Exception as e:
+            tool_failed(e)
+            return [TextContent(type="text", text=f"Sorry, we couldn't collect the metrics: {str(e)}")]
+    
+    def match_profiles(self, profiles: List[UserInterests], max_results: int = 5,
+                       date_from: Optional[str] = None, date_to: Optional[str] = None) -> Dict[str, List[VolunteerOpportunity]]:
+        """Best opportunities for each profile, scored in one vectorized pass over the catalog"""
+        results = self.batch.match(profiles, max_results, date_from=date_from, date_to=date_to)
+        return {
+            user_id: [match.opportunity.model_copy(update={"score": round(match.score, 3)}) for match in matches]
+            for user_id, matches in results.items()
+        }
+    
+    async def match_many_profiles(self, arguments: dict) -> List[TextContent]:
+        """Find opportunities for a whole batch of people at once"""
+        try:
+            results = self.match_profiles(
+                arguments.get("profiles", []),
+                int(arguments.get("max_results", 5)),
+                date_from=arguments.get("date_from"),
+                date_to=arguments.get("date_to")
+            )
+            # This one is meant for other programs, so the answer is JSON
+            payload = {
+                user_id: [opportunity.model_dump(include={"id", "title", "score"}) for opportunity in opportunities]
+                for user_id, opportunities in results.items()
+            }
+            return [TextContent(type="text", text=json.dumps({"results": payload}))]
             
         except Exception as e:
+            tool_failed(e)
             return [TextContent(
                 type="text", 
-                text=f"Sorry, we encountered a problem while searching: {str(e)}"
+                text=f"Sorry, we couldn't match those profiles: {str(e)}"
             )]
     
     async def save_interests(self, arguments: dict) -> List[TextContent]:
@@ -242,6 +609,7 @@ class VolunteerMatchmaker:
                 )]
                 
         except Exception as e:
+            tool_failed(e)
             return [TextContent(
                 type="text", 
                 text=f"Sorry, we encountered a problem: {str(e)}"
@@ -271,6 +639,7 @@ class VolunteerMatchmaker:
             )]
                 
         except Exception as e:
+            tool_failed(e)
             return [TextContent(
                 type="text", 
                 text=f"Sorry, we couldn't retrieve your interests: {str(e)}"
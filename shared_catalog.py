@@ -0,0 +1,341 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+The catalog and its match indexes in one read-only file that every worker process maps into memory
+
+publish() writes the store's opportunities as a columnar catalog (see
+columnar_catalog.py) to a single file: cause bitmasks, places, coordinates,
+event times, the full-text postings and the text itself, as flat aligned
+arrays. It then points the directory's CURRENT file at the new file with
+os.replace. Workers open the file with SharedCatalog, which maps it
+read-only, so every process reads the same pages of the OS page cache and
+an extra worker costs about the same however big the catalog is. A reader
+notices a new CURRENT within check_seconds and swaps to it in one
+assignment; snapshots it already handed out keep the old file mapped.
+
+Publishing rewrites the whole file from the store (O(catalog) plus an
+fsync), so a worker that edits the catalog doesn't publish every change.
+It applies its edits to an in-memory copy of the mapped snapshot and
+republishes at most once every publish_seconds; other workers see an edit
+within publish_seconds + check_seconds.
+"""
+
+import json
+import mmap
+import os
+import threading
+import time
+
+import numpy as np
+
+from catalog_index import OpportunityCatalog
+from columnar_catalog import ColumnarCatalog, ColumnarSnapshot
+from data_models import ScoringWeights, VolunteerOpportunity
+from gazetteer import Gazetteer
+
+try:
+    import fcntl
+except ImportError:  # Windows: publishers aren't serialized, so run only one
+    fcntl = None
+
+MAGIC = b"CBCAT003"
+ALIGNMENT = 64  # every array starts on a cache line
+POINTER = "CURRENT"
+KEEP_FILES = 3  # older files are deleted; processes that still map one keep reading it
+PUBLISH_SECONDS = float(os.getenv("SHARED_CATALOG_PUBLISH_SECONDS", "5"))  # 0 republishes on every edit
+
+def write_catalog_file(opportunities, path, version, gazetteer=None):
+    """Write opportunities (dicts or VolunteerOpportunity) and their search arrays to path"""
+    meta, arrays = ColumnarSnapshot.build(opportunities, gazetteer).export()
+    header = dict(meta, version=version, arrays={})
+    offset = 0
+    for name, array in arrays.items():
+        array = arrays[name] = np.ascontiguousarray(array)
+        header["arrays"][name] = [offset, array.dtype.str, list(array.shape)]
+        offset += -(-array.nbytes // ALIGNMENT) * ALIGNMENT
+
+    encoded = json.dumps(header).encode("utf-8")
+    with open(path, "wb") as f:
+        f.write(MAGIC)
+        f.write(len(encoded).to_bytes(8, "little"))
+        f.write(encoded)
+        f.write(b"\0" * (-f.tell() % ALIGNMENT))
+        for array in arrays.values():
+            f.write(array.tobytes())
+            f.write(b"\0" * (-array.nbytes % ALIGNMENT))
+        f.flush()
+        os.fsync(f.fileno())
+
+def current_file(directory):
+    """Path of the catalog file CURRENT points at, or None if nothing has been published"""
+    try:
+        with open(os.path.join(directory, POINTER), encoding="utf-8") as f:
+            name = f.read().strip()
+    except FileNotFoundError:
+        return None
+    return os.path.join(directory, name) if name else None
+
+def _file_version(path):
+    # catalog-<store version>-<pid>.bin
+    return int(os.path.basename(path).split("-")[1])
+
+def publish(store, directory, keep=KEEP_FILES):
+    """Write the store's catalog to directory and point CURRENT at it; returns the file's path.
+
+    Does nothing if CURRENT already holds this store version or a newer one,
+    so every worker can call it on startup. Publishers on one host take turns
+    through a lock file, so CURRENT never goes back to an older version.
+    """
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, ".lock"), "w") as lock:
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        version = store.version()
+        current = current_file(directory)
+        if current is not None and os.path.exists(current) and _file_version(current) >= version:
+            return current
+
+        name = "catalog-%012d-%d.bin" % (version, os.getpid())
+        path = os.path.join(directory, name)
+        write_catalog_file(store.all(), path + ".tmp", version, store.gazetteer)
+        os.replace(path + ".tmp", path)
+        pointer = os.path.join(directory, POINTER)
+        with open(pointer + ".tmp", "w", encoding="utf-8") as f:
+            f.write(name)
+        os.replace(pointer + ".tmp", pointer)
+
+        # Names sort by version; unlinking a file doesn't disturb anyone who still has it mapped
+        published = sorted(entry for entry in os.listdir(directory) if entry.startswith("catalog-") and entry.endswith(".bin"))
+        for old in published[:max(len(published) - keep, 0)]:
+            if old != name:
+                os.remove(os.path.join(directory, old))
+        return path
+
+
+class MappedSnapshot(ColumnarSnapshot):
+    """One published catalog file, mapped read-only; the arrays are views straight into the mapping.
+
+    Positions are row numbers in the file, in the order opportunities were
+    first added to the store, so ranking ties break the same way.
+    """
+
+    def __init__(self, path, gazetteer=None, weights=None):
+        self.path = path
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[:len(MAGIC)] != MAGIC:
+            raise ValueError(path + " is not a catalog file (or one written by another version)")
+        header_length = int.from_bytes(self._map[8:16], "little")
+        header = json.loads(self._map[16:16 + header_length])
+        base = -(-(16 + header_length) // ALIGNMENT) * ALIGNMENT
+        arrays = {}
+        for name, (offset, dtype, shape) in header.pop("arrays").items():
+            count = int(np.prod(shape))
+            arrays[name] = (
+                np.frombuffer(self._map, dtype=np.dtype(dtype), count=count, offset=base + offset).reshape(shape)
+                if count else np.zeros(shape, dtype=np.dtype(dtype))
+            )
+        super().__init__(header, arrays, gazetteer=gazetteer, weights=weights, version=header["version"])
+
+class SharedCatalog:
+    """The live catalog as published in a shared directory, with OpportunityCatalog's interface.
+
+    snapshot() hands out the current MappedSnapshot, checking CURRENT at most
+    every check_seconds. When another process publishes, listeners hear
+    about each row that was added, changed or removed. Changes go to the
+    store first (CatalogEditor does that). apply() puts them in a local
+    edited copy of the snapshot straight away and republishes from the store
+    publish_seconds later, taking in whatever else changed by then. If the
+    store has moved on by more than this batch (another process edited it
+    too), apply() republishes at once instead, since only the store has
+    those other edits.
+    """
+
+    def __init__(self, directory, store=None, gazetteer=None, weights=None, check_seconds=1.0,
+                 publish_seconds=PUBLISH_SECONDS):
+        self.directory = directory
+        self.store = store
+        self.check_seconds = check_seconds
+        self.publish_seconds = publish_seconds
+        self._gazetteer = gazetteer or Gazetteer()
+        self._weights = weights or ScoringWeights()
+        self._snapshot = None  # the mapped snapshot, or a local edited copy of it
+        self._unpublished = None  # store version the local copy is at, until a file that has it is mapped
+        self._publisher = None  # timer for the deferred publish
+        self._checked_at = 0.0
+        self._refresh_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._listeners = []
+        self.refresh()
+        if self._snapshot is None:
+            raise FileNotFoundError("Nothing has been published in " + directory)
+
+    @classmethod
+    def from_store(cls, store, directory, **options):
+        """Publish the store's catalog if it's newer than what's in directory, then map it"""
+        publish(store, directory)
+        return cls(directory, store=store, gazetteer=options.pop("gazetteer", store.gazetteer), **options)
+
+    def snapshot(self):
+        if time.monotonic() - self._checked_at >= self.check_seconds:
+            self.refresh()
+        return self._snapshot
+
+    def refresh(self):
+        """Switch to the file CURRENT points at if it's a new one; returns the (previous, current) row changes"""
+        with self._refresh_lock:
+            self._checked_at = time.monotonic()
+            path = current_file(self.directory)
+            if path is None or (self._snapshot is not None and path == getattr(self._snapshot, "path", None)):
+                return []
+            if self._unpublished is not None and _file_version(path) < self._unpublished:
+                return []  # that file hasn't got this process's edits yet; the deferred publish will
+            snapshot = MappedSnapshot(path, self._gazetteer, self._weights)
+            self._unpublished = None
+            previous, self._snapshot = self._snapshot, snapshot
+            changes = _changes(previous, snapshot) if previous is not None else []
+            for old, new in changes:
+                for listener in self._listeners:
+                    listener(old, new)
+            return changes
+
+    @property
+    def version(self):
+        return self.snapshot().version
+
+    @property
+    def store_version(self):
+        """The store version of the current snapshot (published files and local edits both use the store's)"""
+        return self.snapshot().version
+
+    @property
+    def weights(self):
+        return self._weights
+
+    @property
+    def gazetteer(self):
+        return self._gazetteer
+
+    @property
+    def rows(self):
+        return self.snapshot().rows
+
+    @property
+    def positions(self):
+        return self.snapshot().positions
+
+    def __len__(self):
+        return len(self.snapshot())
+
+    def __iter__(self):
+        return iter(self.snapshot())
+
+    def get(self, opportunity_id):
+        return self.snapshot().get(opportunity_id)
+
+    def find(self, *args, **kwargs):
+        return self.snapshot().find(*args, **kwargs)
+
+    def score_one(self, *args, **kwargs):
+        return self.snapshot().score_one(*args, **kwargs)
+
+    def scored(self, *args, **kwargs):
+        return self.snapshot().scored(*args, **kwargs)
+
+    def search(self, *args, **kwargs):
+        return self.snapshot().search(*args, **kwargs)
+
+    def subscribe(self, listener):
+        """Call listener(previous, current) for every row that changes; either side is None for an add or a removal"""
+        self._listeners.append(listener)
+
+    def apply(self, upserts=(), removals=()):
+        """Take a batch of changes the store has already taken; returns (previous, current) for the batch.
+
+        upserts carry the record versions the store gave them. Unless
+        publish_seconds is 0 or another process has changed the store too,
+        the batch goes into a local copy of the snapshot and is published
+        later; otherwise the store is republished now, and upserts only say
+        which ids to report on, in order, followed by the removals that took
+        effect.
+        """
+        if self.store is None:
+            raise RuntimeError("This shared catalog is read-only (it has no store to publish from)")
+        with self._write_lock:
+            version = self.store.version()
+            with self._refresh_lock:
+                if self.publish_seconds > 0 and version == self._snapshot.version + 1:
+                    self._snapshot, changes = self._snapshot.edited(upserts, removals)
+                    self._snapshot.version = version  # it holds what the store held at that version
+                    self._unpublished = version
+                    if self._publisher is None:
+                        self._publisher = threading.Timer(self.publish_seconds, self.flush)
+                        self._publisher.daemon = True
+                        self._publisher.start()
+                    for previous, current in changes:
+                        for listener in self._listeners:
+                            listener(previous, current)
+                    return changes
+
+            before = self._snapshot
+            self._publish()
+            after = self._snapshot
+            changes = []
+            for opportunity in upserts:
+                opportunity_id = opportunity.id if isinstance(opportunity, VolunteerOpportunity) else opportunity["id"]
+                changes.append((before.get(opportunity_id), after.get(opportunity_id)))
+            for opportunity_id in removals:
+                previous = before.get(opportunity_id)
+                if previous is not None and after.get(opportunity_id) is None:
+                    changes.append((previous, None))
+            return changes
+
+    def flush(self):
+        """Publish edits this process has only applied locally so far"""
+        with self._write_lock:
+            if self._unpublished is not None:
+                self._publish()
+
+    def _publish(self):
+        # Under the write lock
+        if self._publisher is not None:
+            self._publisher.cancel()
+            self._publisher = None
+        publish(self.store, self.directory)
+        self.refresh()
+
+    def upsert(self, opportunity):
+        return self.apply(upserts=[opportunity])[0][1]
+
+    def remove(self, opportunity_id):
+        return bool(self.apply(removals=[opportunity_id]))
+
+def _changes(before, after):
+    """(previous, current) for every row added, changed (a new record version) or removed between two snapshots"""
+    # Only live rows: a locally edited snapshot keeps its removed rows' slots
+    before_rows, after_rows = np.flatnonzero(before.arrays["live"]), np.flatnonzero(after.arrays["live"])
+    before_hashes, after_hashes = before.arrays["id_hashes"][before_rows], after.arrays["id_hashes"][after_rows]
+    _, kept_before, kept_after = np.intersect1d(before_hashes, after_hashes, assume_unique=True, return_indices=True)
+    changed = before.arrays["versions"][before_rows[kept_before]] != after.arrays["versions"][after_rows[kept_after]]
+    removed = before_rows[np.setdiff1d(np.arange(len(before_hashes)), kept_before, assume_unique=True)]
+    added = after_rows[np.setdiff1d(np.arange(len(after_hashes)), kept_after, assume_unique=True)]
+    kept_before, kept_after = before_rows[kept_before], after_rows[kept_after]
+    return (
+        [(before.rows[old], after.rows[new]) for old, new in zip(kept_before[changed].tolist(), kept_after[changed].tolist())]
+        + [(before.rows[old], None) for old in removed.tolist()]
+        + [(None, after.rows[new]) for new in added.tolist()]
+    )
+
+def open_catalog(store, weights=None):
+    """The catalog a server searches.
+
+    Shared through SHARED_CATALOG_DIR when that's set. Otherwise it's built in
+    this process, as columns with CATALOG_LAYOUT=columnar, or as one model
+    object per opportunity (the default).
+    """
+    directory = os.getenv("SHARED_CATALOG_DIR")
+    if directory:
+        return SharedCatalog.from_store(store, directory, weights=weights)
+    if os.getenv("CATALOG_LAYOUT", "objects") == "columnar":
+        return ColumnarCatalog.from_store(store, weights=weights)
+    return OpportunityCatalog.from_store(store, weights=weights)
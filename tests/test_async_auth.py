@@ -0,0 +1,27 @@
+import asyncio
+import threading
+
+from async_auth import AsyncAuth
+
+def test_a_call_that_timed_out_keeps_its_slot_until_its_thread_finishes():
+    release = threading.Event()
+
+    async def run():
+        auth = AsyncAuth(max_concurrency=1, timeout_seconds=0.05)
+        try:
+            await auth._call("verify_session", release.wait)
+        except asyncio.TimeoutError:
+            pass
+        # The first call's thread is still blocked, so there's no slot for a second one
+        try:
+            await auth._call("verify_session", lambda: "second")
+            blocked = False
+        except asyncio.TimeoutError:
+            blocked = True
+        release.set()
+        await asyncio.sleep(0.05)
+        third = await auth._call("verify_session", lambda: "third")
+        auth.close()
+        return blocked, third
+
+    assert asyncio.run(run()) == (True, "third")
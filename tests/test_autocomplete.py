@@ -0,0 +1,56 @@
+import json
+import os
+import random
+
+from autocomplete import CACHED_RANGE, Autocomplete
+from catalog_index import OpportunityCatalog
+from data_models import VolunteerOpportunity
+
+SAMPLE_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "sample_opportunities.json")
+
+def sample_rows():
+    with open(SAMPLE_FILE, encoding="utf-8") as f:
+        return [VolunteerOpportunity(**record) for record in json.load(f)]
+
+def suggested(typeahead, prefix, kind):
+    return [(suggestion.text, suggestion.count) for suggestion in typeahead.suggest(prefix, kinds=(kind,))]
+
+def test_counts_follow_catalog_edits():
+    catalog = OpportunityCatalog(sample_rows())
+    typeahead = Autocomplete(catalog)
+    # Every sample opportunity is somewhere in Los Angeles, and "la" is one of its aliases
+    assert dict(suggested(typeahead, "Los", "location")) == {"Los Angeles": 5, "Los Feliz": 1, "Downtown LA": 1}
+    assert suggested(typeahead, "la", "location")[0] == ("Los Angeles", 5)
+    assert suggested(typeahead, "park", "organization") == [("City Parks Department", 1)]
+
+    catalog.upsert(catalog.get("2").model_copy(update={"location": "Brooklyn, NY"}))
+    catalog.remove("5")
+    assert dict(suggested(typeahead, "Los", "location")) == {"Los Angeles": 3, "Downtown LA": 1}
+    assert suggested(typeahead, "new york", "location") == [("New York City", 1), ("New York State", 1)]
+    assert suggested(typeahead, "bro", "location") == [("Brooklyn", 1)]
+    assert suggested(typeahead, "park", "organization") == []
+    assert suggested(typeahead, "griffith", "location") == []
+
+def test_broad_prefixes_stay_right_as_counts_change():
+    rng = random.Random(2)
+    template = sample_rows()[0]
+    names = ["Shelter %d Society" % i for i in range(3 * CACHED_RANGE)]
+    rows = [template.model_copy(update={"id": str(i), "organization": rng.choice(names[:1000])}) for i in range(2000)]
+    catalog = OpportunityCatalog(rows)
+    typeahead = Autocomplete(catalog)
+    assert "" in typeahead._tables["organization"].cached
+
+    for _ in range(200):
+        opportunity_id = str(rng.randrange(2100))
+        if rng.random() < 0.3:
+            catalog.remove(opportunity_id)
+        else:
+            catalog.upsert(template.model_copy(update={"id": opportunity_id, "organization": rng.choice(names)}))
+
+    fresh = Autocomplete(catalog)
+    counts = catalog.snapshot().value_counts("organization")
+    for prefix in ("", "s", "shelter", "shelter 1", "society"):
+        found = typeahead.suggest(prefix, kinds=("organization",), limit=20)
+        expected = fresh.suggest(prefix, kinds=("organization",), limit=20)
+        assert [suggestion.count for suggestion in found] == [suggestion.count for suggestion in expected]
+        assert all(counts[suggestion.text] == suggestion.count for suggestion in found)
@@ -0,0 +1,45 @@
+import json
+import os
+from datetime import date
+
+import pytest
+
+from batch_matcher import BatchMatcher
+from catalog_index import OpportunityCatalog
+from columnar_catalog import ColumnarCatalog
+from data_models import InterestCategory, VolunteerOpportunity
+
+SAMPLE_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "sample_opportunities.json")
+TODAY = date(2023, 10, 1)
+
+def sample_rows():
+    with open(SAMPLE_FILE, encoding="utf-8") as f:
+        return [VolunteerOpportunity(**record) for record in json.load(f)]
+
+def listed(matches):
+    return [(match.opportunity.id, round(match.score, 6)) for match in matches]
+
+PROFILES = [
+    {"user_id": "beach", "interests": ["environment"]},
+    {"user_id": "local", "interests": ["community", "environment"], "location": "Los Angeles"},
+    {"user_id": "westside", "interests": ["technology", "animals", "seniors"], "location": "Santa Monica"},
+    {"user_id": "nobody", "interests": ["arts_culture"]},
+]
+
+@pytest.mark.parametrize("layout", [OpportunityCatalog, ColumnarCatalog])
+def test_batch_matches_agree_with_one_search_per_profile(layout):
+    catalog = layout(sample_rows())
+    matcher = BatchMatcher(catalog)
+
+    def check():
+        results = matcher.match(PROFILES, max_results=3, today=TODAY)
+        for profile in PROFILES:
+            expected = catalog.find(profile["interests"], profile.get("location"), 3, today=TODAY)
+            assert listed(results[profile["user_id"]]) == listed(expected)
+
+    check()
+    # The matcher picks up catalog changes before its next batch
+    catalog.upsert(catalog.get("2").model_copy(update={"id": "99", "categories": (InterestCategory.ARTS_CULTURE,)}))
+    catalog.remove("5")
+    check()
+    assert [match.opportunity.id for match in matcher.match(PROFILES[3:], today=TODAY)["nobody"]] == ["99"]
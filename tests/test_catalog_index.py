@@ -0,0 +1,92 @@
+import json
+import os
+from datetime import date
+
+import pytest
+from pydantic import ValidationError
+
+from catalog_editor import CatalogEditor
+from catalog_index import OpportunityCatalog
+from columnar_catalog import ColumnarCatalog
+from data_models import InterestCategory, VolunteerOpportunity
+from opportunity_store import open_store
+
+SAMPLE_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "sample_opportunities.json")
+TODAY = date(2023, 10, 1)
+
+def sample_rows():
+    with open(SAMPLE_FILE, encoding="utf-8") as f:
+        return [VolunteerOpportunity(**record) for record in json.load(f)]
+
+def found(catalog, interests, **options):
+    return [match.opportunity.id for match in catalog.find(interests, today=TODAY, **options)]
+
+@pytest.mark.parametrize("layout", [OpportunityCatalog, ColumnarCatalog])
+def test_edits_through_one_process_reach_the_others(tmp_path, layout):
+    path = str(tmp_path / "opportunities.db")
+    mine, theirs = layout.from_store(open_store(path), check_seconds=0), layout.from_store(open_store(path), check_seconds=0)
+    heard = []
+    theirs.subscribe(lambda previous, current: heard.append((previous and previous.id, current and current.id)))
+    editor = CatalogEditor(mine.store, mine)
+
+    editor.update_opportunity("1", {"title": "Beach cleanup, round two"})
+    editor.add_opportunity(mine.get("1").model_copy(update={"id": "99"}))
+    editor.retire_opportunity("2")
+
+    assert theirs.get("1").title == "Beach cleanup, round two"
+    assert theirs.get("1").version == mine.get("1").version
+    assert theirs.get("99") is not None and theirs.get("2") is None
+    assert sorted(heard, key=str) == sorted([("1", "1"), (None, "99"), ("2", None)], key=str)
+    # Its own edits don't send the editing process back to the store
+    assert mine._store_version == mine.store.version()
+
+@pytest.mark.parametrize("layout", [OpportunityCatalog, ColumnarCatalog])
+def test_cause_lookups_follow_upserts_and_retirements(layout):
+    catalog = layout(sample_rows())
+    assert found(catalog, ["animals"]) == ["2"]
+    assert sorted(found(catalog, ["community", "animals"])) == ["2", "3", "5"]
+
+    shelter = catalog.get("2")
+    catalog.upsert(shelter.model_copy(update={"categories": [InterestCategory.SENIORS]}))
+    catalog.upsert(shelter.model_copy(update={"id": "99"}))
+    assert found(catalog, ["animals"]) == ["99"]
+    assert sorted(found(catalog, ["seniors"])) == ["2", "4"]
+
+    catalog.remove("99")
+    catalog.remove("4")
+    assert found(catalog, ["animals"]) == []
+    assert found(catalog, ["seniors"]) == ["2"]
+    assert found(catalog, ["arts_culture"]) == []
+
+@pytest.mark.parametrize("layout", [OpportunityCatalog, ColumnarCatalog])
+def test_a_city_search_finds_the_places_inside_it(layout):
+    catalog = layout(sample_rows())
+    gazetteer = catalog.gazetteer
+    assert gazetteer.resolve("Santa Monica Beach, CA") == "santa-monica-beach"
+    assert gazetteer.contains("los-angeles", "santa-monica-beach")
+    assert gazetteer.resolve("Community Center on Main") is None
+
+    # Neither row says "Los Angeles", but both venues are inside it
+    assert sorted(found(catalog, ["environment"], location="Los Angeles")) == ["1", "5"]
+    assert sorted(found(catalog, ["environment"], location="L.A.")) == ["1", "5"]
+    assert found(catalog, ["environment"], location="Santa Monica") == ["1"]
+    assert found(catalog, ["environment"], location="San Francisco") == []
+
+def test_rows_are_validated_once_and_shared_read_only():
+    catalog = OpportunityCatalog()
+    with open(SAMPLE_FILE, encoding="utf-8") as f:
+        record = json.load(f)[0]
+    catalog.upsert(record)
+    with pytest.raises(ValidationError):
+        catalog.upsert(dict(record, id="2", categories=["knitting"]))
+
+    stored = catalog.get("1")
+    assert stored.categories == (InterestCategory.ENVIRONMENT,)
+    assert all(match.opportunity is stored for match in catalog.find(["environment"]) + catalog.find(["environment"]))
+    with pytest.raises(ValidationError):
+        stored.title = "Changed in place"
+
+    # A handler stamps its score on a copy, and a replacement gets a newer version
+    assert stored.model_copy(update={"score": 2.0}).score == 2.0 and catalog.get("1").score is None
+    catalog.upsert(record)
+    assert catalog.get("1").version == stored.version + 1
@@ -0,0 +1,73 @@
+import random
+from datetime import date, datetime
+
+from catalog_index import OpportunityCatalog
+from columnar_catalog import ColumnarCatalog
+from data_models import InterestCategory, VolunteerOpportunity
+
+TODAY = date(2023, 10, 1)
+CAUSES = [category.value for category in InterestCategory]
+LOCATIONS = [
+    "Santa Monica Beach, CA", "Los Angeles, CA", "Downtown LA", "Griffith Park, CA", "Westwood Community Center, CA",
+    "Brooklyn, NY", "Toronto", "Main Street Hall", "Somewhere in Springfield",
+]
+WORDS = "beach park garden food bank tutor seniors animal shelter clean plant paint read cook sort library".split()
+
+def random_row(rng, i):
+    row = {
+        "id": str(i),
+        "title": " ".join(rng.choices(WORDS, k=3)).title(),
+        "organization": rng.choice(["Parks Department", "Food Share", "Paws Rescue", "Library Friends"]),
+        "description": " ".join(rng.choices(WORDS, k=rng.randint(5, 15))) + ".",
+        "categories": rng.sample(CAUSES, rng.randint(1, 3)),
+        "location": rng.choice(LOCATIONS),
+        "registration_link": "https://example.com/%d" % i,
+    }
+    if rng.random() < 0.8:
+        row["date"] = date.fromordinal(TODAY.toordinal() - 10 + rng.randrange(40)).isoformat()
+        row["time"] = rng.choice(["9:00 AM - 12:00 PM", "1-4pm", "6pm", None])
+    if rng.random() < 0.5:
+        row["latitude"], row["longitude"] = 34 + rng.random(), -118.5 + rng.random()
+    return VolunteerOpportunity(**row)
+
+def results(matches):
+    return [(match.opportunity.id, round(match.score, 6),
+             None if match.distance_km is None else round(match.distance_km, 6)) for match in matches]
+
+def keys(scored):
+    return sorted((round(first, 6), position) for (first, position), _ in scored)
+
+def assert_same(objects, columns, rng):
+    for _ in range(40):
+        interests = rng.sample(CAUSES, rng.randint(1, 3))
+        options = rng.choice([
+            {},
+            {"location": rng.choice(["Los Angeles", "Santa Monica", "Springfield", "NY"])},
+            {"near": (34.3, -118.2), "radius_km": 30},
+            {"near": (34.3, -118.2)},
+            {"availability": [rng.choice(["weekend mornings", "weekday afternoons", "2023-10-14"])]},
+            {"upcoming": True, "now": datetime(2023, 10, 5, 12)},
+        ])
+        k = rng.choice([None, 3, 10])
+        assert results(columns.find(interests, max_results=k, today=TODAY, **options)) == \
+            results(objects.find(interests, max_results=k, today=TODAY, **options))
+        assert keys(columns.scored(interests, today=TODAY, **options)) == keys(objects.scored(interests, today=TODAY, **options))
+        query = " ".join(rng.sample(WORDS, 2))
+        assert results(columns.search(query, interests=interests)) == results(objects.search(query, interests=interests))
+    for field in ("organization", "location"):
+        assert columns.snapshot().value_counts(field) == objects.snapshot().value_counts(field)
+
+def test_columnar_layout_answers_like_the_object_layout():
+    rng = random.Random(5)
+    rows = [random_row(rng, i) for i in range(300)]
+    objects, columns = OpportunityCatalog(rows), ColumnarCatalog(rows)
+    assert_same(objects, columns, rng)
+
+    # Edits land in the columnar layout's spare room; they must search the same too
+    for _ in range(5):
+        upserts = [random_row(rng, rng.randrange(400)) for _ in range(20)]
+        removals = [str(rng.randrange(400)) for _ in range(10)]
+        objects.apply(upserts, removals)
+        columns.apply(upserts, removals)
+        assert_same(objects, columns, rng)
+        assert [row.id for row in columns.snapshot()] == [row.id for row in objects.snapshot()]
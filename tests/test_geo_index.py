@@ -0,0 +1,40 @@
+import random
+
+from geo_index import GeoGridIndex, haversine_km
+
+def closest(points, latitude, longitude, k, accept=lambda key: True):
+    keys = sorted((key for key in points if accept(key)), key=lambda key: (haversine_km(latitude, longitude, *points[key]), key))
+    return keys[:k]
+
+def clustered_index(rng):
+    # A few far-apart cities, so most cells between them are empty
+    cities = [(34.05, -118.24), (40.71, -74.0), (47.61, -122.33), (25.76, -80.19)]
+    index, points = GeoGridIndex(), {}
+    for key in range(2000):
+        latitude, longitude = rng.choice(cities)
+        points[key] = (latitude + rng.uniform(-0.2, 0.2), longitude + rng.uniform(-0.2, 0.2))
+        index.add(key, *points[key])
+    return index, points
+
+def test_filtered_nearest_matches_brute_force():
+    rng = random.Random(4)
+    index, points = clustered_index(rng)
+    for _ in range(50):
+        latitude, longitude = rng.uniform(25, 48), rng.uniform(-122, -74)
+        rare = lambda key: key % 97 == 0
+        found = [key for _, key in index.nearest(latitude, longitude, 5, accept=rare, available=len(points) // 97 + 1)]
+        assert found == closest(points, latitude, longitude, 5, rare)
+        assert [key for _, key in index.nearest(latitude, longitude, 3)] == closest(points, latitude, longitude, 3)
+
+def test_nearest_after_removals_and_copies():
+    rng = random.Random(9)
+    index, points = clustered_index(rng)
+    copy = index.copy()
+    for key in range(0, 2000, 3):
+        copy.remove(key)
+        del points[key]
+    assert copy.extent is not None and len(index) == 2000
+    assert [key for _, key in copy.nearest(40.7, -74.0, 4)] == closest(points, 40.7, -74.0, 4)
+    for key in list(points):
+        copy.remove(key)
+    assert copy.extent is None and copy.nearest(40.7, -74.0, 4) == []
@@ -0,0 +1,42 @@
+import pytest
+
+from interest_store import DescopeUserBackend, FakeUserBackend, UserInterestStore
+
+class FakeUserManagement:
+    """Records patch_batch calls; login ids in fail_ids come back in failedUsers"""
+
+    def __init__(self, fail_ids=()):
+        self.fail_ids = set(fail_ids)
+        self.batches = []
+
+    def patch_batch(self, users):
+        self.batches.append({user.login_id: user.custom_attributes for user in users})
+        return {
+            "patchedUsers": [{"loginIds": [user.login_id]} for user in users if user.login_id not in self.fail_ids],
+            "failedUsers": [{"failure": "user not found", "user": {"loginIds": [user.login_id]}}
+                            for user in users if user.login_id in self.fail_ids],
+        }
+
+class FakeClient:
+    def __init__(self, user):
+        self.management = type("Management", (), {"user": user})()
+
+def test_update_many_is_one_batch_call():
+    user = FakeUserManagement(fail_ids={"bob"})
+    backend = DescopeUserBackend(FakeClient(user))
+
+    failed = backend.update_many({"ann": {"interests": ["environment"]}, "bob": {"interests": ["education"]}})
+
+    assert user.batches == [{"ann": {"interests": ["environment"]}, "bob": {"interests": ["education"]}}]
+    assert failed == ["bob"]
+
+def test_save_after_close_raises_instead_of_being_lost():
+    backend = FakeUserBackend()
+    store = UserInterestStore(backend, flush_interval=60)
+    store.save("ann", {"interests": ["environment"]})
+    store.close()
+
+    assert backend.users["ann"] == {"interests": ["environment"]}
+    with pytest.raises(RuntimeError):
+        store.save("ann", {"interests": ["education"]})
+    assert backend.users["ann"] == {"interests": ["environment"]}
@@ -0,0 +1,45 @@
+import json
+import os
+import random
+from datetime import date
+
+import pytest
+
+from catalog_index import OpportunityCatalog
+from columnar_catalog import ColumnarCatalog
+from data_models import VolunteerOpportunity
+from ranking import RankedResults, top_k
+
+SAMPLE_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "sample_opportunities.json")
+
+def sample_rows():
+    with open(SAMPLE_FILE, encoding="utf-8") as f:
+        return [VolunteerOpportunity(**record) for record in json.load(f)]
+
+def found(catalog, interests, today=date(2023, 10, 1), **options):
+    return [match.opportunity.id for match in catalog.find(interests, today=today, **options)]
+
+def test_top_k_keeps_the_best_scores_with_ties_to_the_earlier_position():
+    rng = random.Random(7)
+    scored = [(rng.choice([0.5, 1.0, 1.5, 2.0]), position) for position in range(200)]
+    expected = sorted(scored, key=lambda entry: (-entry[0], entry[1]))
+    for k in (1, 5, 37, 200, None):
+        assert top_k(iter(scored), k) == expected[:k]
+
+def test_ranked_results_page_in_the_same_order():
+    rng = random.Random(11)
+    keyed = [((-rng.choice([1.0, 2.0, 3.0]), position), position) for position in range(50)]
+    ranked = RankedResults(list(keyed))
+    pages = [ranked.page(offset, 7) for offset in range(0, 50, 7)]
+    assert [entry for page in pages for entry in page] == [entry for _, entry in sorted(keyed)]
+
+@pytest.mark.parametrize("layout", [OpportunityCatalog, ColumnarCatalog])
+def test_more_shared_causes_rank_first_and_equal_rows_keep_catalog_order(layout):
+    rows = sample_rows()
+    catalog = layout(rows + [rows[0].model_copy(update={"id": "6"}), rows[0].model_copy(update={"id": "7"})])
+
+    # Park restoration shares both causes; the three identical beach cleanups tie, in catalog order
+    assert found(catalog, ["environment", "community"]) == ["5", "1", "6", "7", "3"]
+    assert found(catalog, ["environment", "community"], max_results=3) == ["5", "1", "6"]
+    # Once the events are over only the shared causes count
+    assert found(catalog, ["environment"], today=date(2024, 1, 1)) == ["1", "5", "6", "7"]
@@ -0,0 +1,43 @@
+import json
+import os
+
+from catalog_index import OpportunityCatalog
+from data_models import VolunteerOpportunity
+from recommendations import RecommendationBook
+
+SAMPLE_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "sample_opportunities.json")
+
+def sample_catalog():
+    with open(SAMPLE_FILE, encoding="utf-8") as f:
+        return OpportunityCatalog([VolunteerOpportunity(**record) for record in json.load(f)])
+
+def listed(book, user_id):
+    return [match.opportunity.id for match in book.get(user_id)]
+
+def test_batch_that_recomputes_does_not_list_its_new_rows_twice():
+    catalog = sample_catalog()
+    book = RecommendationBook(catalog, k=4)
+    first = catalog.get("1")
+    book.set_profile("volunteer", first.categories, first.location)
+    assert "1" in listed(book, "volunteer")
+
+    # Changing "1" recomputes the list, which already sees "99" from the same batch
+    catalog.apply(upserts=[first.model_copy(update={"title": "Beach cleanup, round two"}),
+                           first.model_copy(update={"id": "99"})])
+
+    ids = listed(book, "volunteer")
+    assert len(ids) == len(set(ids))
+    assert {"1", "99"} <= set(ids)
+    assert ids == [match.opportunity.id for match in catalog.find(first.categories, first.location, 4)]
+
+def test_new_opportunity_is_offered_to_interested_users():
+    catalog = sample_catalog()
+    book = RecommendationBook(catalog, k=4)
+    first = catalog.get("1")
+    book.set_profile("volunteer", first.categories)
+    recomputes = book.recomputes
+
+    catalog.upsert(first.model_copy(update={"id": "99"}))
+
+    assert "99" in listed(book, "volunteer")
+    assert book.recomputes == recomputes
@@ -0,0 +1,6 @@
+from result_cache import query_key
+
+def test_query_key_only_merges_locations_that_match_the_same_rows():
+    assert query_key(["environment", "education"], "LA") == query_key(["education", "environment"], "la")
+    # Unknown places are matched by substring, where the punctuation counts
+    assert query_key(["environment"], "Main St.") != query_key(["environment"], "Main St")
@@ -0,0 +1,71 @@
+import asyncio
+import json
+import os
+
+import pytest
+
+from catalog_index import OpportunityCatalog
+from data_models import VolunteerOpportunity
+from result_pages import CursorError, Paginator, encode_cursor, decode_cursor, search_spec
+
+SAMPLE_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "sample_opportunities.json")
+
+def catalog_of(count):
+    with open(SAMPLE_FILE, encoding="utf-8") as f:
+        beach = VolunteerOpportunity(**json.load(f)[0])
+    return OpportunityCatalog([
+        beach.model_copy(update={"id": str(100 + i), "title": "Cleanup %d" % i, "volunteers_needed": i + 1})
+        for i in range(count)
+    ])
+
+def page(pages, *args, **kwargs):
+    return asyncio.run(pages.page(*args, **kwargs))
+
+def ids(matches):
+    return [match.opportunity.id for match in matches]
+
+def test_pages_follow_on_from_each_other():
+    pages = Paginator(catalog_of(7))
+    spec = search_spec(["environment"])
+    everything = ids(pages.catalog.find(["environment"], None, 10))
+
+    seen, cursor = [], None
+    while True:
+        matches, offset, _, cursor = page(pages, spec, 3, cursor)
+        assert offset == len(seen)
+        seen += ids(matches)
+        if cursor is None:
+            break
+    assert seen == everything
+
+def test_a_cursor_carries_on_after_its_last_result_once_the_catalog_changes():
+    catalog = catalog_of(9)
+    pages = Paginator(catalog)
+    spec = search_spec(["environment"])
+    first, _, _, cursor = page(pages, spec, 3)
+    second, _, _, cursor = page(pages, spec, 3, cursor)
+
+    # The ranking is evicted and a row the visitor has already seen goes away
+    pages.searches.clear()
+    catalog.remove(ids(first)[0])
+
+    third, offset, total, _ = page(pages, spec, 3, cursor)
+    remaining = [opportunity_id for opportunity_id in ids(catalog.find(["environment"], None, 10))
+                 if opportunity_id not in ids(first) + ids(second)]
+    assert ids(third) == remaining[:3]
+    assert offset == 5 and total == 8
+
+def test_an_old_cursor_without_a_key_still_fails_cleanly_after_a_change():
+    catalog = catalog_of(6)
+    pages = Paginator(catalog)
+    _, _, _, cursor = page(pages, search_spec(["environment"]), 2)
+    state = decode_cursor(cursor)
+    del state["k"]
+    catalog.remove("100")
+    with pytest.raises(CursorError):
+        page(pages, cursor=encode_cursor(state))
+
+def test_a_page_size_below_one_is_refused():
+    pages = Paginator(catalog_of(3))
+    with pytest.raises(ValueError):
+        page(pages, search_spec(["environment"]), 0)
@@ -0,0 +1,93 @@
+import json
+import os
+import random
+from datetime import date, datetime
+
+import pytest
+
+from catalog_index import OpportunityCatalog
+from columnar_catalog import ColumnarCatalog
+from data_models import InterestCategory, VolunteerOpportunity
+from schedule import (
+    MINUTES_PER_DAY, IntervalIndex, availability_windows, event_interval, overlaps_any, parse_time_range, timestamp,
+)
+
+SAMPLE_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "sample_opportunities.json")
+TODAY = date(2023, 10, 1)
+EVERY_CAUSE = [category.value for category in InterestCategory]
+
+def sample_rows():
+    with open(SAMPLE_FILE, encoding="utf-8") as f:
+        return [VolunteerOpportunity(**record) for record in json.load(f)]
+
+def at(day, hour, minute=0):
+    return timestamp(datetime(2023, 10, day, hour, minute))
+
+@pytest.mark.parametrize("text, expected", [
+    ("9:00 AM - 12:00 PM", (9 * 60, 12 * 60)),
+    ("9-11am", (9 * 60, 11 * 60)),
+    ("11-1pm", (11 * 60, 13 * 60)),
+    ("14:00 to 16:30", (14 * 60, 16 * 60 + 30)),
+    ("9-5", (9 * 60, 17 * 60)),
+    ("10pm - 2am", (22 * 60, MINUTES_PER_DAY + 2 * 60)),
+    ("noon until 3pm", (12 * 60, 15 * 60)),
+    ("7pm", (19 * 60, 20 * 60)),
+    ("Saturday 10", None),
+    ("", None),
+])
+def test_time_ranges(text, expected):
+    assert parse_time_range(text) == expected
+
+def test_event_intervals():
+    assert event_interval("2023-10-15", "9:00 AM - 12:00 PM") == (at(15, 9), at(15, 12))
+    assert event_interval("2023-10-15") == (at(15, 0), at(16, 0))
+    assert event_interval("2023-10-15 to 2023-10-17", "6-8pm") == (at(15, 18), at(17, 20))
+    assert event_interval("next week sometime", "9am") is None
+
+def test_availability_windows():
+    # Sundays in the next two weeks, mornings only
+    assert availability_windows(["Sunday mornings"], TODAY, horizon_days=14) == [(at(1, 6), at(1, 12)), (at(8, 6), at(8, 12))]
+    assert availability_windows(["2023-10-20 evenings", "2023-10-20 9pm-11pm"], TODAY) == [(at(20, 17), at(20, 23))]
+    assert availability_windows(["whenever suits"], TODAY) is None
+    assert availability_windows(["when the stars align"], TODAY) is None
+
+    windows = availability_windows(["weekends"], TODAY, horizon_days=14)
+    assert overlaps_any((at(14, 23), at(15, 1)), windows)
+    assert not overlaps_any((at(13, 9), at(13, 17)), windows)
+    assert not overlaps_any((at(16, 0), at(16, 1)), windows)
+
+def test_interval_index_matches_brute_force():
+    rng = random.Random(3)
+    index, intervals = IntervalIndex(), {}
+    for position in range(3000):
+        start = rng.randrange(0, 60 * MINUTES_PER_DAY)
+        length = rng.choice([60, 180, MINUTES_PER_DAY, 10 * MINUTES_PER_DAY])
+        intervals[position] = (start, start + length)
+        index.add(position, intervals[position])
+    copy = index.copy()
+    for position in rng.sample(sorted(intervals), 1000):
+        copy.remove(position)
+    remaining = {position: interval for position, interval in intervals.items() if position in copy.intervals}
+    for _ in range(100):
+        start = rng.randrange(0, 60 * MINUTES_PER_DAY)
+        end = start + rng.randrange(1, 3 * MINUTES_PER_DAY)
+        expected = {position for position, (low, high) in remaining.items() if low < end and high > start}
+        assert set(copy.overlapping(start, end)) == expected
+        # The original is untouched by the copy's removals
+        assert set(index.overlapping(start, end)) >= expected
+
+@pytest.mark.parametrize("layout", [OpportunityCatalog, ColumnarCatalog])
+def test_search_keeps_only_what_happens_while_the_user_is_free(layout):
+    catalog = layout(sample_rows())
+
+    def free(*availability, **options):
+        return sorted(match.opportunity.id for match in catalog.find(EVERY_CAUSE, today=TODAY, availability=list(availability), **options))
+
+    assert free("Sunday mornings") == ["1"]
+    # The food bank runs into the afternoon; the park restoration ends right as it starts
+    assert free("weekday afternoons") == ["2", "3"]
+    assert free("2023-10-22") == ["4"]
+    assert free("2023-10-22", "Sunday mornings") == ["1", "4"]
+    assert free("anytime") == ["1", "2", "3", "4", "5"]
+    assert free("Sunday mornings", upcoming=True, now=datetime(2023, 10, 15, 11)) == ["1"]
+    assert free("Sunday mornings", upcoming=True, now=datetime(2023, 10, 15, 12)) == []
@@ -0,0 +1,47 @@
+import os
+
+from catalog_editor import CatalogEditor
+from opportunity_store import open_store
+from shared_catalog import SharedCatalog, current_file
+
+def open_pair(tmp_path, publish_seconds):
+    store = open_store(str(tmp_path / "opportunities.db"))
+    directory = str(tmp_path / "shared")
+    catalog = SharedCatalog.from_store(store, directory, publish_seconds=publish_seconds)
+    return store, directory, catalog
+
+def test_edits_are_seen_at_once_and_published_later(tmp_path):
+    store, directory, catalog = open_pair(tmp_path, publish_seconds=60)
+    published = current_file(directory)
+    editor = CatalogEditor(store, catalog)
+    first = catalog.get("1")
+
+    editor.update_opportunity("1", {"title": "Beach cleanup, round two"})
+    editor.add_opportunity(first.model_copy(update={"id": "99"}))
+    editor.retire_opportunity("2")
+
+    # This process searches its own edits straight away, without a new file
+    assert current_file(directory) == published
+    assert catalog.get("1").title == "Beach cleanup, round two"
+    assert catalog.get("99") is not None and catalog.get("2") is None
+    assert catalog.version == store.version()
+
+    other = SharedCatalog(directory, check_seconds=0)
+    heard = []
+    other.subscribe(lambda previous, current: heard.append((previous and previous.id, current and current.id)))
+    catalog.flush()
+    assert current_file(directory) != published
+    assert other.get("1").title == "Beach cleanup, round two"
+    assert sorted(heard, key=str) == sorted([("1", "1"), (None, "99"), ("2", None)], key=str)
+
+def test_an_edit_from_another_process_is_published_at_once(tmp_path):
+    store, directory, catalog = open_pair(tmp_path, publish_seconds=60)
+    elsewhere = open_store(store.path)
+    elsewhere.upsert(dict(elsewhere.get("3"), title="Edited elsewhere"))
+
+    CatalogEditor(store, catalog).update_opportunity("1", {"title": "Beach cleanup, round two"})
+
+    # Only the store has the other edit, so the catalog can't just patch in its own
+    assert catalog.get("3").title == "Edited elsewhere"
+    assert catalog.get("1").title == "Beach cleanup, round two"
+    assert os.path.basename(current_file(directory)).startswith("catalog-%012d-" % store.version())
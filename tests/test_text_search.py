@@ -0,0 +1,46 @@
+import json
+import os
+
+import pytest
+
+from catalog_index import OpportunityCatalog
+from columnar_catalog import ColumnarCatalog
+from data_models import VolunteerOpportunity
+
+SAMPLE_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "sample_opportunities.json")
+
+def sample_rows():
+    with open(SAMPLE_FILE, encoding="utf-8") as f:
+        return [VolunteerOpportunity(**record) for record in json.load(f)]
+
+def searched(catalog, query, **options):
+    return [match.opportunity.id for match in catalog.search(query, **options)]
+
+def garden_rows():
+    beach = sample_rows()[0]
+    return sample_rows() + [
+        beach.model_copy(update={"id": "10", "title": "Saturday morning helpers",
+                                 "description": "Weed and water the community garden beds."}),
+        beach.model_copy(update={"id": "11", "title": "Community garden day",
+                                 "description": "Weed and water the beds."}),
+    ]
+
+@pytest.mark.parametrize("layout", [OpportunityCatalog, ColumnarCatalog])
+def test_a_title_match_outranks_a_description_match(layout):
+    catalog = layout(garden_rows())
+    assert searched(catalog, "garden") == ["11", "10"]
+    assert searched(catalog, "gardening") == ["11", "10"]
+    # Both rows with the rarer word come before the ones that only mention "community"
+    assert searched(catalog, "community garden")[:2] == ["11", "10"]
+    assert searched(catalog, "the and of") == []
+
+@pytest.mark.parametrize("layout", [OpportunityCatalog, ColumnarCatalog])
+def test_search_follows_edits_and_filters(layout):
+    catalog = layout(garden_rows())
+    catalog.upsert(catalog.get("10").model_copy(update={"description": "Pick up litter on the sand."}))
+    assert searched(catalog, "garden") == ["11"]
+    assert searched(catalog, "food bank") == ["3"]
+    assert searched(catalog, "volunteer", interests=["community"]) == ["3", "5"]
+    assert searched(catalog, "volunteer", location="Griffith Park") == ["5"]
+    catalog.remove("11")
+    assert searched(catalog, "garden") == []
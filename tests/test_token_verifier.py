@@ -0,0 +1,92 @@
+import time
+
+import httpx
+import jwt
+import pytest
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+from token_verifier import SigningKeys, TokenVerifier
+
+PROJECT_ID = "P2test"
+
+class FakeClock:
+    # Starts at the real time, since PyJWT checks exp against that
+    def __init__(self):
+        self.now = int(time.time())
+
+    def __call__(self):
+        return self.now
+
+class FakeJWKS:
+    """Serves a JWKS document for local key pairs, counting fetches; down=True makes every fetch fail"""
+
+    def __init__(self, *kids):
+        self.private_keys = {kid: rsa.generate_private_key(public_exponent=65537, key_size=2048) for kid in kids}
+        self.fetches = 0
+        self.down = False
+
+    def __call__(self):
+        self.fetches += 1
+        if self.down:
+            raise httpx.ConnectTimeout("JWKS endpoint timed out")
+        keys = []
+        for kid, private_key in self.private_keys.items():
+            jwk = jwt.algorithms.RSAAlgorithm.to_jwk(private_key.public_key(), as_dict=True)
+            keys.append(dict(jwk, kid=kid, alg="RS256", use="sig"))
+        return {"keys": keys}
+
+    def token(self, kid, clock, **claims):
+        claims = dict({"sub": "user-1", "iss": "https://api.descope.com/" + PROJECT_ID, "exp": clock() + 600}, **claims)
+        return jwt.encode(claims, self.private_keys[kid], algorithm="RS256", headers={"kid": kid})
+
+def verifier(jwks, clock, **options):
+    return TokenVerifier(PROJECT_ID, clock=clock, keys=SigningKeys(jwks, clock=clock, **options))
+
+def test_verifies_against_a_local_jwks_and_caches_the_claims():
+    clock, jwks = FakeClock(), FakeJWKS("k1")
+    tokens = verifier(jwks, clock)
+    token = jwks.token("k1", clock)
+
+    assert tokens.verify(token)["sub"] == "user-1"
+    assert tokens.cached(token)["sub"] == "user-1"
+    assert jwks.fetches == 1
+    assert tokens.verify(token)["sub"] == "user-1"
+    assert jwks.fetches == 1
+
+    with pytest.raises(jwt.ExpiredSignatureError):
+        tokens.verify(jwks.token("k1", clock, exp=clock() - 60))
+
+def test_rejects_a_token_for_another_project_or_signed_by_another_key():
+    clock, jwks, stranger = FakeClock(), FakeJWKS("k1"), FakeJWKS("k1")
+    tokens = verifier(jwks, clock)
+
+    with pytest.raises(jwt.InvalidIssuerError):
+        tokens.verify(jwks.token("k1", clock, iss="https://api.descope.com/P2other"))
+    with pytest.raises(jwt.InvalidSignatureError):
+        tokens.verify(stranger.token("k1", clock))
+
+def test_a_failed_fetch_is_not_retried_for_every_token():
+    clock, jwks = FakeClock(), FakeJWKS("k1")
+    tokens = verifier(jwks, clock, retry_seconds=10)
+    jwks.down = True
+
+    for _ in range(3):
+        with pytest.raises(httpx.ConnectTimeout):
+            tokens.verify(jwks.token("k1", clock))
+    assert jwks.fetches == 1
+
+    clock.now += 11
+    jwks.down = False
+    assert tokens.verify(jwks.token("k1", clock))["sub"] == "user-1"
+    assert jwks.fetches == 2
+
+def test_known_keys_keep_working_while_the_jwks_endpoint_is_down():
+    clock, jwks = FakeClock(), FakeJWKS("k1")
+    tokens = verifier(jwks, clock, max_age_seconds=60, retry_seconds=10)
+    tokens.verify(jwks.token("k1", clock))
+
+    clock.now += 61
+    jwks.down = True
+    assert tokens.verify(jwks.token("k1", clock, sub="user-2"))["sub"] == "user-2"
+    assert tokens.verify(jwks.token("k1", clock, sub="user-3"))["sub"] == "user-3"
+    assert jwks.fetches == 2
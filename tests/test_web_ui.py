@@ -0,0 +1,118 @@
+import gzip
+
+import pytest
+
+import web_cache
+import web_ui
+
+class FakePool:
+    """Answers every tool call with the arguments it was sent, from catalog_version, and records them"""
+
+    def __init__(self):
+        self.calls = []
+        self.catalog_version = 1
+
+    def call_tool(self, name, arguments):
+        self.calls.append((name, arguments))
+        text = "%s %s at %d" % (name, sorted(arguments.items()), self.catalog_version)
+        return {"content": [{"type": "text", "text": text}], "meta": {"catalog_version": self.catalog_version}}
+
+class FakeStore:
+    def __init__(self):
+        self.catalog_version = 1
+
+    def version(self):
+        return self.catalog_version
+
+@pytest.fixture
+def pool(monkeypatch):
+    pool = FakePool()
+    monkeypatch.setattr(web_ui, "mcp_pool", pool)
+    return pool
+
+@pytest.fixture
+def store(monkeypatch):
+    store = FakeStore()
+    monkeypatch.setattr(web_ui, "store", store)
+    monkeypatch.setattr(web_ui, "web_responses", web_ui.ResponseCache())
+    return store
+
+@pytest.fixture
+def client():
+    return web_ui.app.test_client()
+
+def test_interest_routes_send_the_visitors_own_token(pool, client):
+    client.get("/check_interests", headers={"Authorization": "Bearer token-a"})
+    client.post("/set_interests", json={"interests": ["environment"]}, headers={"Authorization": "Bearer token-b"})
+
+    assert pool.calls == [
+        ("get_user_interests", {"session_token": "token-a"}),
+        ("set_user_interests", {"interests": ["environment"], "session_token": "token-b"}),
+    ]
+
+def test_interest_routes_refuse_a_visitor_without_a_token(pool, client):
+    # The pooled session may remember someone else's token, so these never reach it
+    assert client.get("/check_interests").status_code == 401
+    assert client.post("/set_interests", json={"interests": ["environment"]}).status_code == 401
+    assert pool.calls == []
+
+def text_of(response):
+    return response.get_json()["content"][0]["text"]
+
+def test_an_answer_from_a_lagging_server_is_filed_under_the_version_it_came_from(pool, store, client):
+    search = "/find_opportunities?interests=environment"
+    first = client.get(search)
+    assert text_of(first).endswith("at 1")
+
+    # The store has moved on, but the pooled server hasn't caught up yet
+    store.catalog_version = 2
+    lagging = client.get(search, headers={"If-None-Match": first.headers["ETag"]})
+    assert lagging.status_code == 200 and text_of(lagging).endswith("at 1")
+
+    # Once it has, the newer answer isn't hidden behind the stale one
+    pool.catalog_version = 2
+    current = client.get(search, headers={"If-None-Match": lagging.headers["ETag"]})
+    assert current.status_code == 200 and text_of(current).endswith("at 2")
+    assert client.get(search, headers={"If-None-Match": current.headers["ETag"]}).status_code == 304
+    assert len(pool.calls) == 3
+
+def test_unchanged_searches_get_a_304_until_the_catalog_moves(pool, store, client):
+    first = client.get("/find_opportunities?interests=environment,animals")
+    assert first.status_code == 200 and first.headers["Cache-Control"] == web_ui.CATALOG_CACHE_CONTROL
+    etag, last_modified = first.headers["ETag"], first.headers["Last-Modified"]
+
+    # Interests in any order are the same search, answered from the response cache
+    again = client.get("/find_opportunities?interests=animals,environment")
+    assert again.headers["ETag"] == etag and again.data == first.data
+    assert client.get("/find_opportunities?interests=environment,animals", headers={"If-None-Match": etag}).status_code == 304
+    assert client.get("/find_opportunities?interests=environment,animals", headers={"If-Modified-Since": last_modified}).status_code == 304
+    assert len(pool.calls) == 1
+
+    store.catalog_version = pool.catalog_version = 2
+    changed = client.get("/find_opportunities?interests=environment,animals", headers={"If-None-Match": etag})
+    assert changed.status_code == 200 and changed.headers["ETag"] != etag and text_of(changed).endswith("at 2")
+    assert len(pool.calls) == 2
+
+def test_a_failed_answer_is_neither_cached_nor_validated(pool, store, client, monkeypatch):
+    failures = []
+    monkeypatch.setattr(pool, "call_tool", lambda name, arguments: failures.append(name) or {"error": "MCP server is restarting"})
+    for _ in range(2):
+        failed = client.get("/find_opportunities?interests=environment")
+        assert failed.get_json() == {"error": "MCP server is restarting"}
+        assert failed.headers["Cache-Control"] == "no-store" and "ETag" not in failed.headers
+    assert len(failures) == 2
+
+def test_big_answers_are_gzipped_for_clients_that_take_it(pool, store, client):
+    search = "/find_opportunities?interests=environment&location=" + "Santa Monica " * 100
+    plain = client.get(search)
+    zipped = client.get(search, headers={"Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in plain.headers
+    assert zipped.headers["Content-Encoding"] == "gzip"
+    assert gzip.decompress(zipped.data) == plain.data and len(zipped.data) < len(plain.data)
+    # One validator for every encoding, and caches told the body depends on Accept-Encoding
+    assert zipped.headers["ETag"] == plain.headers["ETag"]
+    assert "Accept-Encoding" in zipped.headers["Vary"] and "Accept-Encoding" in plain.headers["Vary"]
+    assert client.get(search, headers={"Accept-Encoding": "gzip;q=0"}).data == plain.data
+
+    small = client.get("/find_opportunities?interests=environment", headers={"Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in small.headers and len(small.data) < web_cache.MIN_COMPRESSED_BYTES
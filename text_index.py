@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Full-text search over opportunity titles, organizations and descriptions (BM25)
+"""
+
+import heapq
+import math
+import re
+from functools import lru_cache
+
+from metrics import REGISTRY, lru_cache_stats
+from paged_dict import PagedDict
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+STOPWORDS = frozenset("""
+a an and are as at be but by for from has have help in into is it its of on or our the their this to up
+we will with you your
+""".split())
+
+# Matched longest first; each maps a suffix to what replaces it
+SUFFIXES = (
+    ("izations", "ize"), ("ational", "ate"), ("ization", "ize"), ("fulness", "ful"), ("iveness", "ive"),
+    ("ations", "ate"), ("ation", "ate"), ("ments", ""), ("ment", ""), ("ness", ""),
+    ("ings", ""), ("ing", ""), ("sses", "ss"), ("ches", "ch"), ("shes", "sh"), ("xes", "x"),
+    ("ies", "y"), ("ied", "y"), ("ers", ""), ("er", ""), ("ed", ""), ("s", ""),
+)
+MIN_STEM_LENGTH = 3
+
+# How much a word counts in each field (a word in the title says more than one in the description)
+FIELD_WEIGHTS = (("title", 2.0), ("organization", 1.5), ("description", 1.0))
+
+# A term in more than this share of the catalog (and in more than COMMON_TERM_MIN_DOCUMENTS rows) is
+# common: walking its whole posting costs a lot and its low idf barely changes the ranking
+COMMON_TERM_SHARE = 0.05
+COMMON_TERM_MIN_DOCUMENTS = 1000
+# A search made only of common terms starts from this many of each one's best-scoring opportunities
+COMMON_TERM_LEADERS = 1000
+
+@lru_cache(maxsize=100_000)
+def stem(word):
+    """A light suffix-stripping stemmer: volunteers, volunteering and volunteer all end up the same.
+
+    Suffixes are stripped until none applies, so a word and its inflections
+    meet at the same stem even when that stem isn't an English word.
+    """
+    while True:
+        stemmed = _strip_suffix(word)
+        if stemmed == word:
+            return word
+        word = stemmed
+
+REGISTRY.watch_cache("text_index", "stems", lru_cache_stats(stem))
+
+def _strip_suffix(word):
+    if word.endswith("ss") or word.isdigit():
+        return word
+    for suffix, replacement in SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) + len(replacement) >= MIN_STEM_LENGTH:
+            word = word[:len(word) - len(suffix)] + replacement
+            # running -> run, planner -> plan (but not filled -> fil)
+            if not replacement and len(word) > MIN_STEM_LENGTH and word[-1] == word[-2] and word[-1] not in "lsz":
+                word = word[:-1]
+            return word
+    return word
+
+def common_term_cutoff(count):
+    """How many of count documents a term may appear in before it counts as common"""
+    return max(COMMON_TERM_MIN_DOCUMENTS, count * COMMON_TERM_SHARE)
+
+def tokenize(text):
+    """Lowercased, stemmed words with stopwords dropped"""
+    return [stem(token) for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+
+class TextIndex:
+    """An inverted index from stemmed terms to the opportunities using them, ranked with BM25.
+
+    Each posting holds a field-weighted term frequency and the document's
+    length, so scoring never has to look anything else up. Like the other
+    catalog indexes, copy() shares postings until they change, so catalog
+    snapshots stay cheap to publish.
+    """
+
+    def __init__(self, k1=1.2, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings = PagedDict()  # term -> {catalog position: (weighted term frequency, document length)}
+        self.lengths = PagedDict()  # catalog position -> weighted document length
+        self.total_length = 0.0
+        self._leaders = {}  # common term -> its best-scoring positions, worked out when a search first needs them
+        self._owned = None  # terms whose posting dicts this copy may change in place (None: all of them)
+
+    def __len__(self):
+        return len(self.lengths)
+
+    def copy(self):
+        clone = TextIndex.__new__(TextIndex)
+        clone.k1 = self.k1
+        clone.b = self.b
+        clone.postings = self.postings.copy()
+        clone.lengths = self.lengths.copy()
+        clone.total_length = self.total_length
+        clone._leaders = dict(self._leaders)
+        clone._owned = set()
+        return clone
+
+    def _writable(self, term):
+        self._leaders.pop(term, None)
+        posting = self.postings.get(term)
+        if posting is None or (self._owned is not None and term not in self._owned):
+            posting = self.postings[term] = dict(posting or ())
+            if self._owned is not None:
+                self._owned.add(term)
+        return posting
+
+    @staticmethod
+    def frequencies(opportunity):
+        """{term: field-weighted count} for one opportunity"""
+        frequencies = {}
+        for field, weight in FIELD_WEIGHTS:
+            for term in tokenize(getattr(opportunity, field) or ""):
+                frequencies[term] = frequencies.get(term, 0.0) + weight
+        return frequencies
+
+    def add(self, position, opportunity):
+        frequencies = self.frequencies(opportunity)
+        length = sum(frequencies.values())
+        for term, frequency in frequencies.items():
+            self._writable(term)[position] = (frequency, length)
+        self.lengths[position] = length
+        self.total_length += length
+
+    def remove(self, position, opportunity):
+        """Forget the opportunity stored at position (we re-tokenize it rather than keep its terms around)"""
+        if position not in self.lengths:
+            return
+        for term in self.frequencies(opportunity):
+            posting = self._writable(term)
+            posting.pop(position, None)
+            if not posting:
+                del self.postings[term]
+        self.total_length -= self.lengths.pop(position)
+
+    def scores(self, query):
+        """{catalog position: BM25 score} for the opportunities matching the query.
+
+        Rare terms are scored through their whole postings. Common terms (see
+        common_term_cutoff) only add to what the rare ones found, looked up
+        position by position. A query of nothing but common terms is scored
+        over each term's COMMON_TERM_LEADERS best opportunities instead of
+        everything containing it.
+        """
+        count = len(self.lengths)
+        if not count:
+            return {}
+        average_length = self.total_length / count or 1.0
+        base = self.k1 * (1 - self.b)
+        slope = self.k1 * self.b / average_length
+        cutoff = common_term_cutoff(count)
+        scores = {}
+        get = scores.get
+        common = []
+        for term in set(tokenize(query)):
+            posting = self.postings.get(term)
+            if not posting:
+                continue
+            if len(posting) > cutoff:
+                common.append((term, posting))
+                continue
+            weight = self._idf(count, posting) * (self.k1 + 1)
+            for position, (frequency, length) in posting.items():
+                scores[position] = get(position, 0.0) + weight * frequency / (frequency + base + slope * length)
+        if common and not scores:
+            for term, posting in common:
+                scores.update(dict.fromkeys(self._leading(term, posting, base, slope), 0.0))
+        for _, posting in common:
+            weight = self._idf(count, posting) * (self.k1 + 1)
+            for position, score in scores.items():
+                entry = posting.get(position)
+                if entry is not None:
+                    frequency, length = entry
+                    scores[position] = score + weight * frequency / (frequency + base + slope * length)
+        return scores
+
+    @staticmethod
+    def _idf(count, posting):
+        return math.log(1 + (count - len(posting) + 0.5) / (len(posting) + 0.5))
+
+    def _leading(self, term, posting, base, slope):
+        """The COMMON_TERM_LEADERS positions term scores highest for (kept until the term's posting changes)"""
+        leaders = self._leaders.get(term)
+        if leaders is None:
+            impacts = ((frequency / (frequency + base + slope * length), -position)
+                       for position, (frequency, length) in posting.items())
+            leaders = self._leaders[term] = [-position for _, position in heapq.nlargest(COMMON_TERM_LEADERS, impacts)]
+        return leaders
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Local verification of Descope session tokens (JWTs) against cached signing keys
+"""
+
+import hashlib
+import threading
+import time
+
+import httpx
+import jwt
+
+from metrics import descope_request
+from result_cache import LRUCache
+
+DESCOPE_BASE_URL = "https://api.descope.com"
+
+def descope_jwks_fetcher(project_id, base_url=DESCOPE_BASE_URL, timeout=5.0):
+    """Return a function that downloads the project's public signing keys (a JWKS document)"""
+    def fetch():
+        with descope_request("jwks"):
+            response = httpx.get(f"{base_url}/v2/keys/{project_id}", timeout=timeout)
+            response.raise_for_status()
+        return response.json()
+    return fetch
+
+class SigningKeys:
+    """The project's public keys by key id, refreshed when a token shows up signed by a key we haven't seen.
+
+    A failed fetch is remembered for retry_seconds: until then the keys we
+    already have keep answering, and a key id we don't have gets the same
+    error at once instead of another fetch that waits out its timeout.
+    """
+
+    def __init__(self, fetch_jwks, max_age_seconds=3600, min_refresh_seconds=30, retry_seconds=10, clock=time.monotonic):
+        self.fetch_jwks = fetch_jwks
+        self.max_age_seconds = max_age_seconds
+        self.min_refresh_seconds = min_refresh_seconds  # don't let junk key ids hammer the JWKS endpoint
+        self.retry_seconds = retry_seconds  # don't wait on a JWKS endpoint that's down for every token either
+        self.clock = clock
+        self._keys = {}
+        self._fetched_at = None
+        self._failed_at = None
+        self._failure = None
+        self._lock = threading.Lock()
+
+    def get(self, kid):
+        with self._lock:
+            now = self.clock()
+            stale = self._fetched_at is None or now - self._fetched_at > self.max_age_seconds
+            rotated = kid not in self._keys and (self._fetched_at is None or now - self._fetched_at > self.min_refresh_seconds)
+            if stale or rotated:
+                if self._failed_at is not None and now - self._failed_at < self.retry_seconds:
+                    if kid not in self._keys:
+                        raise self._failure
+                else:
+                    try:
+                        self._refresh(now)
+                    except Exception as e:
+                        self._failed_at, self._failure = now, e
+                        if kid not in self._keys:
+                            raise
+            key = self._keys.get(kid)
+        if key is None:
+            raise jwt.InvalidTokenError(f"No signing key with id '{kid}'")
+        return key
+
+    def _refresh(self, now):
+        keys = {}
+        for jwk in self.fetch_jwks().get("keys", []):
+            try:
+                key = jwt.PyJWK(jwk)
+            except jwt.PyJWKError:
+                continue  # skip key types we can't use rather than failing every token
+            keys[key.key_id] = key
+        self._keys = keys
+        self._fetched_at = now
+        self._failed_at = self._failure = None
+
+class TokenVerifier:
+    """Verifies session tokens locally and remembers the ones it has already checked.
+
+    Verified claims are cached by a hash of the token until the token's own
+    `exp`, so repeat calls from the same session skip the signature check.
+    For tests, pass fetch_jwks=lambda: {"keys": [jwk]} built from a local key pair,
+    or keys=SigningKeys(...) to give the key cache a clock of its own.
+    """
+
+    ALGORITHMS = ["RS256", "RS384", "RS512", "ES256", "ES384", "ES512"]
+
+    def __init__(self, project_id, fetch_jwks=None, cache_size=10_000, leeway_seconds=5, clock=time.time, keys=None):
+        self.project_id = project_id
+        self.keys = keys or SigningKeys(fetch_jwks or descope_jwks_fetcher(project_id))
+        self.leeway_seconds = leeway_seconds
+        self.clock = clock
+        self.verified = LRUCache(max_size=cache_size)
+
+    def cached(self, token):
+        """Claims for a token we've already verified and that hasn't expired, else None (never does I/O)"""
+        return self.verified.get(self._cache_key(token))
+
+    def verify(self, token):
+        """Return the token's claims, or raise jwt.InvalidTokenError if it isn't valid"""
+        cache_key = self._cache_key(token)
+        claims = self.verified.get(cache_key)
+        if claims is not None:
+            return claims
+
+        header = jwt.get_unverified_header(token)
+        key = self.keys.get(header.get("kid"))
+        claims = jwt.decode(
+            token,
+            key=key.key,
+            algorithms=[key.algorithm_name] if key.algorithm_name else self.ALGORITHMS,
+            leeway=self.leeway_seconds,
+            options={"require": ["exp", "sub"], "verify_aud": False},
+        )
+        issuer = claims.get("iss")
+        if issuer is not None and not issuer.rstrip("/").endswith(self.project_id):
+            raise jwt.InvalidIssuerError("Token was issued for a different project")
+
+        remaining = claims["exp"] - self.clock()
+        if remaining > 0:
+            self.verified.put(cache_key, claims, ttl_seconds=remaining)
+        return claims
+
+    @staticmethod
+    def _cache_key(token):
+        return hashlib.sha256(token.encode("utf-8")).hexdigest()
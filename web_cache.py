@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+HTTP caching for the web UI: validators tied to the catalog version, compressed bodies and a response cache
+"""
+
+import gzip
+import hashlib
+import json
+import threading
+import time
+from datetime import datetime, timezone
+
+from flask import Response
+from werkzeug.http import http_date, is_resource_modified
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+# Smaller bodies fit in a packet or two anyway, and compressing them costs more than it saves
+MIN_COMPRESSED_BYTES = 1024
+
+# Every encoding we can produce, best first
+ENCODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+
+def compress(data, encoding):
+    if encoding == "br":
+        return brotli.compress(data, quality=5)
+    if encoding == "gzip":
+        return gzip.compress(data, compresslevel=6)
+    return data
+
+def pick_encoding(request, size):
+    """The encoding to send a body of size bytes in, or None to send it as it is"""
+    if size < MIN_COMPRESSED_BYTES:
+        return None
+    quality = {encoding: request.accept_encodings[encoding] for encoding in ENCODINGS}
+    best = max(ENCODINGS, key=lambda encoding: quality[encoding])
+    return best if quality[best] > 0 else None
+
+def make_etag(*parts):
+    """A short validator for everything that decides a response's body"""
+    return hashlib.sha1(json.dumps(parts, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:20]
+
+class VersionClock:
+    """When this process first saw each catalog version, for Last-Modified.
+
+    Each new version gets a later second than the one before, so a client
+    that only sends If-Modified-Since never gets a 304 across a change.
+    """
+
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self._version = None
+        self._since = 0
+        self._lock = threading.Lock()
+
+    def since(self, version):
+        with self._lock:
+            if version != self._version:
+                self._version = version
+                self._since = max(int(self.clock()), self._since + 1)
+            return datetime.fromtimestamp(self._since, timezone.utc)
+
+class CachedBody:
+    """One response body, plus its compressed forms as clients ask for them"""
+
+    def __init__(self, data, content_type="application/json"):
+        self.data = data
+        self.content_type = content_type
+        self._encoded = {None: data}
+
+    def encoded(self, encoding):
+        body = self._encoded.get(encoding)
+        if body is None:
+            body = self._encoded[encoding] = compress(self.data, encoding)
+        return body
+
+    def respond(self, request, etag, last_modified, cache_control):
+        encoding = pick_encoding(request, len(self.data))
+        response = Response(self.encoded(encoding), content_type=self.content_type)
+        if encoding:
+            response.headers["Content-Encoding"] = encoding
+        return with_validators(response, etag, last_modified, cache_control)
+
+def with_validators(response, etag, last_modified, cache_control):
+    if etag is not None:
+        response.set_etag(etag, weak=True)  # weak: the same answer whatever encoding it's sent in
+    if last_modified is not None:
+        response.headers["Last-Modified"] = http_date(last_modified)
+    response.headers["Cache-Control"] = cache_control
+    response.vary.add("Accept-Encoding")
+    return response
+
+def not_modified(request, etag, last_modified, cache_control):
+    """A 304 if the client's copy is still current (GET and HEAD only), else None"""
+    if request.method not in ("GET", "HEAD"):
+        return None
+    # If-None-Match wins over If-Modified-Since when a client sends both
+    if is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        return None
+    return with_validators(Response(status=304), etag, last_modified, cache_control)
+
+def compress_response(request, response):
+    """Compress a response built elsewhere if it's big enough and the client takes it"""
+    if (response.status_code != 200 or response.direct_passthrough or request.method == "HEAD"
+            or "Content-Encoding" in response.headers):
+        return response
+    data = response.get_data()
+    encoding = pick_encoding(request, len(data))
+    if len(data) >= MIN_COMPRESSED_BYTES:
+        response.vary.add("Accept-Encoding")
+    if encoding:
+        response.set_data(compress(data, encoding))
+        response.headers["Content-Encoding"] = encoding
+    return response
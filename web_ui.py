@@ -1,12 +1,47 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
-from flask import Flask, render_template_string, request, jsonify
-import subprocess
+from flask import Flask, Response, g, render_template_string, request, jsonify
+import atexit
 import json
 import os
+import sys
+import threading
+import time
+from datetime import date, datetime, timezone
+
+from mcp_client_pool import MCPClientPool
+from metrics import REGISTRY, merge_expositions
+from opportunity_store import open_store
+from result_cache import ResponseCache
+from web_cache import CachedBody, VersionClock, compress_response, make_etag, not_modified, with_validators
 
 app = Flask(__name__)
 
+WEB_REQUESTS = REGISTRY.counter("web_requests_total", "Requests answered by the web UI", ("endpoint", "status"))
+WEB_SECONDS = REGISTRY.histogram(
+    "web_request_duration_seconds", "Time to answer a web UI request, including the MCP call", ("endpoint",)
+)
+
+# Long-lived sessions to the MCP server, shared by every request
+mcp_pool = None
+mcp_pool_lock = threading.Lock()
+
+# Only read here, to learn the catalog version that responses are cached and validated against
+store = None
+store_lock = threading.Lock()
+
+# Search answers keyed by the catalog version they came from; a catalog change makes them all stale
+web_responses = ResponseCache(max_size=2048)
+REGISTRY.watch_cache("web_ui", "responses", web_responses.stats)
+catalog_clock = VersionClock()
+
+# Catalog answers can change any time, so browsers keep them but check back (usually getting a 304)
+CATALOG_CACHE_CONTROL = "public, no-cache"
+
+# The tool list only changes when the servers are redeployed, which restarts us too
+tools_response = None  # (CachedBody, ETag)
+started_at = datetime.now(timezone.utc).replace(microsecond=0)
+
 # HTML template for the web interface
 HTML_TEMPLATE = """
 <!DOCTYPE html>
@@ -43,7 +78,7 @@ HTML_TEMPLATE = """
         </div>
         <div>
             <label><strong>Location:</strong></label>
-            <input type="text" id="location" value="Los Angeles" placeholder="Enter location (optional)">
+            <input type="text" id="location" value="Los Angeles" placeholder="Enter location (optional)" list="locationSuggestions" oninput="suggestLocations(this)">
         </div>
         <div>
             <label><strong>Max Results:</strong></label>
@@ -53,6 +88,14 @@ HTML_TEMPLATE = """
         <div id="opportunitiesResult"></div>
     </div>
 
+    <div class="card">
+        <h2>Your Session</h2>
+        <div>
+            <label><strong>Session Token:</strong> (from your Descope login)</label>
+            <input type="password" id="sessionToken" placeholder="Paste your session token">
+        </div>
+    </div>
+
     <div class="card">
         <h2>Set My Interests</h2>
         <div>
@@ -61,12 +104,14 @@ HTML_TEMPLATE = """
         </div>
         <div>
             <label><strong>Location:</strong></label>
-            <input type="text" id="setLocation" value="New York" placeholder="Enter your location">
+            <input type="text" id="setLocation" value="New York" placeholder="Enter your location" list="locationSuggestions" oninput="suggestLocations(this)">
         </div>
         <button onclick="setInterests()">Save Interests</button>
         <div id="setInterestsResult"></div>
     </div>
 
+    <datalist id="locationSuggestions"></datalist>
+
     <div class="card">
         <h2>Check My Interests</h2>
         <button onclick="checkInterests()">Check Saved Interests</button>
@@ -74,10 +119,37 @@ HTML_TEMPLATE = """
     </div>
 
     <script>
+        function authHeaders(headers) {
+            // The pooled MCP sessions are shared by every visitor, so each call carries its own token
+            headers = headers || {};
+            headers['Authorization'] = 'Bearer ' + document.getElementById('sessionToken').value.trim();
+            return headers;
+        }
+
         function showLoading(elementId) {
             document.getElementById(elementId).innerHTML = '<div class="loading">Loading...</div>';
         }
 
+        function suggestLocations(input) {
+            var typed = input.value;
+            fetch('/autocomplete?kind=location&q=' + encodeURIComponent(typed))
+                .then(response => response.json())
+                .then(data => {
+                    if (input.value !== typed) {
+                        return;  // they've kept typing; a newer answer is on its way
+                    }
+                    var list = document.getElementById('locationSuggestions');
+                    list.innerHTML = '';
+                    (data.suggestions || []).forEach(function(suggestion) {
+                        var option = document.createElement('option');
+                        option.value = suggestion.text;
+                        option.label = suggestion.count + ' opportunities';
+                        list.appendChild(option);
+                    });
+                })
+                .catch(error => {});
+        }
+
         function listTools() {
             showLoading('toolsResult');
             fetch('/list_tools')
@@ -95,17 +167,14 @@ HTML_TEMPLATE = """
             var interests = document.getElementById('interests').value.split(',').map(function(i) {
                 return i.trim();
             });
-            var params = {
-                interests: interests,
+            var params = new URLSearchParams({
+                interests: interests.join(','),
                 location: document.getElementById('location').value,
-                max_results: parseInt(document.getElementById('max_results').value)
-            };
+                max_results: document.getElementById('max_results').value
+            });
             
-            fetch('/find_opportunities', {
-                method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify(params)
-            })
+            // A GET, so the browser can keep the answer and revalidate it with a cheap 304
+            fetch('/find_opportunities?' + params)
             .then(response => response.json())
             .then(data => {
                 document.getElementById('opportunitiesResult').innerHTML = formatResponse(data);
@@ -127,7 +196,7 @@ HTML_TEMPLATE = """
             
             fetch('/set_interests', {
                 method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
+                headers: authHeaders({ 'Content-Type': 'application/json' }),
                 body: JSON.stringify(params)
             })
             .then(response => response.json())
@@ -141,7 +210,7 @@ HTML_TEMPLATE = """
 
         function checkInterests() {
             showLoading('checkInterestsResult');
-            fetch('/check_interests')
+            fetch('/check_interests', { headers: authHeaders() })
                 .then(response => response.json())
                 .then(data => {
                     document.getElementById('checkInterestsResult').innerHTML = formatResponse(data);
@@ -165,172 +234,247 @@ HTML_TEMPLATE = """
 </html>
 """
 
-def run_mcp_command(command_name, arguments=None):
-    """Run MCP command using subprocess (compatible with old Python)"""
-    try:
-        # Create a simple test script without emojis
-        test_script = '''# -*- coding: utf-8 -*-
-import json
+def get_mcp_pool():
+    """The shared pool of MCP server sessions, started on first use"""
+    global mcp_pool
+    with mcp_pool_lock:
+        if mcp_pool is None:
+            mcp_pool = MCPClientPool(
+                script=os.getenv("MCP_SERVER_SCRIPT", "main.py"),
+                size=int(os.getenv("MCP_POOL_SIZE", "2")),
+                # Only this process can reach its pooled servers, and /metrics reads theirs
+                env={"OPERATOR_TOOLS": "1"}
+            )
+            mcp_pool.start()
+            atexit.register(mcp_pool.close)
+        return mcp_pool
 
-# Sample volunteer opportunities
-opportunities = [
-    {
-        "title": "Beach Cleanup Day",
-        "organization": "Ocean Preservation Society", 
-        "description": "Help clean up local beaches and protect marine life",
-        "location": "Santa Monica Beach, CA",
-        "categories": ["environment"],
-        "registration_link": "https://example.com/beach-cleanup"
-    },
-    {
-        "title": "Animal Shelter Helper", 
-        "organization": "Paws and Claws Rescue",
-        "description": "Walk dogs and socialize cats at our shelter",
-        "location": "Los Angeles, CA", 
-        "categories": ["animals"],
-        "registration_link": "https://example.com/animal-shelter"
-    },
-    {
-        "title": "Food Bank Volunteer",
-        "organization": "Community Food Share", 
-        "description": "Help sort and package food donations",
-        "location": "Downtown LA",
-        "categories": ["community", "homelessness"],
-        "registration_link": "https://example.com/food-bank"
-    }
-]
-
-def test_command():
-    """Test the MCP command"""
-    command_name = ''' + json.dumps(command_name) + '''
-    arguments = ''' + json.dumps(arguments) + '''
-    
-    if command_name == "find_volunteer_opportunities":
-        interests = arguments.get('interests', [])
-        location = arguments.get('location', '')
-        max_results = arguments.get('max_results', 3)
-        
-        # Filter opportunities
-        filtered_opps = []
-        for opp in opportunities:
-            # Check if any category matches interests
-            match = False
-            for cat in opp['categories']:
-                if cat in interests:
-                    match = True
-                    break
-            
-            # Check location if specified
-            if match and location:
-                if location.lower() not in opp['location'].lower():
-                    match = False
-            
-            if match:
-                filtered_opps.append(opp)
-                if len(filtered_opps) >= max_results:
-                    break
-        
-        # Build result text (without emojis)
-        result_text = "Found " + str(len(filtered_opps)) + " volunteer opportunities:\\n\\n"
-        for i, opp in enumerate(filtered_opps, 1):
-            result_text += str(i) + ". **" + opp['title'] + "** - " + opp['organization'] + "\\n"
-            result_text += "   Location: " + opp['location'] + "\\n"
-            result_text += "   Description: " + opp['description'] + "\\n"
-            result_text += "   Categories: " + ", ".join(opp['categories']) + "\\n"
-            result_text += "   Register: " + opp['registration_link'] + "\\n\\n"
-        
-        return {"content": [{"type": "text", "text": result_text}]}
-    
-    elif command_name == "set_user_interests":
-        interests = arguments.get('interests', [])
-        location = arguments.get('location', '')
-        location_text = " in " + location if location else ""
-        result_text = "Success! Your interests have been saved: " + ", ".join(interests) + location_text + "."
-        return {"content": [{"type": "text", "text": result_text}]}
-    
-    elif command_name == "get_user_interests":
-        return {"content": [{"type": "text", "text": "Your interests: environment, animals. Location: Los Angeles"}]}
-    
-    elif command_name == "list_tools":
-        return {
-            "tools": [
-                {"name": "find_volunteer_opportunities", "description": "Find volunteer opportunities based on interests"},
-                {"name": "set_user_interests", "description": "Set your volunteer interests"},
-                {"name": "get_user_interests", "description": "Get your current interests"}
-            ]
-        }
+def get_store():
+    global store
+    with store_lock:
+        if store is None:
+            store = open_store()
+            atexit.register(store.close)
+        return store
 
-# Run the test
-try:
-    result = test_command()
-    print(json.dumps(result))
-except Exception as e:
-    print(json.dumps({"error": str(e)}))
-'''
-        
-        # Write and run the script
-        with open('temp_test.py', 'w') as f:
-            f.write(test_script)
-        
-        result = subprocess.run(
-            ['python', 'temp_test.py'], 
-            capture_output=True, 
-            text=True, 
-            timeout=10
-        )
-        
-        # Clean up
-        if os.path.exists('temp_test.py'):
-            os.remove('temp_test.py')
-        
-        if result.returncode == 0 and result.stdout.strip():
-            return json.loads(result.stdout)
-        else:
-            error_msg = result.stderr if result.stderr else "No output from server"
-            return {"error": "Command failed: " + error_msg}
-            
-    except subprocess.TimeoutExpired:
+def run_mcp_command(command_name, arguments=None):
+    """Run an MCP command on one of the pooled server sessions"""
+    try:
+        if command_name == "list_tools":
+            return get_mcp_pool().list_tools()
+        return get_mcp_pool().call_tool(command_name, arguments or {})
+    except TimeoutError:
         return {"error": "Command timed out"}
-    except json.JSONDecodeError:
-        return {"error": "Invalid response from server"}
     except Exception as e:
         return {"error": "Unexpected error: " + str(e)}
 
+@app.before_request
+def start_timer():
+    g.started = time.perf_counter()
+
+@app.after_request
+def compress(response):
+    return compress_response(request, response)
+
+@app.after_request
+def record_request(response):
+    started = getattr(g, "started", None)
+    if started is not None:
+        endpoint = request.endpoint or "not_found"  # only our own routes, so the label stays small
+        WEB_SECONDS.observe(time.perf_counter() - started, endpoint)
+        WEB_REQUESTS.inc(endpoint, str(response.status_code))
+    return response
+
+def answered_version(result):
+    """The catalog version a pooled server answered a tool call from (_meta.catalog_version), or None for a failure"""
+    if "error" in result or result.get("isError"):
+        return None
+    return (result.get("meta") or {}).get("catalog_version")
+
+def tool_answer(result):
+    """(body, answered version) for a tool's result; see catalog_response"""
+    return {key: value for key, value in result.items() if key != "meta"}, answered_version(result)
+
+def catalog_response(key, answer, daily=False):
+    """Answer a read-only catalog query, from the response cache when we can, with an ETag and Last-Modified.
+
+    key is everything the answer depends on besides the catalog, and answer()
+    returns (body, version): the catalog version the pooled server answered
+    from, or None if the body mustn't be cached. daily answers also change
+    with the date (recency scores do).
+
+    A pooled server can lag behind the store (it rechecks every second, and a
+    shared catalog publishes edits a few seconds late), so a fresh body is
+    filed and validated under the version the server reports, never the
+    store's. The store's version only picks what's current: a cached body or
+    a 304 for it exists only once some server has answered from it.
+    """
+    version = get_store().version()
+    if daily:
+        key = key + (date.today().toordinal(),)
+
+    def validators(version):
+        last_modified = catalog_clock.since(version)
+        if daily:
+            last_modified = max(last_modified, datetime.combine(date.today(), datetime.min.time()).astimezone(timezone.utc))
+        return make_etag(version, key), last_modified
+
+    etag, last_modified = validators(version)
+    unchanged = not_modified(request, etag, last_modified, CATALOG_CACHE_CONTROL)
+    if unchanged is not None:
+        return unchanged
+    body = web_responses.lookup(version, key)
+    if body is None:
+        data, version = answer()
+        body = CachedBody(json.dumps(data).encode("utf-8"))
+        if version is None:
+            return body.respond(request, None, None, "no-store")
+        web_responses.store(version, key, body)
+        etag, last_modified = validators(version)
+    return body.respond(request, etag, last_modified, CATALOG_CACHE_CONTROL)
+
+def search_arguments(args):
+    """find_opportunities arguments from a query string: ?interests=animals,environment&location=LA&max_results=3"""
+    arguments = {}
+    interests = [interest.strip() for value in args.getlist("interests") for interest in value.split(",") if interest.strip()]
+    if interests:
+        arguments["interests"] = interests
+    for name in ("location", "cursor"):
+        if args.get(name):
+            arguments[name] = args[name]
+    if args.getlist("availability"):
+        arguments["availability"] = args.getlist("availability")
+    for name, convert in (("max_results", int), ("latitude", float), ("longitude", float), ("radius_km", float)):
+        if args.get(name):
+            arguments[name] = convert(args[name])
+    if args.get("upcoming_only"):
+        arguments["upcoming_only"] = args["upcoming_only"].lower() in ("1", "true", "yes", "on")
+    return arguments
+
+def pool_metrics(pool):
+    return (
+        "# HELP mcp_pool_sessions_up MCP server sessions that are connected and healthy\n"
+        "# TYPE mcp_pool_sessions_up gauge\n"
+        f"mcp_pool_sessions_up {pool.healthy_sessions()}\n"
+        "# HELP mcp_pool_restarts_total MCP server sessions that died and were started again\n"
+        "# TYPE mcp_pool_restarts_total counter\n"
+        f"mcp_pool_restarts_total {pool.restarts}\n"
+    )
+
 @app.route('/')
 def index():
     return render_template_string(HTML_TEMPLATE)
 
 @app.route('/list_tools')
 def list_tools():
-    result = run_mcp_command("list_tools")
-    return jsonify(result)
+    global tools_response
+    if tools_response is None:
+        result = run_mcp_command("list_tools")
+        if "error" in result:
+            return jsonify(result)
+        body = CachedBody(json.dumps(result).encode("utf-8"))
+        tools_response = (body, make_etag(body.data.decode("utf-8")))
+    body, etag = tools_response
+    cache_control = "public, max-age=300"
+    unchanged = not_modified(request, etag, started_at, cache_control)
+    if unchanged is not None:
+        return unchanged
+    return body.respond(request, etag, started_at, cache_control)
 
-@app.route('/find_opportunities', methods=['POST'])
+@app.route('/find_opportunities', methods=['GET', 'POST'])
 def find_opportunities():
-    data = request.get_json()
-    if not data:
+    if request.method == 'POST':
+        data = request.get_json()
+    else:
+        try:
+            data = search_arguments(request.args)
+        except ValueError as e:
+            return jsonify({"error": "Bad search: " + str(e)}), 400
+    if not data or not isinstance(data, dict):
         return jsonify({"error": "No data provided"}), 400
     
-    result = run_mcp_command("find_volunteer_opportunities", data)
-    return jsonify(result)
+    if data.get("upcoming_only"):
+        # These follow the clock, not just the catalog
+        return jsonify(run_mcp_command("find_volunteer_opportunities", data))
+    # Interests in any order find the same opportunities
+    canonical = dict(data, interests=sorted(data["interests"], key=str)) if isinstance(data.get("interests"), list) else data
+    key = ("find_opportunities", json.dumps(canonical, sort_keys=True))
+    return catalog_response(key, lambda: tool_answer(run_mcp_command("find_volunteer_opportunities", data)), daily=True)
+
+@app.route('/autocomplete')
+def autocomplete():
+    """Typeahead for the location boxes: ?q=santa m, optionally &kind=location or &kind=organization and &limit=8"""
+    arguments = {"prefix": request.args.get("q", "")}
+    if request.args.getlist("kind"):
+        arguments["kinds"] = request.args.getlist("kind")
+    if request.args.get("limit", type=int):
+        arguments["max_results"] = request.args.get("limit", type=int)
+    
+    def answer():
+        result = run_mcp_command("autocomplete", arguments)
+        if "error" in result:
+            return result, None
+        text = "".join(content.get("text", "") for content in result.get("content", []))
+        try:
+            return {"suggestions": json.loads(text)}, answered_version(result)
+        except ValueError:
+            # The tool answers in plain text when something went wrong
+            return {"error": text}, None
+    
+    return catalog_response(("autocomplete", json.dumps(arguments, sort_keys=True)), answer)
+
+def caller_token(data=None):
+    """The visitor's own session token: an Authorization: Bearer header, or session_token in the JSON body"""
+    scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+    if scheme.lower() == "bearer" and token.strip():
+        return token.strip()
+    return (data or {}).get("session_token") or None
+
+AUTHENTICATION_REQUIRED = {"error": "Authentication required. Please provide a session token."}
 
 @app.route('/set_interests', methods=['POST'])
 def set_interests():
     data = request.get_json()
     if not data:
         return jsonify({"error": "No data provided"}), 400
+    # Never leave it to the pooled session, which may remember some other visitor's token
+    session_token = caller_token(data)
+    if not session_token:
+        return jsonify(AUTHENTICATION_REQUIRED), 401
     
-    result = run_mcp_command("set_user_interests", data)
+    result = run_mcp_command("set_user_interests", dict(data, session_token=session_token))
     return jsonify(result)
 
 @app.route('/check_interests')
 def check_interests():
-    result = run_mcp_command("get_user_interests", {})
-    return jsonify(result)
+    session_token = caller_token()
+    if not session_token:
+        return jsonify(AUTHENTICATION_REQUIRED), 401
+    response = jsonify(run_mcp_command("get_user_interests", {"session_token": session_token}))
+    # Saved interests aren't part of the catalog, so this is worked out every time;
+    # an unchanged answer still goes back as a bodiless 304
+    with_validators(response, make_etag(response.get_data(as_text=True)), None, "private, no-cache")
+    response.vary.add("Authorization")
+    return response.make_conditional(request)
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus metrics for the web UI plus every pooled MCP server session (labelled by session)"""
+    pool = get_mcp_pool()
+    parts = [({}, REGISTRY.render()), ({}, pool_metrics(pool))]
+    try:
+        for index, result in sorted(pool.call_tool_on_each("get_metrics").items()):
+            if not result.get("isError"):
+                text = "".join(content.get("text", "") for content in result.get("content", []))
+                parts.append(({"session": str(index)}, text))
+    except Exception as e:
+        # The web UI's own numbers are still worth serving
+        print("Couldn't collect metrics from the MCP sessions: " + str(e), file=sys.stderr)
+    return Response(merge_expositions(parts), content_type="text/plain; version=0.0.4; charset=utf-8")
 
 if __name__ == '__main__':
     print("Starting Volunteer Matchmaker Web UI")
     print("Access at: http://localhost:8002")
-    print("This is a demo interface with simulated MCP responses")
+    print("Requests are sent to the MCP server in " + os.getenv("MCP_SERVER_SCRIPT", "main.py"))
     print("Press Ctrl+C to stop the server")
     app.run(debug=True, host='127.0.0.1', port=8002)
\ No newline at end of file